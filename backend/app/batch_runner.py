@@ -0,0 +1,396 @@
+"""
+Deferred batch execution for non-urgent tasks (priority "batch").
+
+Bulk generation (hundreds of product descriptions, ...) does not need
+interactive latency and should not spend the rate limit chat traffic needs.
+Batch tasks are PENDING rows the worker pool never claims. The runner thread
+groups them into one OpenAI Batch-style JSONL request file, uploads it to
+`batch_base_url` (default: the chat `base_url`) and polls the provider batch.
+A batch is submitted once `batch_min_size` tasks wait or the oldest waited
+`batch_max_wait_seconds` (`POST /batches/flush` submits right away), with at
+most `batch_max_requests` tasks per batch.
+
+Finished outputs go through the normal artifact path (`publish_task_output`
+in main.py): file in Company Doc, COMPLETED status, log, project feedback.
+A batch answer is a single LLM turn, so a task whose answer asks for a skill
+([[CALL_SKILL]]), and every task whose request failed or expired, is moved
+back to the worker queue at bulk priority instead of being lost.
+
+Reserving tasks for a batch and collecting a finished batch are conditional
+UPDATEs, so several processes may run the loop against one database without
+submitting a task twice or publishing a result twice.
+
+`scripts/fake_batch_server.py` is a local stand-in for the provider.
+"""
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import requests
+from sqlalchemy.orm import Session
+from . import models, settings_cache, task_events, task_queue
+from . import tags as tag_tokenizer
+from .database import SessionLocal
+
+DEFAULT_MIN_SIZE = 20
+DEFAULT_MAX_REQUESTS = 500
+DEFAULT_MAX_WAIT_SECONDS = 600
+DEFAULT_POLL_SECONDS = 30
+HTTP_TIMEOUT = 60
+COMPLETION_WINDOW = "24h"
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Provider batch states after which no more output will appear
+PROVIDER_FINAL = {"completed", "failed", "expired", "cancelled"}
+
+# build_request(db, task) -> chat completion body; publish(db, task, content)
+RequestBuilder = Callable[[Session, models.Task], dict]
+Publisher = Callable[[Session, models.Task, str], None]
+
+
+def _int_setting(db: Session, key: str, default: int) -> int:
+    raw = settings_cache.get(db, key)
+    try:
+        return int(raw) if raw not in (None, "") else default
+    except ValueError:
+        return default
+
+
+def _provider(db: Session):
+    """(base_url, headers) of the batch API."""
+    config = settings_cache.get_llm_config(db)
+    base_url = (settings_cache.get(db, "batch_base_url") or config["base_url"]).rstrip("/")
+    if base_url.endswith("/chat/completions"):
+        base_url = base_url[:-len("/chat/completions")]
+    return base_url, {"Authorization": f"Bearer {config['api_key']}"}
+
+
+def get_batches(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(models.TaskBatch).order_by(models.TaskBatch.created_at.desc()).offset(skip).limit(limit).all()
+
+
+def get_batch(db: Session, batch_id: str):
+    return db.query(models.TaskBatch).filter(models.TaskBatch.id == batch_id).first()
+
+
+def _waiting_tasks(db: Session, limit: int):
+    return db.query(models.Task).\
+        filter(models.Task.status == models.TaskStatus.PENDING.value).\
+        filter(models.Task.priority == models.TaskPriority.BATCH.value).\
+        filter(models.Task.batch_id == None).\
+        order_by(models.Task.created_at).\
+        limit(limit).\
+        all()
+
+
+def _requeue(db: Session, task_ids: list) -> int:
+    """Hand tasks back to the worker pool (bulk priority, multi-turn path)."""
+    if not task_ids:
+        return 0
+    moved = db.query(models.Task).\
+        filter(models.Task.id.in_(task_ids)).\
+        filter(models.Task.status == models.TaskStatus.PENDING.value).\
+        update({
+            models.Task.priority: models.TaskPriority.BULK.value,
+            models.Task.batch_id: None
+        }, synchronize_session=False)
+    db.commit()
+    task_queue.notify()
+    return moved
+
+
+# --- Submission ---
+def reserve(db: Session, force: bool = False) -> Optional[models.TaskBatch]:
+    """
+    Claim waiting batch tasks for a new PREPARING batch, or return None when
+    there are not enough of them yet (unless `force`).
+    """
+    max_requests = _int_setting(db, "batch_max_requests", DEFAULT_MAX_REQUESTS)
+    waiting = _waiting_tasks(db, max_requests)
+    if not waiting:
+        return None
+    if not force:
+        min_size = _int_setting(db, "batch_min_size", DEFAULT_MIN_SIZE)
+        max_wait = _int_setting(db, "batch_max_wait_seconds", DEFAULT_MAX_WAIT_SECONDS)
+        oldest_wait = (datetime.utcnow() - waiting[0].created_at).total_seconds()
+        if len(waiting) < min_size and oldest_wait < max_wait:
+            return None
+
+    batch = models.TaskBatch(id=str(uuid.uuid4()), status=models.BatchStatus.PREPARING.value)
+    db.add(batch)
+    db.flush()
+    # Only rows nobody else reserved in the meantime
+    reserved = db.query(models.Task).\
+        filter(models.Task.id.in_([t.id for t in waiting])).\
+        filter(models.Task.status == models.TaskStatus.PENDING.value).\
+        filter(models.Task.batch_id == None).\
+        update({models.Task.batch_id: batch.id}, synchronize_session=False)
+    if not reserved:
+        db.rollback()
+        return None
+    batch.request_count = reserved
+    db.commit()
+    return batch
+
+
+def _batch_tasks(db: Session, batch_id: str):
+    return db.query(models.Task).filter(models.Task.batch_id == batch_id).all()
+
+
+def submit(db: Session, batch: models.TaskBatch, build_request: RequestBuilder) -> models.TaskBatch:
+    """Upload the JSONL request file and create the provider batch."""
+    tasks = _batch_tasks(db, batch.id)
+    try:
+        lines = []
+        for task in tasks:
+            lines.append(json.dumps({
+                "custom_id": task.id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": build_request(db, task)
+            }, ensure_ascii=False))
+        base_url, headers = _provider(db)
+
+        upload = requests.post(
+            f"{base_url}/files", headers=headers, timeout=HTTP_TIMEOUT,
+            data={"purpose": "batch"},
+            files={"file": (f"batch_{batch.id}.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")}
+        )
+        if upload.status_code != 200:
+            raise Exception(f"File upload failed {upload.status_code}: {upload.text}")
+        batch.input_file_id = upload.json()["id"]
+
+        created = requests.post(
+            f"{base_url}/batches", headers=headers, timeout=HTTP_TIMEOUT,
+            json={
+                "input_file_id": batch.input_file_id,
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": COMPLETION_WINDOW,
+                "metadata": {"company_batch_id": batch.id}
+            }
+        )
+        if created.status_code != 200:
+            raise Exception(f"Batch creation failed {created.status_code}: {created.text}")
+        info = created.json()
+    except Exception as e:
+        # Release the tasks: the next cycle tries again with a new batch
+        print(f"Batch Runner: submitting {batch.id} failed: {e}")
+        db.query(models.Task).\
+            filter(models.Task.batch_id == batch.id).\
+            update({models.Task.batch_id: None}, synchronize_session=False)
+        batch.status = models.BatchStatus.FAILED.value
+        batch.error = str(e)
+        batch.finished_at = datetime.utcnow()
+        db.commit()
+        return batch
+
+    batch.provider_batch_id = info["id"]
+    batch.provider_status = info.get("status")
+    batch.status = models.BatchStatus.SUBMITTED.value
+    batch.submitted_at = datetime.utcnow()
+    db.commit()
+    for task in tasks:
+        task_events.emit(task.id, "batch_submitted", batch_id=batch.id, requests=len(tasks))
+    print(f"Batch Runner: submitted {len(tasks)} task(s) as {batch.provider_batch_id}")
+    return batch
+
+
+# --- Collection ---
+def _download(base_url: str, headers: dict, file_id: Optional[str]) -> list:
+    if not file_id:
+        return []
+    response = requests.get(f"{base_url}/files/{file_id}/content", headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Download of {file_id} failed {response.status_code}: {response.text}")
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def _content_of(result: dict) -> Optional[str]:
+    """Answer text of one output line, None for an errored request."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def poll(db: Session, batch: models.TaskBatch, publish: Publisher) -> models.TaskBatch:
+    """Check a SUBMITTED batch; once the provider is done, publish its results."""
+    base_url, headers = _provider(db)
+    response = requests.get(f"{base_url}/batches/{batch.provider_batch_id}", headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        print(f"Batch Runner: polling {batch.provider_batch_id} failed {response.status_code}")
+        return batch
+    info = response.json()
+    if info.get("status") not in PROVIDER_FINAL:
+        if info.get("status") != batch.provider_status:
+            batch.provider_status = info.get("status")
+            db.commit()
+        return batch
+
+    # Exactly one process collects a finished batch
+    claimed = db.query(models.TaskBatch).\
+        filter(models.TaskBatch.id == batch.id).\
+        filter(models.TaskBatch.status == models.BatchStatus.SUBMITTED.value).\
+        update({
+            models.TaskBatch.status: models.BatchStatus.COLLECTING.value,
+            models.TaskBatch.provider_status: info.get("status"),
+            models.TaskBatch.output_file_id: info.get("output_file_id")
+        }, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        return batch
+    db.refresh(batch)
+
+    try:
+        results = _download(base_url, headers, info.get("output_file_id")) + _download(base_url, headers, info.get("error_file_id"))
+    except Exception as e:
+        print(f"Batch Runner: {e}")
+        results = []
+        batch.error = str(e)
+    return _collect(db, batch, results, publish)
+
+
+def _collect(db: Session, batch: models.TaskBatch, results: list, publish: Publisher) -> models.TaskBatch:
+    by_task = {r.get("custom_id"): r for r in results}
+    completed, requeue = 0, []
+    for task in _batch_tasks(db, batch.id):
+        if task.status != models.TaskStatus.PENDING.value:
+            continue # Cancelled while the batch ran
+        content = _content_of(by_task.get(task.id, {}))
+        if not content or tag_tokenizer.first(content, "CALL_SKILL"):
+            requeue.append(task.id) # Failed/missing, or needs the multi-turn agent loop
+            continue
+        try:
+            publish(db, task, content)
+            completed += 1
+        except Exception as e:
+            db.rollback()
+            print(f"Batch Runner: publishing {task.id} failed: {e}")
+            requeue.append(task.id)
+
+    batch.requeued_count = _requeue(db, requeue)
+    batch.completed_count = completed
+    batch.status = models.BatchStatus.COMPLETED.value if batch.provider_status == "completed" else models.BatchStatus.FAILED.value
+    batch.finished_at = datetime.utcnow()
+    db.commit()
+    print(f"Batch Runner: {batch.provider_batch_id} done, {completed} published, {batch.requeued_count} requeued")
+    return batch
+
+
+def recover_stale(db: Session, max_age_seconds: int = 3600) -> int:
+    """Release tasks of batches stuck in PREPARING/COLLECTING (process died mid-way)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    stale = db.query(models.TaskBatch).\
+        filter(models.TaskBatch.status.in_([models.BatchStatus.PREPARING.value, models.BatchStatus.COLLECTING.value])).\
+        filter(models.TaskBatch.created_at < cutoff).\
+        all()
+    for batch in stale:
+        _requeue(db, [t.id for t in _batch_tasks(db, batch.id)])
+        batch.error = f"Abandoned while {batch.status}"
+        batch.status = models.BatchStatus.FAILED.value
+        batch.finished_at = datetime.utcnow()
+    db.commit()
+    return len(stale)
+
+
+# --- Runner ---
+class BatchRunner:
+    """Background thread: submit ready batches, poll submitted ones."""
+
+    def __init__(self, build_request: RequestBuilder, publish: Publisher):
+        self.build_request = build_request
+        self.publish = publish
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock() # One cycle at a time (loop vs. flush endpoint)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="batch-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def run_once(self, force: bool = False) -> list:
+        """One cycle. Returns the batches submitted in it."""
+        submitted = []
+        with self._lock:
+            db = SessionLocal()
+            try:
+                while True:
+                    batch = reserve(db, force=force)
+                    if batch is None:
+                        break
+                    submitted.append(submit(db, batch, self.build_request))
+                    if batch.status == models.BatchStatus.FAILED.value:
+                        break
+                running = db.query(models.TaskBatch).\
+                    filter(models.TaskBatch.status == models.BatchStatus.SUBMITTED.value).\
+                    all()
+                for batch in running:
+                    poll(db, batch, self.publish)
+            finally:
+                db.close()
+        return submitted
+
+    def _loop(self):
+        db = SessionLocal()
+        try:
+            recover_stale(db)
+        except Exception as e:
+            print(f"Batch Runner: recovery failed: {e}")
+        finally:
+            db.close()
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Batch Runner: cycle failed: {e}")
+            db = SessionLocal()
+            try:
+                interval = _int_setting(db, "batch_poll_seconds", DEFAULT_POLL_SECONDS)
+            finally:
+                db.close()
+            self._wakeup.wait(max(1, interval))
+            self._wakeup.clear()
+
+
+_runner: Optional[BatchRunner] = None
+
+
+def start_runner(build_request: RequestBuilder, publish: Publisher) -> BatchRunner:
+    global _runner
+    if _runner is None:
+        _runner = BatchRunner(build_request, publish)
+        _runner.start()
+    return _runner
+
+
+def stop_runner():
+    global _runner
+    if _runner is not None:
+        _runner.stop()
+        _runner = None
+
+
+def notify():
+    """New batch tasks were enqueued. Harmless when no runner runs here."""
+    if _runner is not None:
+        _runner.notify()
+
+
+def flush() -> list:
+    """Submit every waiting batch task now, regardless of `batch_min_size`."""
+    if _runner is None:
+        return []
+    return _runner.run_once(force=True)
@@ -1,7 +1,13 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from . import models, schemas, settings_cache, skill_bindings, doc_index
+import hashlib
+import re
+import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # --- Agent CRUD ---
 def get_agent(db: Session, agent_id: str):
@@ -28,68 +34,117 @@ def create_handbook(db: Session, handbook: schemas.HandbookCreate):
     db.refresh(db_handbook)
     return db_handbook
 
+def _upsert_insert(db: Session):
+    """Dialect-specific INSERT construct that supports ON CONFLICT."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
 def sync_skills(db: Session, registry_skills: dict):
     """
     Syncs in-memory registered skills to the database.
+    Single upsert keyed on the unique skill name (one round trip at startup).
     """
-    for name, data in registry_skills.items():
-        db_skill = db.query(models.Skill).filter(models.Skill.name == name).first()
-        if not db_skill:
-            # Create new skill
-            new_skill = models.Skill(
-                id=str(uuid.uuid4()),
-                name=name,
-                display_name=data.get("display_name", name),
-                description=data.get("description", "")
-            )
-            db.add(new_skill)
-        else:
-            # Update existing? (Optional, but good for description updates)
-            db_skill.description = data.get("description", "")
-            db_skill.display_name = data.get("display_name", name)
-            
-    db.commit()
-
-def create_agent(db: Session, agent: schemas.AgentCreate):
-    db_agent = models.Agent(
-        id=str(uuid.uuid4()),
-        name=agent.name,
-        role=agent.role,
-        job_title=agent.job_title,
-        department=agent.department,
-        level=agent.level,
-        description=agent.description,
-        system_prompt=agent.system_prompt,
-        model_name=agent.model_name,
-        temperature=agent.temperature,
-        avatar=agent.avatar,
-        provider=agent.provider
+    if not registry_skills:
+        return
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "display_name": data.get("display_name", name),
+            "description": data.get("description", "")
+        }
+        for name, data in registry_skills.items()
+    ]
+    dialect_insert = _upsert_insert(db)
+    stmt = dialect_insert(models.Skill).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Skill.name],
+        set_={
+            "display_name": stmt.excluded.display_name,
+            "description": stmt.excluded.description
+        }
     )
-    db.add(db_agent)
+    db.execute(stmt)
+    staged = skill_bindings.stage_version_bump(db)
     db.commit()
-    db.refresh(db_agent)
-    
-    # Handle Skills
-    if agent.skills:
-        for skill_id in agent.skills:
-            # Check validity
-            skill = db.query(models.Skill).filter(models.Skill.id == skill_id).first()
-            if skill:
-                 agent_skill = models.AgentSkill(agent_id=db_agent.id, skill_id=skill.id)
-                 db.add(agent_skill)
-    
-    # Handle Handbooks
-    if agent.handbooks:
-        for hb_id in agent.handbooks:
-            handbook = db.query(models.Handbook).filter(models.Handbook.id == hb_id).first()
-            if handbook:
-                agent_hb = models.AgentHandbook(agent_id=db_agent.id, handbook_id=handbook.id)
-                db.add(agent_hb)
-                 
+    skill_bindings.invalidate(staged=staged)
+
+def _existing_ids(db: Session, model, ids) -> set:
+    """One IN query: which of `ids` exist in `model`'s table."""
+    ids = set(ids or [])
+    if not ids:
+        return set()
+    return {row[0] for row in db.query(model.id).filter(model.id.in_(ids)).all()}
+
+def _agent_link_rows(agent_id: str, skill_ids, handbook_ids, valid_skills: set, valid_handbooks: set):
+    """Association rows for one agent. Unknown and duplicate ids are dropped."""
+    skill_rows = [
+        {"agent_id": agent_id, "skill_id": sid}
+        for sid in dict.fromkeys(skill_ids or []) if sid in valid_skills
+    ]
+    handbook_rows = [
+        {"agent_id": agent_id, "handbook_id": hid}
+        for hid in dict.fromkeys(handbook_ids or []) if hid in valid_handbooks
+    ]
+    return skill_rows, handbook_rows
+
+def get_agents_by_ids(db: Session, agent_ids: list):
+    """Load agents with skills/handbooks eagerly, preserving the given order."""
+    if not agent_ids:
+        return []
+    agents = db.query(models.Agent).\
+        options(selectinload(models.Agent.skills), selectinload(models.Agent.handbooks)).\
+        filter(models.Agent.id.in_(agent_ids)).\
+        all()
+    by_id = {a.id: a for a in agents}
+    return [by_id[aid] for aid in agent_ids if aid in by_id]
+
+def create_agents(db: Session, agents: list):
+    """
+    Bulk create agents with their skill/handbook assignments.
+    One validation query per association type, bulk inserts, single commit.
+    """
+    valid_skills = _existing_ids(db, models.Skill, [sid for a in agents for sid in (a.skills or [])])
+    valid_handbooks = _existing_ids(db, models.Handbook, [hid for a in agents for hid in (a.handbooks or [])])
+
+    agent_rows = []
+    skill_rows = []
+    handbook_rows = []
+    for agent in agents:
+        agent_id = str(uuid.uuid4())
+        agent_rows.append({
+            "id": agent_id,
+            "name": agent.name,
+            "role": agent.role,
+            "job_title": agent.job_title,
+            "department": agent.department,
+            "level": agent.level,
+            "description": agent.description,
+            "system_prompt": agent.system_prompt,
+            "model_name": agent.model_name,
+            "temperature": agent.temperature,
+            "avatar": agent.avatar,
+            "provider": agent.provider
+        })
+        a_skills, a_handbooks = _agent_link_rows(agent_id, agent.skills, agent.handbooks, valid_skills, valid_handbooks)
+        skill_rows.extend(a_skills)
+        handbook_rows.extend(a_handbooks)
+
+    if agent_rows:
+        db.execute(insert(models.Agent), agent_rows)
+    if skill_rows:
+        db.execute(insert(models.AgentSkill), skill_rows)
+    if handbook_rows:
+        db.execute(insert(models.AgentHandbook), handbook_rows)
     db.commit()
-    db.refresh(db_agent)
-        
-    return db_agent
+
+    return get_agents_by_ids(db, [row["id"] for row in agent_rows])
+
+def create_agent(db: Session, agent: schemas.AgentCreate):
+    return create_agents(db, [agent])[0]
 
 def update_agent(db: Session, agent_id: str, agent_update: schemas.AgentUpdate):
     db_agent = db.query(models.Agent).filter(models.Agent.id == agent_id).first()
@@ -99,65 +154,180 @@ def update_agent(db: Session, agent_id: str, agent_update: schemas.AgentUpdate):
     # Filter out None values
     update_data = agent_update.model_dump(exclude_unset=True)
     
-    # Handle Skills separately if present
-    if "skills" in update_data:
-        skill_ids = update_data.pop("skills") # Remove from setattr loop
-        
-        # 1. Clear existing skills
+    # Handle Skills / Handbooks separately if present (replace existing)
+    replace_skills = "skills" in update_data
+    skill_ids = update_data.pop("skills", None)
+    replace_handbooks = "handbooks" in update_data
+    hb_ids = update_data.pop("handbooks", None)
+
+    valid_skills = _existing_ids(db, models.Skill, skill_ids)
+    valid_handbooks = _existing_ids(db, models.Handbook, hb_ids)
+    skill_rows, handbook_rows = _agent_link_rows(agent_id, skill_ids, hb_ids, valid_skills, valid_handbooks)
+
+    # Skills, name and provider feed the agent's skill binding (skill_bindings.py)
+    binding_changed = any(
+        key in update_data and update_data[key] != getattr(db_agent, key)
+        for key in ("name", "provider")
+    )
+    if replace_skills:
+        current = db.query(models.AgentSkill.skill_id, models.AgentSkill.enabled, models.AgentSkill.config).\
+            filter(models.AgentSkill.agent_id == agent_id).\
+            order_by(models.AgentSkill.skill_id).\
+            all()
+        wanted = sorted((row["skill_id"], 1, None) for row in skill_rows)
+        binding_changed = binding_changed or [tuple(row) for row in current] != wanted
         db.query(models.AgentSkill).filter(models.AgentSkill.agent_id == agent_id).delete()
-        
-        # 2. Add new skills
-        if skill_ids:
-            for sid in skill_ids:
-                skill = db.query(models.Skill).filter(models.Skill.id == sid).first()
-                if skill:
-                    new_as = models.AgentSkill(agent_id=agent_id, skill_id=sid)
-                    db.add(new_as)
-
-    # Handle Handbooks separately if present
-    if "handbooks" in update_data:
-        hb_ids = update_data.pop("handbooks")
-        
-        # 1. Clear existing
+        if skill_rows:
+            db.execute(insert(models.AgentSkill), skill_rows)
+
+    if replace_handbooks:
         db.query(models.AgentHandbook).filter(models.AgentHandbook.agent_id == agent_id).delete()
-        
-        # 2. Add new
-        if hb_ids:
-            for hid in hb_ids:
-                hb = db.query(models.Handbook).filter(models.Handbook.id == hid).first()
-                if hb:
-                    new_ah = models.AgentHandbook(agent_id=agent_id, handbook_id=hid)
-                    db.add(new_ah)
+        if handbook_rows:
+            db.execute(insert(models.AgentHandbook), handbook_rows)
         
     for key, value in update_data.items():
         setattr(db_agent, key, value)
     
+    staged = skill_bindings.stage_version_bump(db, [agent_id]) if binding_changed else None
     db.commit()
+    if binding_changed:
+        skill_bindings.invalidate([agent_id], staged)
     db.refresh(db_agent)
     return db_agent
 
+def set_agents_skills(db: Session, agent_ids: list, skill_ids: list):
+    """
+    Replace the skill set of many agents at once.
+    Returns (updated_agents, missing_agent_ids).
+    """
+    valid_agents = _existing_ids(db, models.Agent, agent_ids)
+    missing = [aid for aid in dict.fromkeys(agent_ids) if aid not in valid_agents]
+    valid_skills = _existing_ids(db, models.Skill, skill_ids)
+
+    rows = []
+    for aid in dict.fromkeys(agent_ids):
+        if aid in valid_agents:
+            rows.extend(_agent_link_rows(aid, skill_ids, None, valid_skills, set())[0])
+
+    if valid_agents:
+        db.query(models.AgentSkill).\
+            filter(models.AgentSkill.agent_id.in_(valid_agents)).\
+            delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(models.AgentSkill), rows)
+    staged = skill_bindings.stage_version_bump(db, list(valid_agents))
+    db.commit()
+    skill_bindings.invalidate(list(valid_agents), staged)
+
+    return get_agents_by_ids(db, [aid for aid in dict.fromkeys(agent_ids) if aid in valid_agents]), missing
+
 def delete_agent(db: Session, agent_id: str):
     db_agent = db.query(models.Agent).filter(models.Agent.id == agent_id).first()
     if db_agent:
         db.delete(db_agent)
+        staged = skill_bindings.stage_version_bump(db, [agent_id], removed=True)
         db.commit()
+        skill_bindings.invalidate([agent_id], staged)
     return db_agent
 
 # --- Task CRUD ---
-def create_task(db: Session, task: schemas.TaskCreate):
+# Identical submissions within this window attach to / reuse the earlier task
+DEFAULT_DEDUP_WINDOW_SECONDS = 300
+WORKFLOW_TAG = re.compile(r"^\s*\[WORKFLOW:\s*(.*?)\]", re.IGNORECASE)
+_dedup_lock = threading.Lock()
+
+def task_fingerprint(agent_id: str, input_prompt: str, project_file: str = None) -> str:
+    """Hash of (agent, workflow, normalized prompt, project)."""
+    prompt = input_prompt or ""
+    match = WORKFLOW_TAG.match(prompt)
+    workflow = match.group(1).strip().lower() if match else "general_task"
+    if match:
+        prompt = prompt[match.end():]
+    normalized = " ".join(prompt.split()).casefold()
+    key = "\x1f".join([agent_id or "", workflow, normalized, project_file or ""])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def dedup_window_seconds(db: Session) -> int:
+    raw = settings_cache.get(db, "task_dedup_window_seconds")
+    try:
+        return int(raw) if raw not in (None, "") else DEFAULT_DEDUP_WINDOW_SECONDS
+    except ValueError:
+        return DEFAULT_DEDUP_WINDOW_SECONDS
+
+def find_duplicate_task(db: Session, fingerprint: str, window_seconds: int):
+    """
+    The task an identical submission should reuse: a pending/running one
+    (attach), else the newest completed one (return its artifact). Failed,
+    cancelled and timed-out tasks are never reused.
+    """
+    since = datetime.utcnow() - timedelta(seconds=window_seconds)
+    candidates = db.query(models.Task).\
+        filter(models.Task.fingerprint == fingerprint).\
+        filter(models.Task.created_at >= since).\
+        filter(models.Task.status.in_([
+            models.TaskStatus.PENDING.value,
+            models.TaskStatus.RUNNING.value,
+            models.TaskStatus.COMPLETED.value
+        ])).\
+        order_by(models.Task.created_at.desc()).\
+        all()
+    active = [t for t in candidates if t.status != models.TaskStatus.COMPLETED.value]
+    return (active or candidates or [None])[0]
+
+def create_task(db: Session, task: schemas.TaskCreate, window_seconds: int = 0):
+    """
+    Create a task, or with window_seconds > 0 (and not task.force) return the
+    matching task from that window instead. Sets `reused` on the returned
+    object: None for a new task, else the status it was found in.
+    """
+    fingerprint = task_fingerprint(task.agent_id, task.input_prompt, task.project_file)
+    if window_seconds <= 0 or task.force:
+        db_task = _insert_task(db, task, fingerprint)
+        db_task.reused = None
+        return db_task
+
+    # Check + insert: the lock covers concurrent requests in this process, the
+    # unique index on dedup_key (pending/running tasks) those of other processes
+    # (API hosts, workers); the loser of that race reuses the winner's task.
+    with _dedup_lock:
+        existing = find_duplicate_task(db, fingerprint, window_seconds)
+        if not existing:
+            try:
+                db_task = _insert_task(db, task, fingerprint, dedup_key=fingerprint)
+            except IntegrityError:
+                db.rollback()
+                existing = find_duplicate_task(db, fingerprint, window_seconds)
+                if not existing:
+                    # The active task holding the key is older than the window
+                    db_task = _insert_task(db, task, fingerprint)
+    if existing:
+        existing.reused = existing.status
+        return existing
+    db_task.reused = None
+    return db_task
+
+def _insert_task(db: Session, task: schemas.TaskCreate, fingerprint: str, dedup_key: str = None):
     db_task = models.Task(
         id=str(uuid.uuid4()),
         title=task.title,
         agent_id=task.agent_id,
         input_prompt=task.input_prompt,
         status=models.TaskStatus.PENDING.value,
-        project_file=task.project_file
+        project_file=task.project_file,
+        priority=task.priority.value,
+        timeout_seconds=task.timeout_seconds,
+        project_step_id=task.project_step_id,
+        fingerprint=fingerprint,
+        dedup_key=dedup_key
     )
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
     return db_task
 
+def get_task(db: Session, task_id: str):
+    return db.query(models.Task).filter(models.Task.id == task_id).first()
+
 def get_tasks(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Task).offset(skip).limit(limit).all()
 
@@ -172,6 +342,86 @@ def update_task_status(db: Session, task_id: str, status: models.TaskStatus, out
         db.refresh(db_task)
     return db_task
 
+def finish_owned_task(db: Session, task_id: str, lease: str, status: models.TaskStatus, output: str) -> bool:
+    """
+    Give a RUNNING task its final status only while `lease` (the token of the
+    claim that started this run, see task_queue.py) still owns it. Returns
+    False when the lease was lost: the task was requeued and belongs to a
+    new run, which must not be overwritten.
+    """
+    query = db.query(models.Task).\
+        filter(models.Task.id == task_id).\
+        filter(models.Task.status == models.TaskStatus.RUNNING.value)
+    query = query.filter(models.Task.lease_owner == lease) if lease else query.filter(models.Task.lease_owner.is_(None))
+    updated = query.update({
+        models.Task.status: status.value,
+        models.Task.output_text: output,
+        models.Task.finished_at: datetime.utcnow(),
+        models.Task.version: func.coalesce(models.Task.version, 0) + 1
+    }, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+def request_task_cancel(db: Session, task_id: str):
+    """
+    PENDING -> CANCELLED directly (version-checked, so a concurrent claim wins
+    and we fall through). RUNNING -> set `cancel_requested`; the owning worker
+    stops at its next check. Finished tasks are returned unchanged.
+    """
+    db_task = get_task(db, task_id)
+    if db_task and db_task.status == models.TaskStatus.PENDING.value:
+        db_task.status = models.TaskStatus.CANCELLED.value
+        db_task.cancel_requested = 1
+        db_task.output_text = "Cancelled before start."
+        db_task.finished_at = datetime.utcnow()
+        try:
+            db.commit()
+            return db_task
+        except StaleDataError:
+            db.rollback()
+            db_task = get_task(db, task_id)
+
+    if db_task and db_task.status == models.TaskStatus.RUNNING.value:
+        # Plain UPDATE: must not bump `version`, or the worker's own final
+        # status write would fail as stale.
+        db.query(models.Task).\
+            filter(models.Task.id == task_id).\
+            update({models.Task.cancel_requested: 1}, synchronize_session=False)
+        db.commit()
+        db.refresh(db_task)
+    return db_task
+
+def get_task_steps(db: Session, task_id: str):
+    return db.query(models.TaskStep).\
+        filter(models.TaskStep.task_id == task_id).\
+        order_by(models.TaskStep.turn).\
+        all()
+
+def save_task_step(db: Session, task_id: str, turn: int, response_text: str, messages: list,
+                   skill_tag: str = None, image_files: list = None, is_final: bool = False):
+    """
+    Checkpoint one turn. Upsert on (task_id, turn): a worker that lost its
+    lease may still finish the same turn, and either copy is a valid result.
+    """
+    row = {
+        "task_id": task_id,
+        "turn": turn,
+        "response_text": response_text,
+        "messages": messages,
+        "skill_tag": skill_tag,
+        "image_files": image_files or [],
+        "is_final": 1 if is_final else 0,
+        "created_at": datetime.utcnow()
+    }
+    dialect_insert = _upsert_insert(db)
+    stmt = dialect_insert(models.TaskStep).values(row)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.TaskStep.task_id, models.TaskStep.turn],
+        set_={key: stmt.excluded[key] for key in row if key not in ("task_id", "turn")}
+    )
+    db.execute(stmt)
+    db.commit()
+
 # --- Settings CRUD ---
 def get_setting(db: Session, key: str):
     return db.query(models.Setting).filter(models.Setting.key == key).first()
@@ -183,7 +433,10 @@ def set_setting(db: Session, key: str, value: str):
     else:
         db_setting = models.Setting(key=key, value=value)
         db.add(db_setting)
+    # Bump the version row in the same transaction so other processes reload
+    previous_version, new_version = settings_cache.stage_version_bump(db)
     db.commit()
+    settings_cache.apply_write(key, value, previous_version, new_version)
     db.refresh(db_setting)
     return db_setting
 
@@ -220,6 +473,7 @@ def create_log(db: Session, event_type: str, content: str, agent_id: str = None)
         
         with open(LOG_FILE, "a", encoding="utf-8") as f:
             f.write(log_entry)
+        doc_index.note_write(LOG_FILE)
             
     except Exception as e:
         print(f"Failed to write to log file: {e}")
@@ -1,12 +1,27 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./company_ai.db"
+# Override to point several API/worker hosts at one shared database
+SQLALCHEMY_DATABASE_URL = os.environ.get("COMPANY_DB_URL", "sqlite:///./company_ai.db")
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30} if IS_SQLITE else {}
 )
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets worker processes read while another one writes;
+        # busy_timeout makes concurrent claims wait instead of failing.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -17,3 +32,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def init_db():
+    """Create missing tables and import legacy projects (API startup, standalone worker)."""
+    from . import models # Registers the tables on Base
+    Base.metadata.create_all(bind=engine)
+    # create_all skips indexes of tables that already exist
+    models.TASK_DEDUP_INDEX.create(bind=engine, checkfirst=True)
+
+    # Checklist files from before the project tables: import them once so
+    # their pending tasks advance the project again
+    from . import project_manager
+    db = SessionLocal()
+    try:
+        project_manager.import_legacy_projects(db)
+    except Exception as e:
+        db.rollback()
+        print(f"DEBUG: Legacy project import failed: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,402 @@
+"""
+In-memory index of the files under Company Doc.
+
+read_file's auto-discovery, the smart-context / project-context lookups in
+process_task_background, list_files and the project context prefetch used to
+`os.walk` / `listdir` the tree on every lookup. The index is built with one
+scan on first use and then kept fresh in two ways:
+
+- write hooks: code that writes into Company Doc calls `note_write(path)` /
+  `note_delete(path)` (task outputs, project files, the company log, images),
+- a reconcile thread (`doc_index_refresh_seconds` setting, default 5, 0 = off;
+  started by the API process and by every worker child, each has its own index)
+  stats the known directories and rescans the ones whose mtime changed, which
+  picks up files added, removed or renamed by other processes (the Streamlit
+  frontend, task worker processes, people). It also re-stats the Markdown
+  files, since editing or appending to a file in place (e.g. Company_Log.md
+  from a worker process) does not change its folder's mtime.
+
+Entries are `DocFile(path, name, stem, author, size, mtime, content_type)`
+where path is relative to Company Doc and author is its top-level folder (the
+agent's folder). Lookups:
+- by exact name / author / directory: dict of sets, O(1),
+- by name (stem) prefix: bisect in a sorted name list, O(log n + matches).
+
+Other indexes derived from the files (doc_search.py) `subscribe` to changes.
+
+Benchmark: scripts/bench_doc_index.py (100k files).
+"""
+import bisect
+import mimetypes
+import os
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+COMPANY_DOC_DIR = os.path.join(BASE_DIR, "Company Doc")
+DEFAULT_REFRESH_SECONDS = 5.0
+MARKDOWN_SUFFIX = ".md" # Files re-stat'ed by refresh() (edited in place)
+
+mimetypes.add_type("text/markdown", ".md")
+
+
+class DocFile(NamedTuple):
+    path: str    # Relative to the index root, "/" separated
+    name: str
+    stem: str
+    author: str  # Top-level folder ("" for files in the root)
+    size: int
+    mtime: float
+    content_type: str
+
+
+_content_types = {}
+
+
+def _content_type(ext: str) -> str:
+    # Memoized per extension: guess_type is the slowest part of a full scan
+    content_type = _content_types.get(ext)
+    if content_type is None:
+        content_type = _content_types[ext] = mimetypes.guess_type("file" + ext)[0] or "application/octet-stream"
+    return content_type
+
+
+class DocIndex:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self._built = False
+        self._files = {}     # rel path -> DocFile
+        self._by_name = {}   # name -> {rel path}
+        self._by_author = {} # author -> {rel path}
+        self._by_dir = {}    # rel dir -> {rel path}
+        self._names = []     # sorted [(name, rel path)]
+        self._dirs = {}      # rel dir -> mtime_ns
+        self._children = {}  # rel dir -> {rel subdir}
+        self._listeners = []
+        self.refreshed_at = 0.0 # time.monotonic() of the last full reconcile
+
+    # --- Paths ---
+
+    def _rel(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+        rel = os.path.relpath(path, self.root)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    @staticmethod
+    def _parent(rel: str) -> str:
+        return rel.rsplit("/", 1)[0] if "/" in rel else ""
+
+    # --- Mutations (caller holds _lock) ---
+
+    def _add(self, rel: str, st: os.stat_result):
+        if rel in self._files:
+            self._remove(rel)
+        name = rel.rsplit("/", 1)[-1]
+        author = rel.split("/", 1)[0] if "/" in rel else ""
+        stem, ext = os.path.splitext(name)
+        doc = DocFile(rel, name, stem, author, st.st_size, st.st_mtime, _content_type(ext.lower()))
+        self._files[rel] = doc
+        self._by_name.setdefault(name, set()).add(rel)
+        self._by_author.setdefault(author, set()).add(rel)
+        self._by_dir.setdefault(self._parent(rel), set()).add(rel)
+        if self._built:
+            bisect.insort(self._names, (name, rel))
+        else:
+            self._names.append((name, rel)) # Sorted once after the first scan
+        self._notify(rel)
+
+    def _remove(self, rel: str):
+        doc = self._files.pop(rel, None)
+        if doc is None:
+            return
+        for mapping, key in ((self._by_name, doc.name), (self._by_author, doc.author), (self._by_dir, self._parent(rel))):
+            paths = mapping.get(key)
+            if paths is not None:
+                paths.discard(rel)
+                if not paths:
+                    del mapping[key]
+        i = bisect.bisect_left(self._names, (doc.name, rel))
+        if i < len(self._names) and self._names[i] == (doc.name, rel):
+            del self._names[i]
+        self._notify(rel)
+
+    def _notify(self, rel: str):
+        for listener in self._listeners:
+            listener(rel)
+
+    def subscribe(self, listener):
+        """Call `listener(rel_path)` whenever a file is added, changed or removed (under the index lock: keep it cheap)."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _scan_dir(self, rel_dir: str, recursive: bool):
+        """(Re)index one directory's entries; returns the subdirectories found."""
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError:
+            self._drop_dir(rel_dir)
+            return []
+        if rel_dir not in self._dirs and rel_dir:
+            self._children.setdefault(self._parent(rel_dir), set()).add(rel_dir)
+        self._dirs[rel_dir] = mtime_ns
+        seen = set()
+        subdirs = []
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(rel)
+                elif entry.is_file():
+                    seen.add(rel)
+                    doc = self._files.get(rel)
+                    st = entry.stat()
+                    if doc is None or doc.size != st.st_size or doc.mtime != st.st_mtime:
+                        self._add(rel, st)
+            except OSError:
+                continue
+        for rel in list(self._by_dir.get(rel_dir, ())):
+            if rel not in seen:
+                self._remove(rel)
+        # Subdirectories that disappeared
+        for known in self._children.get(rel_dir, set()) - set(subdirs):
+            self._drop_dir(known)
+        if recursive:
+            for sub in subdirs:
+                self._scan_dir(sub, True)
+        else:
+            for sub in subdirs:
+                if sub not in self._dirs:
+                    self._scan_dir(sub, True)
+        return subdirs
+
+    def _drop_dir(self, rel_dir: str):
+        for sub in list(self._children.pop(rel_dir, ())):
+            self._drop_dir(sub)
+        for rel in list(self._by_dir.get(rel_dir, ())):
+            self._remove(rel)
+        self._dirs.pop(rel_dir, None)
+        siblings = self._children.get(self._parent(rel_dir))
+        if rel_dir and siblings is not None:
+            siblings.discard(rel_dir)
+
+    def _ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._scan_dir("", True)
+                    self._names.sort()
+                    self._built = True
+                    self.refreshed_at = time.monotonic()
+
+    # --- Freshness ---
+
+    def refresh(self) -> int:
+        """
+        Rescan the directories whose mtime changed and re-stat the Markdown
+        files (an in-place edit or append does not touch the folder's mtime).
+        Returns how many directories were rescanned plus files updated.
+        """
+        self._ensure_built()
+        with self._lock:
+            changed = [] if "" in self._dirs else [""] # Root was missing last time
+            for rel_dir, mtime_ns in list(self._dirs.items()):
+                path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+                try:
+                    if os.stat(path).st_mtime_ns != mtime_ns:
+                        changed.append(rel_dir)
+                except OSError:
+                    changed.append(rel_dir)
+            for rel_dir in changed:
+                if rel_dir in self._dirs or rel_dir == "":
+                    self._scan_dir(rel_dir, False)
+            docs = [doc for doc in self._files.values() if doc.name.endswith(MARKDOWN_SUFFIX)]
+
+        # Stat outside the lock: lookups are not blocked by a large tree
+        modified = []
+        prefix = self.root + "/" # os.stat accepts "/" on Windows too
+        for doc in docs:
+            try:
+                st = os.stat(prefix + doc.path)
+            except OSError:
+                continue # Deleted: its folder's mtime changed, handled by the next rescan
+            if st.st_size != doc.size or st.st_mtime != doc.mtime:
+                modified.append((doc, st))
+        if modified:
+            with self._lock:
+                for doc, st in modified:
+                    if self._files.get(doc.path) is doc: # Not updated meanwhile
+                        self._add(doc.path, st)
+        self.refreshed_at = time.monotonic()
+        return len(changed) + len(modified)
+
+    def refresh_if_older(self, max_age: float) -> int:
+        """`refresh()` unless one finished less than `max_age` seconds ago."""
+        if time.monotonic() - self.refreshed_at < max_age:
+            return 0
+        return self.refresh()
+
+    def sync_dir(self, rel_dir: str = ""):
+        """Rescan one directory now if its mtime moved (e.g. before listing it)."""
+        self._ensure_built()
+        rel_dir = rel_dir.replace("\\", "/").strip("/")
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            if self._dirs.get(rel_dir) != mtime_ns:
+                self._scan_dir(rel_dir, False)
+
+    def note_write(self, path: str):
+        """Write hook: `path` (absolute) was created or modified."""
+        if not self._built:
+            return # Picked up by the first scan
+        rel = self._rel(path)
+        if not rel:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self.note_delete(path)
+        with self._lock:
+            parent = self._parent(rel)
+            if parent not in self._dirs:
+                self._scan_dir(parent, True) # New folder (e.g. a new agent)
+            else:
+                self._add(rel, st)
+
+    def note_delete(self, path: str):
+        if not self._built:
+            return
+        rel = self._rel(path)
+        if rel:
+            with self._lock:
+                self._remove(rel)
+
+    # --- Lookups ---
+
+    def get(self, rel_path: str) -> Optional[DocFile]:
+        self._ensure_built()
+        return self._files.get(rel_path.replace("\\", "/").strip("/"))
+
+    def _docs(self, paths) -> List[DocFile]:
+        files = self._files
+        return [files[p] for p in paths if p in files]
+
+    def find_by_name(self, name: str) -> List[DocFile]:
+        self._ensure_built()
+        with self._lock:
+            return self._docs(sorted(self._by_name.get(name, ())))
+
+    def find_by_prefix(self, prefix: str, suffix: str = "") -> List[DocFile]:
+        """Files whose name starts with `prefix` (a stem prefix) and ends with `suffix`."""
+        self._ensure_built()
+        with self._lock:
+            names = self._names
+            i = bisect.bisect_left(names, (prefix, ""))
+            paths = []
+            while i < len(names) and names[i][0].startswith(prefix):
+                if names[i][0].endswith(suffix):
+                    paths.append(names[i][1])
+                i += 1
+            return self._docs(paths)
+
+    def find_by_author(self, author: str) -> List[DocFile]:
+        self._ensure_built()
+        with self._lock:
+            return self._docs(sorted(self._by_author.get(author, ())))
+
+    def in_dir(self, rel_dir: str = "") -> List[DocFile]:
+        """Files directly inside one directory (not its subdirectories)."""
+        self._ensure_built()
+        with self._lock:
+            return self._docs(sorted(self._by_dir.get(rel_dir.replace("\\", "/").strip("/"), ())))
+
+    def list_dir(self, rel_dir: str = "") -> tuple:
+        """(subdirectory names, file names) of one directory."""
+        self._ensure_built()
+        rel_dir = rel_dir.replace("\\", "/").strip("/")
+        with self._lock:
+            dirs = sorted(d.rsplit("/", 1)[-1] for d in self._children.get(rel_dir, ()))
+            files = [doc.name for doc in self.in_dir(rel_dir)]
+            return dirs, files
+
+    def has_dir(self, rel_dir: str) -> bool:
+        self._ensure_built()
+        return rel_dir.replace("\\", "/").strip("/") in self._dirs
+
+    def abspath(self, doc: DocFile) -> str:
+        return os.path.join(self.root, *doc.path.split("/"))
+
+    def __len__(self):
+        self._ensure_built()
+        return len(self._files)
+
+
+def newest(docs: List[DocFile]) -> List[DocFile]:
+    return sorted(docs, key=lambda d: d.mtime, reverse=True)
+
+
+# --- Company Doc instance ---
+
+index = DocIndex(COMPANY_DOC_DIR)
+
+
+def note_write(path: str):
+    index.note_write(path)
+
+
+def note_delete(path: str):
+    index.note_delete(path)
+
+
+class IndexRefresher:
+    """Background thread reconciling the index with the filesystem."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="doc-index", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _loop(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                index.refresh()
+            except Exception as e:
+                print(f"Doc Index: refresh failed: {e}")
+
+
+_refresher = None
+
+
+def start_refresher(db) -> IndexRefresher:
+    from . import settings_cache
+    global _refresher
+    interval = float(settings_cache.get(db, "doc_index_refresh_seconds", DEFAULT_REFRESH_SECONDS) or 0)
+    if _refresher is None and interval > 0:
+        _refresher = IndexRefresher(interval)
+        _refresher.start()
+    return _refresher
+
+
+def stop_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
@@ -0,0 +1,254 @@
+"""
+Full-text search over the Markdown files in Company Doc (SQLite FTS5).
+
+Agents used to find upstream work by guessing file names from the company log
+and then reading whole files. `search(query)` returns the best matching
+documents with a short snippet around the matches instead; it backs the
+`search_docs` skill and `GET /docs/search`.
+
+Index: a separate SQLite file (COMPANY_DOC_SEARCH_DB, default doc_search.db
+next to Company Doc; derived data, safe to delete) with
+- `docs(id, path, mtime, size)`: what was indexed, to skip unchanged files,
+- `docs_fts(title, body, path)`: FTS5 with the `trigram` tokenizer, so Chinese
+  (no spaces between words) matches as well as English. Ranked with bm25,
+  title matches weighted higher.
+
+Trigrams need at least 3 characters; shorter terms (e.g. two-character
+Chinese words) are matched with LIKE on the same table.
+
+Updates are incremental: the index subscribes to the Company Doc file index
+(doc_index.py), whose write hooks and reconcile thread report every Markdown
+file added, changed (also edited in place by another process) or removed.
+Files written by other processes (worker children, other hosts) only reach
+this process through a reconcile, so a query first reconciles the file index
+unless that happened in the last QUERY_RECONCILE_SECONDS, whether or not the
+reconcile thread runs. Reported paths are re-indexed before the search; on
+first use all Markdown files are compared with `docs` (mtime, size) so files
+changed while the server was down are picked up too.
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+from . import doc_index
+
+DB_PATH = os.environ.get("COMPANY_DOC_SEARCH_DB", os.path.join(doc_index.BASE_DIR, "doc_search.db"))
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 20
+SNIPPET_TOKENS = 48 # Trigram tokens, roughly characters
+TITLE_WEIGHT = 5.0
+QUERY_RECONCILE_SECONDS = 1.0 # Queries within this of the last reconcile reuse it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, path UNINDEXED, tokenize='trigram');
+"""
+
+
+class SearchUnavailable(Exception):
+    """SQLite was built without FTS5 or the trigram tokenizer (SQLite < 3.34)."""
+
+
+def _title(content: str, fallback: str) -> str:
+    match = re.search(r"^#{1,6}\s+(.+)$", content, re.MULTILINE)
+    return match.group(1).strip() if match else fallback
+
+
+def _terms(query: str) -> list:
+    # Quoted phrases stay together, everything else splits on whitespace
+    return [a or b for a, b in re.findall(r'"([^"]+)"|(\S+)', query or "") if (a or b).strip()]
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _excerpt(body: str, terms: list) -> str:
+    """Snippet for LIKE-only matches (snippet() needs MATCH)."""
+    lower = body.lower()
+    positions = [lower.find(t.lower()) for t in terms]
+    start = min([p for p in positions if p >= 0], default=0)
+    begin = max(0, start - SNIPPET_TOKENS // 2)
+    text = body[begin:begin + SNIPPET_TOKENS * 2].replace("\n", " ")
+    for t in terms:
+        text = re.sub(re.escape(t), lambda m: f"**{m.group(0)}**", text, flags=re.IGNORECASE)
+    return ("…" if begin else "") + text + ("…" if begin + SNIPPET_TOKENS * 2 < len(body) else "")
+
+
+class DocSearch:
+    def __init__(self, db_path: str, index: doc_index.DocIndex):
+        self.db_path = db_path
+        self.index = index
+        self._lock = threading.Lock()
+        self._conn = None
+        self._synced = False
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        index.subscribe(self._on_change)
+
+    # --- Storage ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            try:
+                conn.executescript(SCHEMA)
+            except sqlite3.OperationalError as e:
+                conn.close()
+                raise SearchUnavailable(str(e))
+            self._conn = conn
+        return self._conn
+
+    def _on_change(self, rel: str):
+        if rel.endswith(".md"):
+            with self._pending_lock:
+                self._pending.add(rel)
+
+    def _index_file(self, conn, rel: str, stored: Optional[tuple]):
+        doc = self.index.get(rel)
+        if doc is None:
+            if stored is not None:
+                conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (stored[0],))
+                conn.execute("DELETE FROM docs WHERE id = ?", (stored[0],))
+            return
+        if stored is not None and stored[1:] == (doc.mtime, doc.size):
+            return
+        try:
+            with open(self.index.abspath(doc), "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return # Gone or unreadable: the next change notification retries
+        if stored is None:
+            doc_id = conn.execute(
+                "INSERT INTO docs (path, mtime, size) VALUES (?, ?, ?)", (rel, doc.mtime, doc.size)
+            ).lastrowid
+        else:
+            doc_id = stored[0]
+            conn.execute("UPDATE docs SET mtime = ?, size = ? WHERE id = ?", (doc.mtime, doc.size, doc_id))
+            conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+        conn.execute(
+            "INSERT INTO docs_fts (rowid, title, body, path) VALUES (?, ?, ?, ?)",
+            (doc_id, _title(content, doc.stem), content, rel)
+        )
+
+    def sync(self) -> int:
+        """Bring the FTS index up to date. Returns how many paths were checked."""
+        with self._lock:
+            conn = self._connect()
+            with self._pending_lock:
+                pending, self._pending = self._pending, set()
+            if not self._synced:
+                # First use: every Markdown file vs. what is stored
+                pending.update(doc.path for doc in self.index.find_by_prefix("", ".md"))
+                pending.update(row[0] for row in conn.execute("SELECT path FROM docs"))
+            if not pending:
+                self._synced = True
+                return 0
+            stored = {}
+            paths = list(pending)
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT path, id, mtime, size FROM docs WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                )
+                stored.update((row[0], row[1:]) for row in rows)
+            with conn:
+                for rel in paths:
+                    self._index_file(conn, rel, stored.get(rel))
+            self._synced = True
+            return len(paths)
+
+    # --- Queries ---
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, author: Optional[str] = None) -> List[dict]:
+        """
+        Ranked matches: [{"path", "author", "title", "snippet", "score", "mtime"}].
+        All terms must match; if nothing does, any term may.
+        """
+        terms = _terms(query)
+        if not terms:
+            return []
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+        self.index.refresh_if_older(QUERY_RECONCILE_SECONDS)
+        self.sync()
+        results = self._query(terms, limit, author, "AND")
+        if not results and len(terms) > 1:
+            results = self._query(terms, limit, author, "OR")
+        return results
+
+    def _query(self, terms: list, limit: int, author: Optional[str], operator: str) -> List[dict]:
+        long_terms = [t for t in terms if len(t) >= 3]
+        short_terms = [t for t in terms if len(t) < 3]
+        if operator == "OR" and long_terms:
+            short_terms = [] # MATCH cannot be OR-ed with other conditions; rank on the long terms
+        where, params = [], []
+        if long_terms:
+            where.append("docs_fts MATCH ?")
+            params.append(f" {operator} ".join(_fts_phrase(t) for t in long_terms))
+        if short_terms:
+            like = "(body LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\')"
+            where.append("(" + f" {operator} ".join([like] * len(short_terms)) + ")")
+            for t in short_terms:
+                params.extend([f"%{_escape_like(t)}%"] * 2)
+        if author:
+            where.append("(docs_fts.path = ? OR docs_fts.path LIKE ? ESCAPE '\\')")
+            params.extend([author, f"{_escape_like(author)}/%"])
+
+        if long_terms:
+            columns = (f"bm25(docs_fts, {TITLE_WEIGHT}, 1.0) AS score, "
+                       f"snippet(docs_fts, 1, '**', '**', '…', {SNIPPET_TOKENS}) AS snippet")
+            order = "score"
+        else:
+            # No MATCH to rank with: newest first, snippet built in Python
+            columns = "0.0 AS score, body AS snippet"
+            order = "docs.mtime DESC"
+        sql = (f"SELECT docs_fts.path, title, docs.mtime, {columns} FROM docs_fts "
+               f"JOIN docs ON docs.id = docs_fts.rowid WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?")
+        params.append(limit)
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        results = []
+        for path, title, mtime, score, snippet in rows:
+            if order != "score":
+                snippet = _excerpt(snippet, terms)
+            results.append({
+                "path": path,
+                "author": path.split("/", 1)[0] if "/" in path else "",
+                "title": title,
+                "snippet": snippet,
+                "score": round(-score, 4), # bm25 is lower-is-better
+                "mtime": mtime
+            })
+        return results
+
+
+# --- Company Doc instance ---
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_search() -> DocSearch:
+    global _search
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                _search = DocSearch(DB_PATH, doc_index.index)
+    return _search
+
+
+def search(query: str, limit: int = DEFAULT_LIMIT, author: Optional[str] = None) -> List[dict]:
+    return get_search().search(query, limit=limit, author=author)
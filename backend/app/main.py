@@ -1,28 +1,28 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Header
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
 import time
 import os
 from datetime import datetime
 import traceback
-import openai
-from .database import engine, Base, get_db, SessionLocal
+from .database import engine, Base, get_db, SessionLocal, init_db
 from .models import Agent, Task
 from .workflows.registry import get_workflow, get_all_workflows_prompt
 from . import project_manager
-from . import models, schemas, crud
-# Force load skills
+from . import tags as tag_tokenizer
+from . import models, schemas, crud, settings_cache, task_queue, task_control, task_events, task_spans, batch_runner, skill_runner, skill_watcher, doc_index, doc_search
+# Registers skill metadata from the manifest; handler modules load on first call
 from . import skills
 
-# Create tables
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="Company AI System")
 
 @app.on_event("startup")
 def startup_event():
+    # Create tables (at startup, not at import: importing main stays cheap)
+    init_db()
+
     # Sync Skills from Registry to DB
     from .skills.registry import SkillRegistry
     db = SessionLocal()
@@ -31,21 +31,35 @@ def startup_event():
         print(f"Syncing {len(registered_skills)} skills to DB...")
         crud.sync_skills(db, registered_skills)
         print("Skill Sync Complete.")
+
+        # Task Queue: requeue tasks orphaned by a crash, then start the workers
+        task_queue.recover_orphans(db)
+        worker_count = task_queue.configured_worker_count(db)
+
+        # Skill hot reload (plugin folder watcher)
+        skill_watcher.start_watcher(db)
+
+        # Company Doc file index reconciler
+        doc_index.start_refresher(db)
     finally:
         db.close()
+    task_queue.start_pool(process_task_background, worker_count)
+    batch_runner.start_runner(build_batch_request, publish_batch_result)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    skill_watcher.stop_watcher()
+    doc_index.stop_refresher()
+    batch_runner.stop_runner()
+    task_queue.stop_pool()
+    skill_runner.shutdown()
 
 # --- LLM Service ---
 def get_llm_config(db: Session):
-    api_key = crud.get_setting(db, "api_key")
-    base_url = crud.get_setting(db, "base_url")
-    gemini_api_key = crud.get_setting(db, "gemini_api_key")
-    return {
-        "api_key": api_key.value if api_key else None,
-        "base_url": base_url.value if base_url else "https://api.openai.com/v1",
-        "gemini_api_key": gemini_api_key.value if gemini_api_key else None
-    }
+    # Served from the in-memory settings cache (read-only mapping)
+    return settings_cache.get_llm_config(db)
 
-def call_gemini_service(agent: models.Agent, prompt: str, config: dict, stream: bool = False, history: List[schemas.ChatMessage] = [], system_prompt: str = ""):
+def call_gemini_service(agent: models.Agent, prompt: str, config: dict, stream: bool = False, history: List[schemas.ChatMessage] = [], system_prompt: str = "", timeout: float = 120):
     api_key = config.get("gemini_api_key")
     if not api_key:
         return "Error: Gemini API Key not configured."
@@ -112,7 +126,7 @@ def call_gemini_service(agent: models.Agent, prompt: str, config: dict, stream:
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:streamGenerateContent?key={api_key}"
         try:
              # Use requests with stream=True
-            with requests.post(url, json=payload, stream=True) as response:
+            with requests.post(url, json=payload, stream=True, timeout=timeout) as response:
                 if response.status_code != 200:
                     yield f"Error: {response.status_code} - {response.text}"
                     return
@@ -143,7 +157,7 @@ def call_gemini_service(agent: models.Agent, prompt: str, config: dict, stream:
     else:
         # Non-stream implementation
         try:
-            response = requests.post(url, json=payload)
+            response = requests.post(url, json=payload, timeout=timeout)
             if response.status_code == 200:
                 data = response.json()
                 if "candidates" in data:
@@ -155,59 +169,12 @@ def call_gemini_service(agent: models.Agent, prompt: str, config: dict, stream:
             return f"Error calling Gemini: {str(e)}"
 
 
-def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: bool = False, db: Session = None, history: List[schemas.ChatMessage] = [], task_mode: str = "chat"):
-    # Dispatch based on Provider
-    if agent.provider == "gemini":
-        # Pre-calculate system prompt to pass explicitly
-        identity_prompt = (
-            f"You are {agent.name}.\n"
-            f"Role: {agent.role}\n"
-            f"Job Title: {agent.job_title or 'N/A'}\n"
-            f"Department: {agent.department or 'N/A'}\n"
-            f"Level: {agent.level or 'N/A'}\n\n"
-            f"{agent.system_prompt}"
-        )
-        # Inject logs
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        LOG_FILE = os.path.join(BASE_DIR, "Company Doc", "System", "Company_Log.md")
-        if os.path.exists(LOG_FILE):
-             try:
-                with open(LOG_FILE, "r", encoding="utf-8") as f:
-                    recent_lines = f.readlines()[-50:]
-                    log_text = "".join(recent_lines)
-                    identity_prompt += f"\n\n[Recent Company System Activity]\n{log_text}\n"
-             except: pass
-        
-        # Inject Delegation or Dispatch instructions if needed
-        # (This logic is duplicated from below but needed for proper system prompt construction)
-        # For brevity, we pass the raw system prompt construction to the helper
-        
-        result = call_gemini_service(agent, prompt, config, stream, history, system_prompt=identity_prompt)
-        
-        # FIX: If not streaming, consume the generator immediately and return string
-        if not stream:
-            return "".join([chunk for chunk in result])
-            
-        return result
-        
-    # Default to OpenAI
-    api_key = config.get("api_key")
-    base_url = config.get("base_url", "https://api.openai.com/v1")
-    import requests
-    import json
-    
-    # Construct URL
-    base_url = base_url.rstrip('/')
-    if not base_url.endswith("/chat/completions"):
-        api_url = f"{base_url}/chat/completions"
-    else:
-        api_url = base_url
-        
-    headers = {
-        "Authorization": f"Bearer {config['api_key']}",
-        "Content-Type": "application/json"
-    }
-    
+def build_llm_messages(agent: models.Agent, prompt: str, db: Session = None, history: List[schemas.ChatMessage] = [], task_mode: str = "chat", system_prompt: str = None):
+    """
+    OpenAI-style message list for one call: identity, shared company log,
+    mode instructions, history and the prompt. `system_prompt` replaces
+    agent.system_prompt (e.g. with a workflow SOP appended).
+    """
     # Construct Identity Context (OpenAI)
     identity_prompt = (
         f"You are {agent.name}.\n"
@@ -215,7 +182,7 @@ def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: boo
         f"Job Title: {agent.job_title or 'N/A'}\n"
         f"Department: {agent.department or 'N/A'}\n"
         f"Level: {agent.level or 'N/A'}\n\n"
-        f"{agent.system_prompt}"
+        f"{agent.system_prompt if system_prompt is None else system_prompt}"
     )
 
     # Inject Company Logs for ALL Agents (Shared Awareness)
@@ -280,6 +247,8 @@ def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: boo
             "   - **输出格式**: [[CREATE_PROJECT: {项目标题} | {是否串行(True/False)} | {步骤1} | {步骤2} ...]]\n"
             "   - **步骤格式**: '员工姓名: 具体指令' (例如 '小张: 写最后一段脚本')\n"
             "   - **示例**: [[CREATE_PROJECT: 科幻漫画项目 | True | 小张: 编写脚本 | 小美: 根据脚本绘制分镜]]\n"
+            "   - **依赖 (可选)**: 步骤前可加 '[步骤ID](after: ID1, ID2)'，该步骤会等待所有前置步骤完成后才开始。\n"
+            "   - **示例**: [[CREATE_PROJECT: 海报项目 | False | [copy] 小张: 写文案 | [art] 小美: 画插图 | [final](after: copy, art) 小芳: 合成海报说明]]\n"
             "\n"
             "3. **如果意图 = 指令 (单任务/并行任务)**:\n"
             "   - 触发条件：独立的任务，可以立即执行。\n"
@@ -400,16 +369,80 @@ def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: boo
             print("WARNING: call_llm_service received empty prompt. Using placeholder.")
             messages.append({"role": "user", "content": "Proceed."})
 
+    return messages
+
+def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: bool = False, db: Session = None, history: List[schemas.ChatMessage] = [], task_mode: str = "chat", timeout: float = 120):
+    # Dispatch based on Provider
+    if agent.provider == "gemini":
+        # Pre-calculate system prompt to pass explicitly
+        identity_prompt = (
+            f"You are {agent.name}.\n"
+            f"Role: {agent.role}\n"
+            f"Job Title: {agent.job_title or 'N/A'}\n"
+            f"Department: {agent.department or 'N/A'}\n"
+            f"Level: {agent.level or 'N/A'}\n\n"
+            f"{agent.system_prompt}"
+        )
+        # Inject logs
+        BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        LOG_FILE = os.path.join(BASE_DIR, "Company Doc", "System", "Company_Log.md")
+        if os.path.exists(LOG_FILE):
+             try:
+                with open(LOG_FILE, "r", encoding="utf-8") as f:
+                    recent_lines = f.readlines()[-50:]
+                    log_text = "".join(recent_lines)
+                    identity_prompt += f"\n\n[Recent Company System Activity]\n{log_text}\n"
+             except: pass
+        
+        # Inject Delegation or Dispatch instructions if needed
+        # (This logic is duplicated from below but needed for proper system prompt construction)
+        # For brevity, we pass the raw system prompt construction to the helper
+        
+        result = call_gemini_service(agent, prompt, config, stream, history, system_prompt=identity_prompt, timeout=timeout)
+        
+        # FIX: If not streaming, consume the generator immediately and return string
+        if not stream:
+            return "".join([chunk for chunk in result])
+            
+        return result
+        
+    # Default to OpenAI
+    api_key = config.get("api_key")
+    base_url = config.get("base_url", "https://api.openai.com/v1")
+    import requests
+    import json
+    
+    # Construct URL
+    base_url = base_url.rstrip('/')
+    if not base_url.endswith("/chat/completions"):
+        api_url = f"{base_url}/chat/completions"
+    else:
+        api_url = base_url
+        
+    headers = {
+        "Authorization": f"Bearer {config['api_key']}",
+        "Content-Type": "application/json"
+    }
+    
+    messages = build_llm_messages(agent, prompt, db, history, task_mode)
+
     payload = {
         "model": agent.model_name,
         "messages": messages,
         "temperature": agent.temperature,
         "stream": stream
     }
+    if stream:
+        # Final SSE chunk carries the real token counts (see _iter_llm_deltas)
+        payload["stream_options"] = {"include_usage": True}
     
     # Make direct HTTP request to avoid library conflicts
     try:
-        response = requests.post(api_url, headers=headers, json=payload, timeout=120, stream=stream)
+        response = requests.post(api_url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        if stream and response.status_code in (400, 422) and "stream_options" in response.text:
+            # Older OpenAI-compatible servers reject the option: stream without usage
+            payload.pop("stream_options")
+            response = requests.post(api_url, headers=headers, json=payload, timeout=timeout, stream=stream)
         
         if response.status_code != 200:
             raise Exception(f"API Error {response.status_code}: {response.text}")
@@ -422,15 +455,192 @@ def call_llm_service(agent: models.Agent, prompt: str, config: dict, stream: boo
     except Exception as e:
         raise Exception(f"LLM Call Failed: {str(e)}")
 
+def _iter_llm_deltas(response, usage: dict = None):
+    """
+    Text deltas of a streamed LLM reply (OpenAI SSE response or Gemini generator).
+    If `usage` is given, the provider's usage block (prompt/completion token
+    counts, sent last with stream_options.include_usage) is copied into it.
+    """
+    import json
+    if not hasattr(response, "iter_lines"):
+        # Gemini: call_gemini_service already yields text chunks
+        yield from response
+        return
+    for line in response.iter_lines():
+        if line:
+            decoded = line.decode('utf-8')
+            if decoded.startswith("data: "):
+                content = decoded[6:]
+                if content == "[DONE]":
+                    break
+                try:
+                    data = json.loads(content)
+                    if usage is not None and data.get('usage'):
+                        usage.update(data['usage'])
+                    delta = data['choices'][0]['delta'].get('content', "")
+                    if delta:
+                        yield delta
+                except:
+                    pass
+
+def _llm_timeout(control: task_control.TaskControl) -> float:
+    # Never let one HTTP call outlive the task's deadline
+    remaining = control.remaining()
+    return 120 if remaining is None else max(1.0, min(120, remaining))
+
+def _stream_task_llm(control: task_control.TaskControl, spans: task_spans.SpanRecorder, submitted_at: float, task_id: str, turn: int, agent: models.Agent, prompt: str, config: dict, db: Session, history: list):
+    # Streamed background call: partial output goes out as `token` events
+    # (GET /tasks/{id}/events); returns the full text like the non-stream call.
+    # Timed as an `llm_call` span (handoff wait, TTFB, total, output tokens as
+    # reported by the provider; None when it sends no usage block, e.g. Gemini).
+    span = spans.start("llm_call", label=f"turn {turn + 1}")
+    span.queue_wait_ms = round((span.start - submitted_at) * 1000, 2)
+    status = "ok"
+    usage = {}
+    tokens = task_events.TokenBuffer(task_id, turn + 1)
+    parts = []
+    response = None
+    try:
+        response = call_llm_service(agent, prompt, config, stream=True, db=db, task_mode="background_worker", history=history, timeout=_llm_timeout(control))
+        for delta in _iter_llm_deltas(response, usage):
+            if control.stopped:
+                status = "abandoned"
+                break # Abandoned by cancel/deadline: stop reading, drop the connection
+            if span.ttfb_ms is None:
+                span.ttfb_ms = round((time.perf_counter() - span.start) * 1000, 2)
+            parts.append(delta)
+            tokens.add(delta)
+    except Exception as e:
+        status = f"error:{type(e).__name__}"
+        raise
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+        span.tokens = usage.get("completion_tokens")
+        spans.finish(span, status)
+    tokens.flush()
+    return "".join(parts)
+
+def _finish_stopped_task(task_id: str, lease: str, status: models.TaskStatus, message: str):
+    # Fresh session: the task's own session may still be held by an abandoned call.
+    # Conditional on our lease: a reaped run must not stop the task's new owner.
+    db = SessionLocal()
+    try:
+        if crud.finish_owned_task(db, task_id, lease, status, message):
+            project_manager.fail_step_for_task(db, task_id)
+            print(f"DEBUG: Task {task_id} stopped: {status.value}")
+        else:
+            print(f"DEBUG: Task {task_id} lease lost before it could be marked {status.value}.")
+    finally:
+        db.close()
+
+def detect_workflow(prompt: str):
+    # Check if the prompt has [WORKFLOW: xxx]
+    import re
+    wf_match = re.match(r"\[WORKFLOW:\s*(.*?)\]", prompt or "")
+    if wf_match:
+        wf_id = wf_match.group(1).strip()
+        print(f"DEBUG: Task assigned Workflow: {wf_id}")
+        return get_workflow(wf_id)
+    # Default to General Task
+    return get_workflow("general_task")
+
+def task_system_prompt(agent: models.Agent, workflow_data: dict, sop_text: str = None) -> str:
+    """Agent system prompt with the workflow SOP and the file-output rules appended."""
+    if sop_text is None:
+        sop_text = "\n".join(workflow_data['steps'])
+    return agent.system_prompt + f"\n\n[ASSIGNED PROTOCOL: {workflow_data['name']}]\nDESCRIPTION: {workflow_data['description']}\nSTEPS:\n{sop_text}\n\n[INSTRUCTION]\nStrictly follow the STEPS above. Process one step at a time if needed.\n\n[CRITICAL OUTPUT FORMAT]\nThis task is for file generation. Your output will be saved DIRECTLY to a file.\n1. DO NOT output your internal thought process, analysis, or 'Step 1...' headers.\n2. DO NOT include conversational filler like 'Here is the story:'.\n3. OUTPUT ONLY THE FINAL RESULT CONTENT.\n4. DO NOT ASK FOR CONFIRMATION. YOU HAVE FULL PERMISSION. EXECUTE IMMEDIATELY."
+
+def publish_task_output(db: Session, task: models.Task, agent: models.Agent, generated_content: str, spans: task_spans.SpanRecorder):
+    """
+    Normal artifact path for a finished task: write the file into the agent's
+    Company Doc folder, mark the task COMPLETED, log it and advance its project.
+    Used by the agent loop and by batch results (see batch_runner.py).
+    """
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    agent_name_clean = "".join([c for c in agent.name if c.isalnum() or c in (' ', '-', '_', '(', ')')]).strip()
+    OUTPUT_DIR = os.path.join(BASE_DIR, "Company Doc", agent_name_clean)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    timestamp = int(time.time())
+    clean_title = "".join([c for c in task.title if c.isalnum() or c in (' ', '-', '_')]).strip().replace(' ', '_')
+    file_name = f"{clean_title}_{task.id[:8]}.md"
+    file_path = os.path.join(OUTPUT_DIR, file_name)
+
+    # Build the successors' context while this step still writes and reports
+    prefetch = project_manager.start_prefetch(task.project_step_id, os.path.join(agent_name_clean, file_name), generated_content) if task.project_step_id else None
+
+    with spans.span("file_write"):
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(generated_content)
+    doc_index.note_write(file_path)
+    task_events.emit(task.id, "file_created", file_name=file_name, path=os.path.relpath(file_path, BASE_DIR))
+
+    crud.update_task_status(
+        db, 
+        task.id, 
+        models.TaskStatus.COMPLETED, 
+        output=f"AI Task Completed. Generated {len(generated_content)} chars."
+    )
+
+    crud.create_log(db, "FILE_CREATED", f"Created file: {file_name} (Task: {task.title})", agent_id=agent.id)
+
+    # Update file list
+    task.output_files = [file_name]
+    task.output_text = generated_content[:500] + "..." # Store preview
+    db.commit()
+
+    # [PROJECT FEEDBACK LOOP]
+    # Complete this step in the project graph; every step whose
+    # predecessors are now all done is enqueued (fan-out / fan-in).
+    if task.project_step_id:
+        feedback_span = spans.start("project_feedback")
+        prefetch.join(project_manager.PREFETCH_JOIN_SECONDS) # Bundles must be stored before the next tasks start
+        next_steps, project_done = project_manager.complete_step(db, task.project_step_id, output_file=os.path.join(agent_name_clean, file_name))
+
+        if next_steps:
+            print(f"DEBUG: Found {len(next_steps)} Next Project Steps.")
+            for step, next_task_obj in next_steps:
+                if next_task_obj:
+                    # Log to Company Log
+                    crud.create_log(db, "PROJECT_UPDATE", f"Step completed. Auto-starting next step for {step.agent_name}: {step.instruction}", agent_id="System")
+                    print(f"DEBUG: Enqueued task {next_task_obj.id}")
+                else:
+                    crud.create_log(db, "PROJECT_ERROR", f"Could not find agent '{step.agent_name}' for next step.", agent_id="System")
+            task_queue.notify()
+        if project_done:
+            print("DEBUG: Project Execution Complete!")
+            crud.create_log(db, "PROJECT_COMPLETE", f"All steps in {os.path.basename(task.project_file or '')} are done.", agent_id="System")
+        spans.finish(feedback_span)
+
+def build_batch_request(db: Session, task: models.Task) -> dict:
+    # Single-turn version of the agent loop's first call (no skills, no context hint)
+    agent = task.agent
+    system_prompt = task_system_prompt(agent, detect_workflow(task.input_prompt))
+    return {
+        "model": agent.model_name,
+        "messages": build_llm_messages(agent, task.input_prompt, db, task_mode="file_generation", system_prompt=system_prompt),
+        "temperature": agent.temperature
+    }
+
+def publish_batch_result(db: Session, task: models.Task, content: str):
+    spans = task_spans.SpanRecorder(task.id, task.agent_id, task.agent.model_name)
+    spans.record("batch_wait", (datetime.utcnow() - task.created_at).total_seconds() * 1000, started_at=task.created_at)
+    publish_task_output(db, task, task.agent, content, spans)
+    task_events.finish(task.id)
+
 def process_task_background(task_id: str):
     # Create new DB Session for this thread
     db = SessionLocal()
+    control = None
+    lease = None
     try:
         # 1. Get Task and Agent
         task = db.query(models.Task).filter(models.Task.id == task_id).first()
         if not task:
             return
         agent = task.agent
+        lease = task.lease_owner # Token of the claim this run belongs to (task_queue.py)
 
         # 2. Get LLM Config
         config = get_llm_config(db)
@@ -450,23 +660,27 @@ def process_task_background(task_id: str):
         # We need to maintain a local history for this multi-step process
         
         # [WORKFLOW DETECTION]
-        # Check if the prompt has [WORKFLOW: xxx]
-        workflow_data = None
-        import re
-        wf_match = re.match(r"\[WORKFLOW:\s*(.*?)\]", task.input_prompt)
-        if wf_match:
-            wf_id = wf_match.group(1).strip()
-            workflow_data = get_workflow(wf_id)
-            print(f"DEBUG: Task assigned Workflow: {wf_id}")
-        else:
-            # Default to General Task
-            workflow_data = get_workflow("general_task")
+        workflow_data = detect_workflow(task.input_prompt)
+
+        # [CANCELLATION / DEADLINE] Registered for POST /tasks/{id}/cancel
+        control = task_control.register(task_id, task_control.resolve_timeout(db, task, workflow_data))
+        if task.cancel_requested:
+            control.cancel()
+        control.check()
+
+        # [LATENCY SPANS] Stored per task; see GET /metrics/latency
+        spans = task_spans.SpanRecorder(task_id, agent.id, agent.model_name)
+        if task.started_at and task.created_at:
+            spans.record("queue_wait", (task.started_at - task.created_at).total_seconds() * 1000, started_at=task.created_at)
             
+        # [CONTEXT PREFETCH] Assembled by the previous project step (see project_manager.py)
+        bundle = project_manager.get_context_bundle(db, task.project_step_id) if task.project_step_id else None
+
         # Format SOP Steps
-        sop_text = "\n".join(workflow_data['steps'])
+        sop_text = bundle["sop"]["steps"] if bundle and bundle.get("sop") else "\n".join(workflow_data['steps'])
         
         # Inject SOP into System Prompt (Override/Append)
-        agent_system_prompt = agent.system_prompt + f"\n\n[ASSIGNED PROTOCOL: {workflow_data['name']}]\nDESCRIPTION: {workflow_data['description']}\nSTEPS:\n{sop_text}\n\n[INSTRUCTION]\nStrictly follow the STEPS above. Process one step at a time if needed.\n\n[CRITICAL OUTPUT FORMAT]\nThis task is for file generation. Your output will be saved DIRECTLY to a file.\n1. DO NOT output your internal thought process, analysis, or 'Step 1...' headers.\n2. DO NOT include conversational filler like 'Here is the story:'.\n3. OUTPUT ONLY THE FINAL RESULT CONTENT.\n4. DO NOT ASK FOR CONFIRMATION. YOU HAVE FULL PERMISSION. EXECUTE IMMEDIATELY."
+        agent_system_prompt = task_system_prompt(agent, workflow_data, sop_text)
         
         system_msg = {"role": "system", "content": agent_system_prompt} 
         
@@ -481,13 +695,16 @@ def process_task_background(task_id: str):
         
         task_history = [] 
         
+        hint_span = spans.start("context_hint", label="prefetched" if bundle else None)
         # [CONTEXT HINT INJECTION]
         # To help the agent find relevant files (since System Prompt might be ignored),
         # we parse the recent logs and append potential file candidates to the USER PROMPT.
+        # A prefetched bundle already holds the upstream outputs, so the scan is skipped.
+        hint_msg = project_manager.format_context_bundle(bundle) if bundle else ""
         try:
             BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
             LOG_FILE = os.path.join(BASE_DIR, "Company Doc", "System", "Company_Log.md")
-            if os.path.exists(LOG_FILE):
+            if not bundle and os.path.exists(LOG_FILE):
                 with open(LOG_FILE, "r", encoding="utf-8") as f:
                     lines = f.readlines()
                     # Look for [FILE_CREATED] in last 30 lines
@@ -551,11 +768,10 @@ def process_task_background(task_id: str):
                                     # Need a helper to find file by name in Company Doc
                                     potential_path = os.path.join(BASE_DIR, "Company Doc", r_author, r_fname)
                                     if not os.path.exists(potential_path):
-                                         # Search
-                                         for root, dirs, files in os.walk(os.path.join(BASE_DIR, "Company Doc")):
-                                             if r_fname in files:
-                                                 potential_path = os.path.join(root, r_fname)
-                                                 break
+                                         # Search (file index, no tree walk)
+                                         matches = doc_index.index.find_by_name(r_fname)
+                                         if matches:
+                                             potential_path = doc_index.index.abspath(matches[0])
                                     
                                     if os.path.exists(potential_path):
                                         with open(potential_path, "r", encoding="utf-8") as pf:
@@ -584,10 +800,9 @@ def process_task_background(task_id: str):
                                 # Find path
                                 potential_path = os.path.join(BASE_DIR, "Company Doc", lf_author, lf_fname)
                                 if not os.path.exists(potential_path):
-                                     for root, dirs, files in os.walk(os.path.join(BASE_DIR, "Company Doc")):
-                                         if lf_fname in files:
-                                             potential_path = os.path.join(root, lf_fname)
-                                             break
+                                     matches = doc_index.index.find_by_name(lf_fname)
+                                     if matches:
+                                         potential_path = doc_index.index.abspath(matches[0])
                                              
                                 if os.path.exists(potential_path):
                                     with open(potential_path, "r", encoding="utf-8") as pf:
@@ -603,12 +818,38 @@ def process_task_background(task_id: str):
             print(f"DEBUG: Failed to inject context hint: {e}")
             hint_msg = ""
             
+        spans.finish(hint_span)
+
+        from .skill_dispatcher import SkillDispatcher, skill_name_of, call_signature
         generated_image_files = []
-        last_skill_call = None
+        executed_calls = set() # call_signature of every skill call already run
         total_skills_executed = 0
+
+        # [CHECKPOINT RESUME]
+        # Replay the turns a previous attempt already finished (crash / requeue)
+        # instead of paying the provider for them again.
+        start_turn = 0
+        for step in crud.get_task_steps(db, task_id):
+            task_history.extend(step.messages or [])
+            generated_image_files.extend(step.image_files or [])
+            if step.skill_tag:
+                executed_calls.update(call_signature(t.raw) for t in tag_tokenizer.iter_tags(step.skill_tag, ("CALL_SKILL",)))
+                total_skills_executed += 1
+            if step.is_final:
+                final_content = step.response_text or ""
+                start_turn = match_limit # Only the file write was missing
+            else:
+                start_turn = step.turn + 1
+        if start_turn:
+            print(f"DEBUG: Task {task_id} resumes after {start_turn} checkpointed turn(s).")
+            task_events.emit(task_id, "resume", completed_turns=start_turn)
         
-        for turn in range(match_limit):
+        for turn in range(start_turn, match_limit):
+            control.check() # Cooperative stop between turns
             print(f"DEBUG: Background Task Turn {turn+1}. Prompt: {task.input_prompt[:50]}...")
+            history_mark = len(task_history)
+            images_mark = len(generated_image_files)
+            task_events.emit(task_id, "turn_start", turn=turn + 1)
             
             # Construct Effective Prompt
             effective_prompt = ""
@@ -621,13 +862,19 @@ def process_task_background(task_id: str):
                 # Subsequent turns
                 effective_prompt = "Continue/Result: ..."
             
-            response_text = call_llm_service(
+            # Runs on a helper thread so cancel/deadline interrupt a slow request
+            response_text = control.call(
+                _stream_task_llm,
+                control,
+                spans,
+                time.perf_counter(),
+                task_id,
+                turn,
                 agent, 
                 effective_prompt, 
                 config, 
-                db=db, 
-                task_mode="background_worker",
-                history=task_history
+                db, 
+                task_history
             )
             
             # Check for External System Errors
@@ -637,86 +884,106 @@ def process_task_background(task_id: str):
                 if turn == 0:
                     print("Retrying Turn 0 with re-phrased prompt...")
                     current_prompt = "Execute this task: " + task.input_prompt
-                    response_text = call_llm_service(agent, current_prompt, config, db=db, task_mode="background_worker", history=[])
+                    response_text = control.call(_stream_task_llm, control, spans, time.perf_counter(), task_id, turn, agent, current_prompt, config, db, [])
                 else:
                     pass
 
             # Check for Skills
-            from .skill_dispatcher import SkillDispatcher
             dispatcher = SkillDispatcher(db, agent)
             
             result_text = response_text
             executed_any = False
+            skill_tag = None
             
-            # Parse ALL tags in this response
+            # Parse ALL tags in this response; they run together (bounded pool,
+            # per-skill timeouts) and come back as one observation message.
             import re
-            while True:
-                match = re.search(r"\[\[CALL_SKILL:\s*(.*?)\]\]", result_text, re.DOTALL)
-                if not match:
-                    break
-                
-                tag_string = match.group(0)
-                print(f"DEBUG: Found tag: {tag_string}")
-                
-                skill_result, executed = dispatcher.parse_and_execute(tag_string, config)
-                
+            tags = dispatcher.find_skill_tags(result_text)
+            if tags:
+                print(f"DEBUG: Found {len(tags)} tag(s): {tags}")
                 executed_any = True
-                
-                # [LOOP PREVENTION]
-                current_skill_signature = tag_string
-                if current_skill_signature == last_skill_call:
-                    print(f"DEBUG: Detected Repetitive Skill Call '{tag_string}'. Aborting Loop.")
+                skill_tag = "\n".join(tags)
+
+                # [LOOP PREVENTION] Per call: a call made in any earlier turn is not run
+                # again, even when the response also contains new calls
+                repeated = [tag for tag in tags if call_signature(tag) in executed_calls]
+                new_tags = [tag for tag in tags if tag not in repeated]
+                if not new_tags:
+                    print(f"DEBUG: Detected Repetitive Skill Call '{skill_tag}'. Aborting Loop.")
                     
                     # specific guidance
                     advice = "You are repeating yourself. Stopping execution."
-                    if "read_file" in tag_string:
+                    if "read_file" in skill_tag:
                         advice = "You have already read this file. The content is visible in the history above. DO NOT READ IT AGAIN. Proceed immediately to the next step (e.g., generate image or write content)."
-                    elif "image_generation" in tag_string:
+                    elif "image_generation" in skill_tag:
                         advice = "You have already generated the image. The system has captured it. DO NOT GENERATE AGAIN. Output the final response now."
                     
                     task_history.append({"role": "user", "content": f"[SYSTEM]: {advice}"})
-                    break 
-                last_skill_call = current_skill_signature
+                else:
+                    if repeated:
+                        print(f"DEBUG: Skipping {len(repeated)} repeated skill call(s): {repeated}")
+                    skill_spans = {}
 
-                # [IMAGE OUTPUT CAPTURE]
-                skill_res_str = str(skill_result)
-                
-                # DEBUG LOGGING (Commented out to reduce noise in System Log)
-                print(f"DEBUG: Skill Execution Result: {skill_res_str}")
-                # try:
-                #     crud.create_log(db, "SKILL_DEBUG", f"Agent {agent.name} executed {tag_string}. Result: {skill_res_str[:200]}...", agent_id=agent.id)
-                # except:
-                #     pass
-
-                if "image_generation" in tag_string:
-                    # 1. Check for explicit path format "Image generated at: ..."
-                    if "Image generated at" in skill_res_str:
-                        try:
-                            img_path = skill_res_str.split(": ")[1].strip()
-                            generated_image_files.append(img_path)
-                            print(f"DEBUG: Captured Image (Explicit): {img_path}")
-                        except:
-                            pass
-                    # 2. Check for Markdown format "![...](path)"
-                    else:
-                        match_md = re.search(r"!\[.*?\]\((.*?)\)", skill_res_str)
-                        if match_md:
-                            img_path = match_md.group(1).strip()
-                            # If path is URL, we might exclude it if we only want local files?
-                            # But builtins.py returns "assets/img.png" for local files.
-                            if "assets/" in img_path:
-                                generated_image_files.append(img_path)
-                                print(f"DEBUG: Captured Image (Markdown): {img_path}")
-                
-                # Add to history
-                task_history.append({"role": "assistant", "content": tag_string})
-                task_history.append({"role": "user", "content": f"System Output: {skill_result}"})
-                
-                break 
+                    def _on_skill_start(tag):
+                        skill_spans[tag] = spans.start("skill", label=skill_name_of(tag))
+                        task_events.emit(task_id, "skill_call", turn=turn + 1, tag=task_events.summarize(tag))
+
+                    def _on_skill_result(tag, result, executed):
+                        span = skill_spans.pop(tag, None)
+                        if span:
+                            spans.finish(span, "error" if str(result).startswith("[ERROR") else "ok")
+                        task_events.emit(task_id, "skill_result", turn=turn + 1, executed=executed, summary=task_events.summarize(result))
+
+                    executed_results = control.call(
+                        dispatcher.execute_all,
+                        new_tags,
+                        config,
+                        on_start=_on_skill_start,
+                        on_result=_on_skill_result
+                    )
+                    executed_calls.update(call_signature(tag) for tag in new_tags)
+                    by_tag = {tag: (result, executed) for tag, result, executed in executed_results}
+                    skipped = ("[SKIPPED: This exact call already ran in an earlier turn; its result is in the history above. Do not repeat it.]", False)
+                    skill_results = [(tag,) + by_tag.get(tag, skipped) for tag in tags]
+
+                    for tag_string, skill_result, executed in skill_results:
+                        # [IMAGE OUTPUT CAPTURE]
+                        skill_res_str = str(skill_result)
+                        
+                        # DEBUG LOGGING (Commented out to reduce noise in System Log)
+                        print(f"DEBUG: Skill Execution Result: {skill_res_str}")
+                        # try:
+                        #     crud.create_log(db, "SKILL_DEBUG", f"Agent {agent.name} executed {tag_string}. Result: {skill_res_str[:200]}...", agent_id=agent.id)
+                        # except:
+                        #     pass
+
+                        if "image_generation" in tag_string:
+                            # 1. Check for explicit path format "Image generated at: ..."
+                            if "Image generated at" in skill_res_str:
+                                try:
+                                    img_path = skill_res_str.split(": ")[1].strip()
+                                    generated_image_files.append(img_path)
+                                    print(f"DEBUG: Captured Image (Explicit): {img_path}")
+                                except:
+                                    pass
+                            # 2. Check for Markdown format "![...](path)"
+                            else:
+                                match_md = re.search(r"!\[.*?\]\((.*?)\)", skill_res_str)
+                                if match_md:
+                                    img_path = match_md.group(1).strip()
+                                    # If path is URL, we might exclude it if we only want local files?
+                                    # But builtins.py returns "assets/img.png" for local files.
+                                    if "assets/" in img_path:
+                                        generated_image_files.append(img_path)
+                                        print(f"DEBUG: Captured Image (Markdown): {img_path}")
+                    
+                    # Add to history (all calls, then one consolidated observation)
+                    task_history.append({"role": "assistant", "content": skill_tag})
+                    task_history.append({"role": "user", "content": dispatcher.format_observation(skill_results)})
             
+            is_final_turn = False
             if executed_any:
                 total_skills_executed += 1
-                continue 
             else:
                 # No skills called. Check for content.
                 # RELAXED RULE: If we have executed AT LEAST ONE skill previously (e.g. read file, generated image),
@@ -729,11 +996,25 @@ def process_task_background(task_id: str):
                      print(f"DEBUG: No skill triggered in Turn {turn+1} AND content too short AND no prior work. Forcing retry.")
                      task_history.append({"role": "assistant", "content": response_text})
                      task_history.append({"role": "user", "content": "[SYSTEM ERROR]: You failed to take action. You are a Background Worker. You MUST using a [[CALL_SKILL]] tag to proceed. Do not just talk. Execute now."})
-                     continue
-                
-                # Otherwise, accept as final content
-                print(f"DEBUG: No skills triggered. Final Response: {result_text[:100]}...")
-                final_content = response_text
+                else:
+                    # Otherwise, accept as final content
+                    print(f"DEBUG: No skills triggered. Final Response: {result_text[:100]}...")
+                    final_content = response_text
+                    is_final_turn = True
+
+            # [CHECKPOINT] Persist this turn so a retry resumes after it
+            crud.save_task_step(
+                db,
+                task_id,
+                turn,
+                response_text,
+                task_history[history_mark:],
+                skill_tag=skill_tag,
+                image_files=generated_image_files[images_mark:],
+                is_final=is_final_turn
+            )
+            task_events.emit(task_id, "turn_end", turn=turn + 1, skill=skill_tag is not None, final=is_final_turn)
+            if is_final_turn:
                 break
         
         # [FINAL CONTENT ASSEMBLER]
@@ -747,90 +1028,20 @@ def process_task_background(task_id: str):
                 final_content += f"![Generated Image]({img})\n"
                 
         generated_content = final_content if final_content else "No content generated."
+        control.check() # Do not publish a file for a cancelled task
              
         # 5. Save to File
-        # ... (rest of saving logic)
-        
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        agent_name_clean = "".join([c for c in agent.name if c.isalnum() or c in (' ', '-', '_', '(', ')')]).strip()
-        OUTPUT_DIR = os.path.join(BASE_DIR, "Company Doc", agent_name_clean)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
-        timestamp = int(time.time())
-        clean_title = "".join([c for c in task.title if c.isalnum() or c in (' ', '-', '_')]).strip().replace(' ', '_')
-        file_name = f"{clean_title}_{task_id[:8]}.md"
-        file_path = os.path.join(OUTPUT_DIR, file_name)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(generated_content)
-            
-        crud.update_task_status(
-            db, 
-            task_id, 
-            models.TaskStatus.COMPLETED, 
-            output=f"AI Task Completed. Generated {len(generated_content)} chars."
-        )
-
-        crud.create_log(db, "FILE_CREATED", f"Created file: {file_name} (Task: {task.title})", agent_id=agent.id)
-            
-        # Update file list
-        task.output_files = [file_name]
-        task.output_text = generated_content[:500] + "..." # Store preview
-        db.commit()
-            
-        # [PROJECT FEEDBACK LOOP]
-        if task.project_file and os.path.exists(task.project_file):
-            print(f"DEBUG: Updating Project File: {task.project_file}")
-            
-            # 1. Mark Step as Completed
-            # We assume the step instruction is contained in task.input_prompt
-            # But task.input_prompt might be long.
-            # However, 'mark_step_completed' matches partial content.
-            # Since we generated the task FROM the step text, it should match.
-            project_manager.mark_step_completed(task.project_file, task.input_prompt[:50]) # Match first 50 chars
-            
-            # 2. Get Next Step(s)
-            next_steps = project_manager.get_pending_steps(task.project_file) # Returns list (1 or many)
-            
-            if next_steps:
-                print(f"DEBUG: Found {len(next_steps)} Next Project Steps.")
-                
-                # Iterate and spawn parallel if needed
-                import threading
-
-                for step_str in next_steps:
-                    # Parse "Agent: Instruction"
-                    if ":" in step_str:
-                        target_name, instruction = step_str.split(":", 1)
-                        target_name = target_name.strip()
-                        instruction = instruction.strip()
-                        
-                        # Find Agent
-                        target_agent = db.query(models.Agent).filter(models.Agent.name.contains(target_name)).first()
-                        if target_agent:
-                            # Create Next Task
-                            new_task = schemas.TaskCreate(
-                                title=f"Project Task: {target_name}",
-                                input_prompt=instruction,
-                                agent_id=target_agent.id,
-                                project_file=task.project_file 
-                            )
-                            
-                            next_task_obj = crud.create_task(db, new_task)
-                            
-                            # Log to Company Log
-                            crud.create_log(db, "PROJECT_UPDATE", f"Step completed. Auto-starting next step for {target_name}: {instruction}", agent_id="System")
-                            
-                            # Spawn Thread
-                            t = threading.Thread(target=process_task_background, args=(next_task_obj.id,))
-                            t.start()
-                            print(f"DEBUG: Spawned thread for task {next_task_obj.id}")
-                        else:
-                            crud.create_log(db, "PROJECT_ERROR", f"Could not find agent '{target_name}' for next step.", agent_id="System")
-            else:
-                print("DEBUG: Project Execution Complete!")
-                crud.create_log(db, "PROJECT_COMPLETE", f"All steps in {os.path.basename(task.project_file)} are done.", agent_id="System")
+        publish_task_output(db, task, agent, generated_content, spans)
             
+    except task_control.TaskCancelled:
+        _finish_stopped_task(task_id, lease, models.TaskStatus.CANCELLED, "Task cancelled by user.")
+    except task_control.TaskTimedOut as e:
+        _finish_stopped_task(task_id, lease, models.TaskStatus.TIMED_OUT, f"Task timed out: {e}")
+    except StaleDataError:
+        # Our lease expired and the task was requeued/claimed elsewhere:
+        # the new owner's state wins, discard this run.
+        db.rollback()
+        print(f"DEBUG: Task {task_id} lease lost (version changed). Result discarded.")
     except Exception as e:
         error_msg = f"AI Execution Failed: {str(e)}"
         print(error_msg)
@@ -848,8 +1059,14 @@ def process_task_background(task_id: str):
             models.TaskStatus.FAILED, 
             output=error_msg + " (See outputs/error_log.txt)"
         )
+        project_manager.fail_step_for_task(db, task_id)
     finally:
-        db.close()
+        task_events.finish(task_id)
+        if control is not None:
+            task_control.unregister(task_id)
+            control.close_session(db)
+        else:
+            db.close()
 
 
 # --- Agent Endpoints ---
@@ -857,6 +1074,17 @@ def process_task_background(task_id: str):
 def create_agent(agent: schemas.AgentCreate, db: Session = Depends(get_db)):
     return crud.create_agent(db=db, agent=agent)
 
+@app.post("/agents/bulk", response_model=List[schemas.Agent])
+def create_agents_bulk(agents: List[schemas.AgentCreate], db: Session = Depends(get_db)):
+    return crud.create_agents(db=db, agents=agents)
+
+@app.put("/agents/bulk/skills", response_model=List[schemas.Agent])
+def update_agents_skills_bulk(update: schemas.AgentSkillsBulkUpdate, db: Session = Depends(get_db)):
+    agents, missing = crud.set_agents_skills(db, agent_ids=update.agent_ids, skill_ids=update.skills)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Agents not found: {', '.join(missing)}")
+    return agents
+
 @app.get("/agents/", response_model=List[schemas.Agent])
 def read_agents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     agents = crud.get_agents(db, skip=skip, limit=limit)
@@ -926,47 +1154,37 @@ def chat_with_agent(chat_request: schemas.ChatRequest, db: Session = Depends(get
         def event_generator():
             full_content = ""
             try:
-                for line in response.iter_lines():
-                    if line:
-                        decoded = line.decode('utf-8')
-                        if decoded.startswith("data: "):
-                            content = decoded[6:]
-                            if content == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(content)
-                                delta = data['choices'][0]['delta'].get('content', "")
-                                if delta:
-                                    full_content += delta
-                                    yield delta
-                            except:
-                                pass
+                for delta in _iter_llm_deltas(response):
+                    full_content += delta
+                    yield delta
             except Exception as e:
                 yield f"[ERROR: {str(e)}]"
             
             # Post-processing: Check for [[LOG:...]] and [[EXECUTE_TASK:...]]
             try:
-                import re
+                # One pass over the reply; first tag of each kind wins
+                found = {}
+                for tag in tag_tokenizer.iter_tags(full_content, ("LOG", "EXECUTE_TASK", "CREATE_PROJECT")):
+                    found.setdefault(tag.kind, tag)
                 
                 # 1. Auto-Log
-                match_log = re.search(r"\[\[LOG:(.*?)\]\]", full_content, re.DOTALL)
+                match_log = found.get("LOG")
                 if match_log:
-                    log_text = match_log.group(1).strip()
+                    log_text = match_log.body
                     crud.create_log(db, "MEETING_LOG", log_text, agent_id=agent.id)
                     
                 # 2. Execute Task (Single)
-                match_task = re.search(r"\[\[EXECUTE_TASK:(.*?)\|(.*?)\]\]", full_content, re.DOTALL)
-                if match_task:
-                    title = match_task.group(1).strip()
-                    prompt = match_task.group(2).strip()
+                match_task = found.get("EXECUTE_TASK")
+                if match_task and len(match_task.args) >= 2:
+                    title = match_task.args[0]
+                    prompt = match_task.body.split("|", 1)[1].strip()
                     # (Legacy support, maybe unused now consistent with DELEGATE)
                     pass
 
                 # 3. Create Project & Auto-Delegate First Step
-                match_proj = re.search(r"\[\[CREATE_PROJECT:(.*?)\]\]", full_content, re.DOTALL)
+                match_proj = found.get("CREATE_PROJECT")
                 if match_proj:
-                    content = match_proj.group(1).strip()
-                    parts = [p.strip() for p in content.split("|")]
+                    parts = list(match_proj.args)
                     if len(parts) >= 2:
                         title = parts[0]
                         
@@ -987,44 +1205,24 @@ def chat_with_agent(chat_request: schemas.ChatRequest, db: Session = Depends(get
                             else:
                                 steps = parts[2:] # Maybe just a title and weird arg
 
-                        # 1. Create File
-                        proj_path = project_manager.create_project_file(title, steps, is_sequential=is_seq)  
+                        # 1. Create Project (DB graph + rendered Markdown view)
+                        try:
+                            project = project_manager.create_project(db, title, steps, is_sequential=is_seq)
+                        except project_manager.ProjectError as e:
+                            yield f"\n\n⚠️ **Project Error**: {e}\n"
+                            return
                         mode_str = "Strict Sequential" if is_seq else "Parallel Execution"
-                        yield f"\n\n🚀 **Project Created**: `{os.path.basename(proj_path)}` ({mode_str})\n"
+                        yield f"\n\n🚀 **Project Created**: `{os.path.basename(project.file_path)}` ({mode_str})\n"
                         
-                        # 2. Get Next Step
-                        next_step = project_manager.get_next_pending_step(proj_path)
-                        if next_step:
-                            # Parse "Agent: Instruction"
-                            if ":" in next_step:
-                                target_name, instruction = next_step.split(":", 1)
-                                target_name = target_name.strip()
-                                instruction = instruction.strip()
-                                
-                                # Find Agent ID
-                                all_agents = crud.get_agents(db) # We are inside a dependency scope? Yes, db is available.
-                                target_agent = next(
-                                    (a for a in all_agents if target_name in a.name or a.name in target_name), 
-                                    None
-                                )
-                                
-                                if target_agent:
-                                    # Create Task linked to Project
-                                    new_task = schemas.TaskCreate(
-                                        title=f"Project Task: {target_name}",
-                                        input_prompt=instruction,
-                                        agent_id=target_agent.id,
-                                        project_file=proj_path # LINKED!
-                                    )
-                                    db_task = crud.create_task(db, new_task)
-                                    
-                                    import threading
-                                    t = threading.Thread(target=process_task_background, args=(db_task.id,))
-                                    t.start()
-                                    
-                                    yield f"👉 **Auto-Started Step 1**: Delegated to `{target_name}`\n"
-                                else:
-                                    yield f"⚠️ **Error**: Could not find agent '{target_name}' for Step 1.\n"
+                        # 2. Start every step without predecessors
+                        started = project_manager.dispatch_ready_steps(db, project.id)
+                        for step, step_task in started:
+                            if step_task:
+                                yield f"👉 **Auto-Started Step `{step.key}`**: Delegated to `{step.agent_name}`\n"
+                            else:
+                                yield f"⚠️ **Error**: Could not find agent '{step.agent_name}' for step `{step.key}`.\n"
+                        if started:
+                            task_queue.notify()
                         else:
                             yield "✅ **Project Complete** (No steps?)\n"
 
@@ -1039,23 +1237,139 @@ def chat_with_agent(chat_request: schemas.ChatRequest, db: Session = Depends(get
 
 # --- Task Endpoints ---
 @app.post("/tasks/", response_model=schemas.Task)
-def create_task(
-    task: schemas.TaskCreate, 
-    background_tasks: BackgroundTasks, 
-    db: Session = Depends(get_db)
-):
+def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
     agent = crud.get_agent(db, agent_id=task.agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    db_task = crud.create_task(db=db, task=task)
-    # BackgroundTasks handling - remove db argument
-    background_tasks.add_task(process_task_background, db_task.id)
+    # Persisted as PENDING; a worker from the pool claims it. An identical
+    # submission within the dedup window returns the earlier task instead.
+    db_task = crud.create_task(db=db, task=task, window_seconds=crud.dedup_window_seconds(db))
+    if db_task.reused:
+        print(f"DEBUG: Duplicate task submission, reusing {db_task.id} ({db_task.reused})")
+    else:
+        task_queue.notify()
     return db_task
 
+@app.post("/tasks/batch", response_model=List[schemas.Task])
+def create_batch_tasks(batch: schemas.TaskBatchCreate, db: Session = Depends(get_db)):
+    # Deferred: submitted through the provider batch API by batch_runner.py.
+    # Gemini agents have no batch interface here and go to the queue as bulk.
+    agents = {a.id: a for a in db.query(models.Agent).filter(models.Agent.id.in_({t.agent_id for t in batch.tasks})).all()}
+    missing = sorted({t.agent_id for t in batch.tasks if t.agent_id not in agents})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Agents not found: {', '.join(missing)}")
+
+    window_seconds = crud.dedup_window_seconds(db)
+    created = []
+    for task in batch.tasks:
+        batchable = agents[task.agent_id].provider != "gemini"
+        task.priority = schemas.TaskPriority.BATCH if batchable else schemas.TaskPriority.BULK
+        created.append(crud.create_task(db=db, task=task, window_seconds=window_seconds))
+    batch_runner.notify()
+    task_queue.notify()
+    return created
+
+@app.get("/batches/", response_model=List[schemas.TaskBatch])
+def read_batches(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return batch_runner.get_batches(db, skip=skip, limit=limit)
+
+@app.post("/batches/flush", response_model=List[schemas.TaskBatch])
+def flush_batches():
+    # Submit all waiting batch tasks now instead of waiting for batch_min_size
+    return batch_runner.flush()
+
+@app.get("/batches/{batch_id}", response_model=schemas.TaskBatch)
+def read_batch(batch_id: str, db: Session = Depends(get_db)):
+    batch = batch_runner.get_batch(db, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
 @app.get("/tasks/", response_model=List[schemas.Task])
 def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_tasks(db, skip=skip, limit=limit)
+    tasks = crud.get_tasks(db, skip=skip, limit=limit)
+    return task_queue.annotate_queue(db, tasks)
+
+@app.post("/tasks/{task_id}/cancel", response_model=schemas.Task)
+def cancel_task(task_id: str, db: Session = Depends(get_db)):
+    db_task = crud.request_task_cancel(db, task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if db_task.status == models.TaskStatus.RUNNING.value:
+        # Same process: stop now; other workers see the flag within seconds
+        task_control.signal_cancel(task_id)
+    elif db_task.status == models.TaskStatus.CANCELLED.value:
+        # Cancelled before start: its project step (if any) will never run
+        project_manager.fail_step_for_task(db, task_id)
+    else:
+        raise HTTPException(status_code=409, detail=f"Task already {db_task.status}")
+    return db_task
+
+@app.get("/tasks/{task_id}/events")
+def stream_task_events(task_id: str, last_event_id: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    # Server-Sent Events: turn start/end, skill calls/results, partial output, created file
+    if crud.get_task(db, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    return StreamingResponse(
+        task_events.stream(task_id, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/tasks/{task_id}/spans", response_model=List[schemas.TaskSpan])
+def read_task_spans(task_id: str, db: Session = Depends(get_db)):
+    if crud.get_task(db, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task_spans.get_task_spans(db, task_id)
+
+@app.get("/tasks/{task_id}", response_model=schemas.Task)
+def read_task(task_id: str, db: Session = Depends(get_db)):
+    db_task = crud.get_task(db, task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task_queue.annotate_queue(db, [db_task])[0]
+
+# --- Project Endpoints ---
+@app.get("/projects/", response_model=List[schemas.Project])
+def read_projects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return project_manager.get_projects(db, skip=skip, limit=limit)
+
+@app.get("/projects/{project_id}", response_model=schemas.Project)
+def read_project(project_id: str, db: Session = Depends(get_db)):
+    project = project_manager.get_project(db, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+# --- Metrics Endpoints ---
+@app.get("/metrics/latency", response_model=List[schemas.LatencyStats])
+def read_latency_stats(group_by: str = "agent", span: Optional[str] = None, hours: float = 24, db: Session = Depends(get_db)):
+    # p50/p95/p99 of task spans per agent, model or skill
+    if group_by not in task_spans.GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(task_spans.GROUP_COLUMNS)}")
+    return task_spans.aggregate(db, group_by=group_by, span_name=span, hours=hours)
+
+@app.get("/metrics/skill-cache", response_model=List[schemas.SkillCacheStats])
+def read_skill_cache_stats():
+    # Hit rates of the skills registered with cache= (this process)
+    return skills.SkillRegistry.cache_stats()
+
+@app.get("/metrics/skill-pools", response_model=List[schemas.SkillPoolStats])
+def read_skill_pool_stats():
+    # Skill bulkheads: timed-out sync calls still holding a pool thread (this process)
+    from .skill_dispatcher import pool_stats
+    return pool_stats()
+
+# --- Document Search ---
+@app.get("/docs/search", response_model=List[schemas.DocSearchHit])
+def search_company_docs(q: str, limit: int = doc_search.DEFAULT_LIMIT, author: Optional[str] = None):
+    # Ranked snippets from the FTS5 index of Company Doc (see doc_search.py)
+    try:
+        return doc_search.search(q, limit=limit, author=author)
+    except doc_search.SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Document search unavailable: {e}")
 
 # --- Settings Endpoints ---
 @app.post("/settings/")
@@ -1074,6 +1388,14 @@ def read_setting(key: str, db: Session = Depends(get_db)):
 def read_skills(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     return crud.get_skills(db, skip=skip, limit=limit)
 
+@app.post("/skills/reload")
+def reload_skills():
+    # Re-register changed plugins now (the watcher does this on its own)
+    summary = skill_watcher.reload_now()
+    if summary is None:
+        return {"generation": skills.SkillRegistry.generation, "added": [], "changed": [], "removed": [], "failed": []}
+    return summary
+
 # --- Log Endpoints ---
 @app.post("/logs/decision", response_model=schemas.SystemLog)
 def log_decision(log: schemas.LogCreate, db: Session = Depends(get_db)):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Float, DateTime, ForeignKey, Table, Enum, Integer
+from sqlalchemy import Column, String, Text, Float, DateTime, ForeignKey, Table, Enum, Integer, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.sqlite import JSON
 import uu
@@ -12,6 +12,15 @@ class TaskStatus(str, enum.Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled" # Stopped by POST /tasks/{id}/cancel
+    TIMED_OUT = "timed_out" # Exceeded its wall-clock deadline
+
+class TaskPriority(str, enum.Enum):
+    # Scheduling classes, highest first (see task_queue.py)
+    INTERACTIVE = "interactive" # Meeting room / console delegations
+    PROJECT = "project"         # Auto-started project steps
+    BULK = "bulk"               # Batch / mass generation
+    BATCH = "batch"             # Deferred: provider batch API, never claimed by workers (see batch_runner.py)
 
 # Association Object for Many-to-Many relationship with extra columns
 class AgentSkill(Base):
@@ -92,17 +101,163 @@ class Task(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String)
     agent_id = Column(String, ForeignKey('agents.id'))
-    status = Column(String, default=TaskStatus.PENDING.value)
+    status = Column(String, default=TaskStatus.PENDING.value, index=True)
     input_prompt = Column(Text)
     output_text = Column(Text, nullable=True)
     output_files = Column(JSON, nullable=True)
     project_file = Column(String, nullable=True) # Link to Project Markdown File
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     finished_at = Column(DateTime, nullable=True)
 
+    # Queue / Lease (see task_queue.py)
+    lease_owner = Column(String, nullable=True) # Worker holding the task
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    priority = Column(String, default=TaskPriority.INTERACTIVE.value)
+    started_at = Column(DateTime, nullable=True) # Claimed by a worker
+    version = Column(Integer, default=0, nullable=False) # Optimistic concurrency
+
+    # Cancellation / Deadline (see task_control.py)
+    cancel_requested = Column(Integer, default=0) # 1 = stop at the next check
+    timeout_seconds = Column(Integer, nullable=True) # Wall-clock limit from start
+
+    # Project Engine (see project_manager.py)
+    project_step_id = Column(String, ForeignKey('project_steps.id'), nullable=True, index=True)
+    # Hash of (agent, workflow, normalized prompt, project) for deduplication
+    fingerprint = Column(String, nullable=True, index=True)
+    # Fingerprint of a task created under deduplication (not forced); unique
+    # among pending/running tasks, so concurrent processes insert it once
+    dedup_key = Column(String, nullable=True)
+    # Provider batch the task was submitted in (priority "batch" only)
+    batch_id = Column(String, ForeignKey('task_batches.id'), nullable=True, index=True)
+
     # Relationships
     agent = relationship("Agent", back_populates="tasks")
 
+    # Every ORM UPDATE checks and bumps `version` (StaleDataError on mismatch)
+    __mapper_args__ = {"version_id_col": version}
+
+ACTIVE_TASK_FILTER = text("status IN ('pending', 'running')")
+# Partial unique index (see crud.create_task); init_db adds it to existing databases
+TASK_DEDUP_INDEX = Index(
+    "uq_tasks_active_dedup_key", Task.dedup_key, unique=True,
+    sqlite_where=ACTIVE_TASK_FILTER, postgresql_where=ACTIVE_TASK_FILTER
+)
+
+class ProjectStatus(str, enum.Enum):
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class StepStatus(str, enum.Enum):
+    WAITING = "waiting"     # Predecessors not completed yet
+    QUEUED = "queued"       # Task created (pending or running)
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class Project(Base):
+    """Multi-step project; the Markdown file in Company Doc/Projects is rendered from this."""
+    __tablename__ = "projects"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    title = Column(String)
+    file_path = Column(String, nullable=True) # Rendered Markdown view
+    is_sequential = Column(Integer, default=1)
+    status = Column(String, default=ProjectStatus.IN_PROGRESS.value, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    steps = relationship("ProjectStep", back_populates="project", order_by="ProjectStep.position")
+
+class ProjectStep(Base):
+    """One node of a project's dependency graph (DAG)."""
+    __tablename__ = "project_steps"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    project_id = Column(String, ForeignKey('projects.id'), index=True)
+    key = Column(String) # Step id within the project (e.g. "s1", "draft")
+    position = Column(Integer)
+    agent_name = Column(String)
+    instruction = Column(Text)
+    depends_on = Column(JSON, default=list) # Keys of predecessor steps
+    status = Column(String, default=StepStatus.WAITING.value, index=True)
+    task_id = Column(String, nullable=True) # Task executing this step
+    output_file = Column(String, nullable=True)
+    context_bundle = Column(JSON, nullable=True) # Prefetched by the predecessor (see project_manager.py)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    project = relationship("Project", back_populates="steps")
+
+class TaskStep(Base):
+    """
+    Checkpoint of one completed agent-loop turn (see process_task_background).
+    A retried task replays these instead of calling the provider again.
+    """
+    __tablename__ = "task_steps"
+
+    task_id = Column(String, ForeignKey('tasks.id'), primary_key=True)
+    turn = Column(Integer, primary_key=True)
+    response_text = Column(Text, nullable=True) # Raw LLM output of this turn
+    messages = Column(JSON, nullable=True) # Entries appended to the task history
+    skill_tag = Column(Text, nullable=True) # CALL_SKILL tag executed (if any)
+    image_files = Column(JSON, nullable=True) # Assets captured this turn
+    is_final = Column(Integer, default=0) # 1 = response_text is the final content
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TaskEvent(Base):
+    """Progress event of a task, streamed by GET /tasks/{id}/events (see task_events.py)."""
+    __tablename__ = "task_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True) # Doubles as the SSE event id
+    task_id = Column(String, ForeignKey('tasks.id'), index=True)
+    event_type = Column(String) # turn_start, token, skill_call, skill_result, turn_end, file_created, task_end
+    data = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TaskSpan(Base):
+    """Timed section of a task run (see task_spans.py)."""
+    __tablename__ = "task_spans"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, ForeignKey('tasks.id'), index=True)
+    agent_id = Column(String, index=True)
+    model_name = Column(String, nullable=True)
+    name = Column(String, index=True) # queue_wait, context_hint, llm_call, skill, file_write, project_feedback
+    label = Column(String, nullable=True) # Skill name / turn
+    status = Column(String, default="ok") # ok / error:<Type>
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    duration_ms = Column(Float)
+    queue_wait_ms = Column(Float, nullable=True) # llm_call: handoff before the request starts
+    ttfb_ms = Column(Float, nullable=True) # llm_call: time to first streamed token
+    tokens = Column(Integer, nullable=True) # llm_call: output tokens from the provider's usage block
+
+class BatchStatus(str, enum.Enum):
+    PREPARING = "preparing"   # Tasks reserved, request file not accepted yet
+    SUBMITTED = "submitted"   # Provider batch running
+    COLLECTING = "collecting" # One process is writing the results
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class TaskBatch(Base):
+    """Group of batch-priority tasks submitted as one provider batch (see batch_runner.py)."""
+    __tablename__ = "task_batches"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = Column(String, default=BatchStatus.PREPARING.value, index=True)
+    provider_batch_id = Column(String, nullable=True)
+    input_file_id = Column(String, nullable=True)
+    output_file_id = Column(String, nullable=True)
+    provider_status = Column(String, nullable=True) # validating / in_progress / completed / expired / ...
+    request_count = Column(Integer, default=0)
+    completed_count = Column(Integer, default=0)
+    requeued_count = Column(Integer, default=0) # Sent back to the worker queue at bulk priority
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
 class Setting(Base):
     __tablename__ = "settings"
     
@@ -1,91 +1,578 @@
+"""
+Project engine: multi-step projects as a dependency graph.
+
+State lives in the `projects` / `project_steps` tables. Every step has an
+explicit key and the keys of the steps it depends on:
+
+- Sequential projects: each step depends on the previous one (default).
+- Parallel projects: steps without declared dependencies start at once.
+- A step can declare its own key and predecessors with a prefix, e.g.
+  `[review](after: draft, art) 小芳: Review the draft and the artwork`.
+  Such a fan-in step waits until *all* predecessors are completed.
+
+Transitions are conditional UPDATEs on the step's status (waiting -> queued ->
+completed/failed), so when two predecessors finish at the same time in
+different workers the successor is still enqueued exactly once. The Markdown
+file in Company Doc/Projects is only a rendered view of this state and is
+rewritten after every transition. Checklist files written before these
+tables existed are imported once at startup (`import_legacy_projects`).
+
+Context prefetch: when a step has its final content, `start_prefetch` builds
+the context bundle of every successor that this completion makes ready
+(upstream outputs, a slice of the Company Doc directory, the workflow SOP)
+on a background thread, while the finishing task still writes its file and
+updates its status. `complete_step` waits briefly for it, so the successor's
+task starts with the bundle stored on its step and skips the log scan,
+directory walk and file reads before its first LLM call.
+"""
 import os
+import re
 import datetime
+import threading
+import uuid
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models, crud, doc_index
+from .database import SessionLocal
+from .workflows.registry import get_workflow
 
+COMPANY_DOC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Company Doc")
 PROJECTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Company Doc", "Projects")
 
 if not os.path.exists(PROJECTS_DIR):
     os.makedirs(PROJECTS_DIR)
 
-def create_project_file(title: str, steps: list[str], is_sequential: bool = True) -> str:
-    """Creates a new project markdow file. Returns the absolute path."""
+# "[key](after: a, b) Agent: Instruction" - both prefixes optional
+STEP_PREFIX = re.compile(r"^\s*(?:\[(?P<key>[\w-]+)\])?\s*(?:\(after:\s*(?P<after>[^)]*)\))?\s*(?P<body>.*)$", re.DOTALL)
+
+_render_lock = threading.Lock()
+
+PREFETCH_CHARS = 2000 # Per upstream output, same cut as the log-based auto-read
+PREFETCH_DIR_FILES = 20 # Newest files listed per upstream folder
+PREFETCH_JOIN_SECONDS = 2.0
+
+
+class ProjectError(Exception):
+    pass
+
+
+def parse_steps(steps: list[str], is_sequential: bool = True) -> list[dict]:
+    """
+    Turn raw step strings into graph nodes: {key, agent_name, instruction, depends_on}.
+    Raises ProjectError for unknown dependencies or cycles.
+    """
+    nodes = []
+    for i, raw in enumerate(steps):
+        match = STEP_PREFIX.match(raw.strip())
+        key = (match.group("key") or f"s{i + 1}").strip()
+        body = match.group("body").strip()
+        if ":" in body:
+            agent_name, instruction = body.split(":", 1)
+        else:
+            agent_name, instruction = "", body
+        if match.group("after") is not None:
+            depends_on = [d.strip() for d in match.group("after").split(",") if d.strip()]
+        elif is_sequential and nodes:
+            depends_on = [nodes[-1]["key"]]
+        else:
+            depends_on = []
+        nodes.append({
+            "key": key,
+            "agent_name": agent_name.strip(),
+            "instruction": instruction.strip(),
+            "depends_on": depends_on
+        })
+
+    keys = [n["key"] for n in nodes]
+    if len(set(keys)) != len(keys):
+        raise ProjectError(f"Duplicate step ids: {keys}")
+    for node in nodes:
+        unknown = [d for d in node["depends_on"] if d not in keys]
+        if unknown:
+            raise ProjectError(f"Step '{node['key']}' depends on unknown step(s): {', '.join(unknown)}")
+
+    # Cycle check (Kahn): every node must become reachable from the roots
+    remaining = {n["key"]: set(n["depends_on"]) for n in nodes}
+    while remaining:
+        roots = [k for k, deps in remaining.items() if not deps]
+        if not roots:
+            raise ProjectError(f"Dependency cycle between steps: {', '.join(sorted(remaining))}")
+        for k in roots:
+            del remaining[k]
+        for deps in remaining.values():
+            deps.difference_update(roots)
+    return nodes
+
+
+def create_project(db: Session, title: str, steps: list[str], is_sequential: bool = True) -> models.Project:
+    """Create the project and its step graph, then render its Markdown view."""
+    nodes = parse_steps(steps, is_sequential)
+
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"Project_{timestamp}_{title.replace(' ', '_')}.md"
-    filepath = os.path.join(PROJECTS_DIR, filename)
-    
-    content = f"# Project: {title}\n"
-    content += f"**Created**: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    content += f"**Status**: IN_PROGRESS\n\n"
-    
-    # Metadata for Execution Mode
-    box = "[x]" if is_sequential else "[ ]"
-    content += f"{box} Sequential Execution (Strict Order)\n\n"
-    
-    content += "## Execution Plan (Checklist)\n"
-    
-    for step in steps:
-        # Steps typically come as "Agent | Instruction"
-        content += f"- [ ] {step}\n"
-        
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(content)
-        
-    return filepath
-
-def mark_step_completed(filepath: str, step_content_part: str):
-    """Marks a checklist item as [x] if it matches the partial content."""
-    if not os.path.exists(filepath):
-        return False
-        
-    with open(filepath, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-        
-    new_lines = []
-    found = False
-    for line in lines:
-        if "- [ ]" in line and step_content_part in line:
-            new_lines.append(line.replace("- [ ]", "- [x]", 1))
-            found = True
-        else:
-            new_lines.append(line)
-            
-    if found:
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.writelines(new_lines)
-            
-    return found
-
-def get_pending_steps(filepath: str) -> list[str]:
+    project = models.Project(
+        id=str(uuid.uuid4()),
+        title=title,
+        file_path=os.path.join(PROJECTS_DIR, filename),
+        is_sequential=1 if is_sequential else 0,
+        status=models.ProjectStatus.IN_PROGRESS.value
+    )
+    db.add(project)
+    for position, node in enumerate(nodes):
+        db.add(models.ProjectStep(
+            id=str(uuid.uuid4()),
+            project_id=project.id,
+            position=position,
+            status=models.StepStatus.WAITING.value,
+            **node
+        ))
+    db.commit()
+    render(db, project.id)
+    return project
+
+
+def get_project(db: Session, project_id: str):
+    return db.query(models.Project).filter(models.Project.id == project_id).first()
+
+
+def get_projects(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(models.Project).order_by(models.Project.created_at.desc()).offset(skip).limit(limit).all()
+
+
+def _steps(db: Session, project_id: str):
+    return db.query(models.ProjectStep).\
+        filter(models.ProjectStep.project_id == project_id).\
+        order_by(models.ProjectStep.position).\
+        all()
+
+
+def _find_agent(agents, name: str):
+    # Same loose match the meeting room uses ("小张" matches "小张 (Writer)")
+    return next((a for a in agents if name and (name in a.name or a.name in name)), None)
+
+
+def dispatch_ready_steps(db: Session, project_id: str) -> list[tuple]:
     """
-    Returns a list of pending steps to execute NEXT.
-    - If [x] Sequential: Returns ONLY the first pending step.
-    - If [ ] Sequential: Returns ALL pending steps.
+    Enqueue a task for every WAITING step whose predecessors are all COMPLETED.
+    Returns [(step, task)] for the steps this call moved to QUEUED; steps
+    whose agent cannot be found are FAILED and returned with task=None.
     """
-    if not os.path.exists(filepath):
+    project = get_project(db, project_id)
+    if not project or project.status != models.ProjectStatus.IN_PROGRESS.value:
         return []
-        
-    with open(filepath, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-        
-    # Check Mode
-    is_sequential = True # Default
-    for line in lines:
-        if "Sequential Execution" in line:
-            if "[ ]" in line:
-                is_sequential = False
-            break
-            
-    pending_steps = []
-    for line in lines:
-        if line.strip().startswith("- [ ]"):
-            step = line.strip().replace("- [ ]", "").strip()
-            pending_steps.append(step)
-            
-            if is_sequential:
-                return [step] # Return immediately if sequential
-                
-    return pending_steps 
-
-def get_next_pending_step(filepath: str):
-    """Legacy wrapper for compatibility."""
-    steps = get_pending_steps(filepath)
-    return steps[0] if steps else None
+    steps = _steps(db, project_id)
+    completed = {s.key for s in steps if s.status == models.StepStatus.COMPLETED.value}
+    ready = [
+        s for s in steps
+        if s.status == models.StepStatus.WAITING.value and all(d in completed for d in (s.depends_on or []))
+    ]
+    if not ready:
+        return []
+
+    agents = db.query(models.Agent).all()
+    dispatched = []
+    now = datetime.datetime.utcnow()
+    for step in ready:
+        agent = _find_agent(agents, step.agent_name)
+        task = None
+        fields = {models.ProjectStep.started_at: now}
+        if agent:
+            # Fingerprinted like POST /tasks/ (crud.create_task), so identical
+            # submissions attach to the step's task
+            fingerprint = crud.task_fingerprint(agent.id, step.instruction, project.file_path)
+            task = models.Task(
+                id=str(uuid.uuid4()),
+                title=f"Project Task: {step.agent_name}",
+                agent_id=agent.id,
+                input_prompt=step.instruction,
+                status=models.TaskStatus.PENDING.value,
+                project_file=project.file_path,
+                project_step_id=step.id,
+                priority=models.TaskPriority.PROJECT.value,
+                fingerprint=fingerprint,
+                dedup_key=fingerprint
+            )
+            fields[models.ProjectStep.status] = models.StepStatus.QUEUED.value
+            fields[models.ProjectStep.task_id] = task.id
+        else:
+            fields[models.ProjectStep.status] = models.StepStatus.FAILED.value
+            fields[models.ProjectStep.finished_at] = now
+
+        # Atomic claim: only one caller moves the step out of WAITING
+        claimed = db.query(models.ProjectStep).\
+            filter(models.ProjectStep.id == step.id).\
+            filter(models.ProjectStep.status == models.StepStatus.WAITING.value).\
+            update(fields, synchronize_session=False)
+        if not claimed:
+            continue
+        if task:
+            try:
+                with db.begin_nested():
+                    db.add(task)
+            except IntegrityError:
+                # An identical task of this project is active (another step
+                # with the same text): the step still needs its own task
+                task.dedup_key = None
+                db.add(task)
+        db.commit() # Step transition and its task are created together
+        dispatched.append((step, task))
+
+    if any(task is None for _, task in dispatched):
+        _set_project_status(db, project_id, models.ProjectStatus.FAILED)
+    render(db, project_id)
+    return dispatched
+
+
+def complete_step(db: Session, step_id: str, output_file: str = None):
+    """
+    Mark the step COMPLETED and enqueue whatever became ready.
+    Returns (dispatched, project_completed): project_completed is True only
+    for the single caller that finished the whole project.
+    """
+    done = db.query(models.ProjectStep).\
+        filter(models.ProjectStep.id == step_id).\
+        filter(models.ProjectStep.status == models.StepStatus.QUEUED.value).\
+        update({
+            models.ProjectStep.status: models.StepStatus.COMPLETED.value,
+            models.ProjectStep.output_file: output_file,
+            models.ProjectStep.finished_at: datetime.datetime.utcnow()
+        }, synchronize_session=False)
+    db.commit()
+    step = db.query(models.ProjectStep).filter(models.ProjectStep.id == step_id).first()
+    if not done or not step:
+        return [], False
+
+    dispatched = dispatch_ready_steps(db, step.project_id)
+    project_completed = False
+    if all(s.status == models.StepStatus.COMPLETED.value for s in _steps(db, step.project_id)):
+        project_completed = _set_project_status(db, step.project_id, models.ProjectStatus.COMPLETED)
+    render(db, step.project_id)
+    return dispatched, project_completed
+
+
+def fail_step_for_task(db: Session, task_id: str, reason: str = ""):
+    """A step's task ended FAILED / CANCELLED / TIMED_OUT: its dependents can never run."""
+    step = db.query(models.ProjectStep).filter(models.ProjectStep.task_id == task_id).first()
+    if not step:
+        return None
+    failed = db.query(models.ProjectStep).\
+        filter(models.ProjectStep.id == step.id).\
+        filter(models.ProjectStep.status == models.StepStatus.QUEUED.value).\
+        update({
+            models.ProjectStep.status: models.StepStatus.FAILED.value,
+            models.ProjectStep.finished_at: datetime.datetime.utcnow()
+        }, synchronize_session=False)
+    db.commit()
+    if failed:
+        _set_project_status(db, step.project_id, models.ProjectStatus.FAILED)
+        render(db, step.project_id)
+    return step
+
+
+STOPPED_TASK_STATUSES = [
+    models.TaskStatus.FAILED.value,
+    models.TaskStatus.CANCELLED.value,
+    models.TaskStatus.TIMED_OUT.value,
+]
+
+
+def fail_steps_of_stopped_tasks(db: Session) -> int:
+    """
+    Reaper sweep: fail QUEUED steps whose task already ended FAILED /
+    CANCELLED / TIMED_OUT without going through `fail_step_for_task`
+    (e.g. a worker that died, or a crash between the two updates).
+    """
+    task_ids = [task_id for (task_id,) in db.query(models.ProjectStep.task_id).
+                join(models.Task, models.Task.id == models.ProjectStep.task_id).
+                filter(models.ProjectStep.status == models.StepStatus.QUEUED.value).
+                filter(models.Task.status.in_(STOPPED_TASK_STATUSES)).
+                all()]
+    for task_id in task_ids:
+        fail_step_for_task(db, task_id)
+    return len(task_ids)
+
+
+# --- Context Prefetch ---
+def _successors_ready_after(db: Session, step: models.ProjectStep) -> list:
+    """WAITING steps that become ready once `step` completes."""
+    steps = _steps(db, step.project_id)
+    completed = {s.key for s in steps if s.status == models.StepStatus.COMPLETED.value} | {step.key}
+    return [
+        s for s in steps
+        if s.status == models.StepStatus.WAITING.value
+        and step.key in (s.depends_on or [])
+        and all(d in completed for d in s.depends_on)
+    ]
+
+
+def _read_output(output_file: str) -> str:
+    try:
+        with open(os.path.join(COMPANY_DOC_DIR, output_file), "r", encoding="utf-8") as f:
+            return f.read(PREFETCH_CHARS)
+    except OSError:
+        return ""
+
+
+def _directory_slice(folders) -> list:
+    """Newest files of the upstream agents' folders (relative to Company Doc)."""
+    listing = []
+    for folder in sorted(set(folders)):
+        entries = doc_index.newest(doc_index.index.in_dir(folder))
+        listing.extend(os.path.join(folder, doc.name) for doc in entries[:PREFETCH_DIR_FILES])
+    return listing
+
+
+def _sop_for(instruction: str) -> dict:
+    match = re.match(r"\[WORKFLOW:\s*(.*?)\]", instruction or "")
+    workflow = get_workflow(match.group(1).strip() if match else "general_task")
+    return {"name": workflow["name"], "description": workflow["description"], "steps": "\n".join(workflow["steps"])}
+
+
+def build_context_bundle(db: Session, successor: models.ProjectStep, finished: models.ProjectStep,
+                         finished_output: str, finished_content: str) -> dict:
+    by_key = {s.key: s for s in _steps(db, successor.project_id)}
+    upstream = []
+    for key in successor.depends_on or []:
+        pred = by_key.get(key)
+        if not pred:
+            continue
+        if pred.id == finished.id:
+            path, content = finished_output, (finished_content or "")[:PREFETCH_CHARS]
+        else:
+            path, content = pred.output_file, _read_output(pred.output_file) if pred.output_file else ""
+        upstream.append({"key": key, "agent": pred.agent_name, "path": path, "content": content})
+    return {
+        "upstream": upstream,
+        "directory": _directory_slice(os.path.dirname(u["path"]) for u in upstream if u["path"]),
+        "sop": _sop_for(successor.instruction),
+        "built_at": datetime.datetime.utcnow().isoformat()
+    }
+
+
+def prefetch_successors(step_id: str, output_file: str, content: str) -> int:
+    """Store context bundles for the successors `step_id` will unblock. Returns how many."""
+    db = SessionLocal()
+    try:
+        step = db.query(models.ProjectStep).filter(models.ProjectStep.id == step_id).first()
+        if not step:
+            return 0
+        successors = _successors_ready_after(db, step)
+        for successor in successors:
+            bundle = build_context_bundle(db, successor, step, output_file, content)
+            db.query(models.ProjectStep).\
+                filter(models.ProjectStep.id == successor.id).\
+                update({models.ProjectStep.context_bundle: bundle}, synchronize_session=False)
+        db.commit()
+        return len(successors)
+    except Exception as e:
+        print(f"DEBUG: Context prefetch failed for step {step_id}: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def start_prefetch(step_id: str, output_file: str, content: str) -> threading.Thread:
+    thread = threading.Thread(target=prefetch_successors, args=(step_id, output_file, content), name="project-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_context_bundle(db: Session, step_id: str):
+    row = db.query(models.ProjectStep.context_bundle).filter(models.ProjectStep.id == step_id).first()
+    return row[0] if row else None
+
+
+def format_context_bundle(bundle: dict) -> str:
+    """The prefetched bundle as the task's context hint (replaces the log-based hint)."""
+    hint = ""
+    for item in bundle.get("upstream", []):
+        hint += f"\n\n[PROJECT CONTEXT: Output of step '{item['key']}' by {item['agent']} ({item['path']})]:\n{item['content']}\n...(content truncated)..."
+    if bundle.get("directory"):
+        hint += "\n\n[System Context Hint: RELATED PROJECT FILES (Use 'read_file' if you need more)]\n"
+        hint += "".join(f"- {path}\n" for path in bundle["directory"])
+    return hint
+
+
+def _set_project_status(db: Session, project_id: str, status: models.ProjectStatus) -> bool:
+    changed = db.query(models.Project).\
+        filter(models.Project.id == project_id).\
+        filter(models.Project.status == models.ProjectStatus.IN_PROGRESS.value).\
+        update({
+            models.Project.status: status.value,
+            models.Project.finished_at: datetime.datetime.utcnow()
+        }, synchronize_session=False)
+    db.commit()
+    return bool(changed)
+
+
+# --- Legacy Checklists ---
+LEGACY_STEP = re.compile(r"^- \[(?P<done>[ xX])\] (?P<step>.+)$")
+LEGACY_MATCH_CHARS = 50 # The old engine matched a task to its line on this prefix of the prompt
+
+
+def parse_legacy_checklist(content: str) -> dict:
+    """Title, creation time, mode and [(done, step)] of a pre-DAG Markdown checklist."""
+    title = re.search(r"^# Project:\s*(.+)$", content, re.MULTILINE)
+    created = re.search(r"^\*\*Created\*\*:\s*(.+)$", content, re.MULTILINE)
+    created_at = None
+    if created:
+        try:
+            created_at = datetime.datetime.strptime(created.group(1).strip(), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    mode = re.search(r"^\[(?P<box>[ xX])\] Sequential Execution", content, re.MULTILINE)
+    steps = []
+    for line in content.splitlines():
+        match = LEGACY_STEP.match(line.strip())
+        if match:
+            steps.append((match.group("done") != " ", match.group("step").strip()))
+    return {
+        "title": title.group(1).strip() if title else None,
+        "created_at": created_at,
+        "is_sequential": mode is None or mode.group("box") != " ",
+        "steps": steps
+    }
+
+
+def import_legacy_projects(db: Session) -> int:
+    """
+    Import checklist files written before the project tables existed (no
+    `Project ID` line, no `projects` row) so their tasks advance the project
+    again: ticked lines become COMPLETED steps, and a PENDING / RUNNING task
+    with this `project_file` but no `project_step_id` is linked to the open
+    line it was created from (QUEUED). Nothing is dispatched here; the next
+    step starts when that task completes, as before.
+
+    The project id is derived from the file name, so concurrent callers (API
+    and worker processes starting together) import each file once.
+    Returns the number of projects imported.
+    """
+    try:
+        names = [n for n in os.listdir(PROJECTS_DIR) if n.endswith(".md")]
+    except OSError:
+        return 0
+    known = {os.path.basename(p) for (p,) in db.query(models.Project.file_path).all() if p}
+    names = sorted(set(names) - known)
+    if not names:
+        return 0
+    open_tasks = {}
+    for task in db.query(models.Task).\
+            filter(models.Task.project_file.isnot(None)).\
+            filter(models.Task.project_step_id.is_(None)).\
+            filter(models.Task.status.in_([models.TaskStatus.PENDING.value, models.TaskStatus.RUNNING.value])).\
+            order_by(models.Task.created_at).\
+            all():
+        open_tasks.setdefault(os.path.basename(task.project_file), []).append(task)
+
+    imported = 0
+    for name in names:
+        path = os.path.join(PROJECTS_DIR, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError:
+            continue
+        if "**Project ID**:" in content:
+            continue # Rendered by this engine; its row lives in another database
+        legacy = parse_legacy_checklist(content)
+        if not legacy["steps"]:
+            continue
+        try:
+            nodes = parse_steps([step for _, step in legacy["steps"]], legacy["is_sequential"])
+        except ProjectError as e:
+            print(f"DEBUG: Skipping legacy project {name}: {e}")
+            continue
+
+        all_done = all(done for done, _ in legacy["steps"])
+        project = models.Project(
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"legacy-project:{name}")),
+            title=legacy["title"] or name[:-3],
+            file_path=path,
+            is_sequential=1 if legacy["is_sequential"] else 0,
+            status=(models.ProjectStatus.COMPLETED if all_done else models.ProjectStatus.IN_PROGRESS).value,
+            created_at=legacy["created_at"] or datetime.datetime.utcnow()
+        )
+        db.add(project)
+        steps = []
+        for position, ((done, _), node) in enumerate(zip(legacy["steps"], nodes)):
+            step = models.ProjectStep(
+                id=str(uuid.uuid4()),
+                project_id=project.id,
+                position=position,
+                status=(models.StepStatus.COMPLETED if done else models.StepStatus.WAITING).value,
+                **node
+            )
+            db.add(step)
+            steps.append(step)
+
+        for task in open_tasks.get(name, []):
+            prefix = (task.input_prompt or "")[:LEGACY_MATCH_CHARS]
+            step = next((s for s in steps if s.status == models.StepStatus.WAITING.value and prefix and prefix in s.instruction), None)
+            if step is None:
+                continue
+            step.status = models.StepStatus.QUEUED.value
+            step.task_id = task.id
+            step.started_at = task.started_at or task.created_at
+            linked = db.query(models.Task).\
+                filter(models.Task.id == task.id).\
+                filter(models.Task.project_step_id.is_(None)).\
+                update({models.Task.project_step_id: step.id}, synchronize_session=False)
+            if not linked:
+                step.status, step.task_id, step.started_at = models.StepStatus.WAITING.value, None, None
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback() # Imported by another process meanwhile
+            continue
+        imported += 1
+        print(f"DEBUG: Imported legacy project {name} ({len(steps)} steps, {project.status})")
+    return imported
+
+
+# --- Markdown View ---
+STEP_BOXES = {
+    models.StepStatus.WAITING.value: "[ ]",
+    models.StepStatus.QUEUED.value: "[~]",
+    models.StepStatus.COMPLETED.value: "[x]",
+    models.StepStatus.FAILED.value: "[!]",
+}
+
+
+def render_markdown(project: models.Project, steps: list) -> str:
+    content = f"# Project: {project.title}\n"
+    content += f"**Created**: {project.created_at.strftime('%Y-%m-%d %H:%M:%S') if project.created_at else ''}\n"
+    content += f"**Status**: {project.status.upper()}\n"
+    content += f"**Project ID**: {project.id}\n\n"
+
+    box = "[x]" if project.is_sequential else "[ ]"
+    content += f"{box} Sequential Execution (Strict Order)\n\n"
+
+    content += "## Execution Plan (Checklist)\n"
+    content += "_Generated from the project database; edits to this file are overwritten._\n\n"
+    for step in steps:
+        line = f"- {STEP_BOXES.get(step.status, '[ ]')} `{step.key}` {step.agent_name}: {step.instruction}"
+        if step.depends_on:
+            line += f" (after: {', '.join(step.depends_on)})"
+        if step.status == models.StepStatus.QUEUED.value:
+            line += " - in progress"
+        elif step.status == models.StepStatus.FAILED.value:
+            line += " - failed"
+        if step.output_file:
+            line += f" -> `{step.output_file}`"
+        content += line + "\n"
+    return content
+
+
+def render(db: Session, project_id: str):
+    """Rewrite the Markdown view from the current DB state (atomic file replace)."""
+    with _render_lock:
+        project = get_project(db, project_id)
+        if not project or not project.file_path:
+            return
+        db.refresh(project)
+        content = render_markdown(project, _steps(db, project_id))
+        tmp_path = f"{project.file_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, project.file_path)
+        doc_index.note_write(project.file_path)
@@ -9,6 +9,14 @@ class TaskStatus(str, Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed_out"
+
+class TaskPriority(str, Enum):
+    INTERACTIVE = "interactive"
+    PROJECT = "project"
+    BULK = "bulk"
+    BATCH = "batch"
 
 # --- Shared Base Models ---
 class AgentBase(BaseModel):
@@ -73,11 +81,22 @@ class AgentUpdate(BaseModel):
     skills: Optional[List[str]] = None # List of Skill IDs to Replace existing
     handbooks: Optional[List[str]] = None # List of Handbook IDs
 
+class AgentSkillsBulkUpdate(BaseModel):
+    agent_ids: List[str]
+    skills: List[str] = [] # List of Skill IDs to Replace existing (for every agent)
+
 class SkillCreate(SkillBase):
     pass
 
 class TaskCreate(TaskBase):
     project_file: Optional[str] = None
+    priority: TaskPriority = TaskPriority.INTERACTIVE
+    timeout_seconds: Optional[int] = None # Overrides the workflow's deadline
+    project_step_id: Optional[str] = None # Set by the project engine
+    force: bool = False # Run even if an identical task ran within the dedup window
+
+class TaskBatchCreate(BaseModel):
+    tasks: List[TaskCreate] # Submitted with priority "batch"
 
 class ChatMessage(BaseModel):
     role: str
@@ -120,12 +139,119 @@ class Task(TaskBase):
     output_text: Optional[str] = None
     output_files: Optional[List[str]] = None
     project_file: Optional[str] = None
+    priority: Optional[TaskPriority] = None
+    timeout_seconds: Optional[int] = None
+    cancel_requested: Optional[int] = None
+    project_step_id: Optional[str] = None
+    batch_id: Optional[str] = None
     created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Scheduling estimates (only for pending tasks)
+    queue_position: Optional[int] = None
+    estimated_start_at: Optional[datetime] = None
+    # Set by POST /tasks/ when an identical task was reused ("pending", "running" or "completed")
+    reused: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ProjectStep(BaseModel):
+    id: str
+    key: str
+    position: int
+    agent_name: str
+    instruction: str
+    depends_on: List[str] = []
+    status: str
+    task_id: Optional[str] = None
+    output_file: Optional[str] = None
+    started_at: Optional[datetime] = None
     finished_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class Project(BaseModel):
+    id: str
+    title: str
+    file_path: Optional[str] = None
+    is_sequential: bool
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    steps: List[ProjectStep] = []
+
+    class Config:
+        from_attributes = True
+
+class TaskSpan(BaseModel):
+    id: int
+    task_id: str
+    agent_id: Optional[str] = None
+    model_name: Optional[str] = None
+    name: str
+    label: Optional[str] = None
+    status: Optional[str] = None
+    started_at: datetime
+    duration_ms: float
+    queue_wait_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    tokens: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class TaskBatch(BaseModel):
+    id: str
+    status: str
+    provider_batch_id: Optional[str] = None
+    provider_status: Optional[str] = None
+    request_count: int = 0
+    completed_count: int = 0
+    requeued_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    submitted_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class LatencyStats(BaseModel):
+    group: str
+    span: str
+    count: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    avg_ms: float
+    avg_ttfb_ms: Optional[float] = None
+
+class SkillCacheStats(BaseModel):
+    skill: str
+    hits: int
+    misses: int
+    bypassed: int
+    evictions: int
+    entries: int
+    chars: int
+    hit_rate: float
+
+class SkillPoolStats(BaseModel):
+    concurrency: str
+    size: int
+    timed_out_running: int
+    timed_out_total: int
+
+class DocSearchHit(BaseModel):
+    path: str
+    author: str
+    title: str
+    snippet: str
+    score: float
+    mtime: float
+
 class Setting(SettingBase):
     class Config:
         from_attributes = True
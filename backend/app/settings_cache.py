@@ -0,0 +1,123 @@
+"""
+In-process cache for the `settings` table.
+
+Settings are read on every chat request and every background task turn, but
+they change only when somebody presses "Save Settings". The whole table is
+loaded once and served from memory; `crud.set_setting` writes through to this
+cache.
+
+Cross-process coherence: every write also replaces the value of a version row
+(`VERSION_KEY`) in the same transaction. Readers compare that single row with
+the version they loaded (at most once per `CHECK_INTERVAL` seconds) and reload
+the table when it differs, so multiple uvicorn/worker processes stay in sync.
+"""
+import threading
+import time
+import uuid
+from types import MappingProxyType
+from sqlalchemy.orm import Session
+from . import models
+
+VERSION_KEY = "__settings_version__"
+CHECK_INTERVAL = 1.0  # Seconds between version-row checks
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+_lock = threading.Lock()
+_values = {}
+_version = None
+_checked_at = 0.0
+_llm_config = None
+
+
+def _read_version(db: Session):
+    row = db.query(models.Setting.value).filter(models.Setting.key == VERSION_KEY).first()
+    return row[0] if row else ""
+
+
+def _build_llm_config(values: dict):
+    return MappingProxyType({
+        "api_key": values.get("api_key"),
+        "base_url": values.get("base_url") or DEFAULT_BASE_URL,
+        "gemini_api_key": values.get("gemini_api_key")
+    })
+
+
+def _load(db: Session):
+    """Reload the full table. Caller holds `_lock`."""
+    global _values, _version, _llm_config
+    rows = db.query(models.Setting.key, models.Setting.value).all()
+    # "__"-prefixed rows are internal version markers (this one, skill_bindings.py)
+    values = {key: value for key, value in rows if not key.startswith("__")}
+    _values = values
+    _version = next((value for key, value in rows if key == VERSION_KEY), "")
+    _llm_config = _build_llm_config(values)
+
+
+def ensure_fresh(db: Session):
+    """Load on first use and reload when another process bumped the version row."""
+    global _checked_at
+    now = time.monotonic()
+    if _version is not None and now - _checked_at < CHECK_INTERVAL:
+        return
+    with _lock:
+        if _version is None:
+            _load(db)
+        elif _read_version(db) != _version:
+            _load(db)
+        _checked_at = now
+
+
+def get(db: Session, key: str, default=None):
+    ensure_fresh(db)
+    value = _values.get(key)
+    return default if value is None else value
+
+
+def get_llm_config(db: Session):
+    """
+    Provider configuration (api_key, base_url, gemini_api_key).
+    Returns a read-only mapping shared by all callers; copy it before mutating.
+    """
+    ensure_fresh(db)
+    return _llm_config
+
+
+def stage_version_bump(db: Session):
+    """
+    Replace the version row inside the caller's transaction.
+    Must be committed together with the setting change it announces.
+    Returns (previous_version, new_version).
+    """
+    new_version = uuid.uuid4().hex
+    row = db.query(models.Setting).filter(models.Setting.key == VERSION_KEY).first()
+    if row:
+        previous_version = row.value
+        row.value = new_version
+    else:
+        previous_version = ""
+        db.add(models.Setting(key=VERSION_KEY, value=new_version))
+    return previous_version, new_version
+
+
+def apply_write(key: str, value, previous_version: str, new_version: str):
+    """Write-through after a committed `set_setting`."""
+    global _values, _version, _llm_config, _checked_at
+    with _lock:
+        if _version is None or _version != previous_version:
+            # Never loaded, or another process wrote since our last load:
+            # fall back to a full reload on the next read.
+            _version = None
+            return
+        values = dict(_values)
+        values[key] = value
+        _values = values
+        _version = new_version
+        _llm_config = _build_llm_config(values)
+        _checked_at = time.monotonic()
+
+
+def invalidate():
+    """Force a full reload on the next read."""
+    global _version
+    with _lock:
+        _version = None
@@ -0,0 +1,188 @@
+"""
+Per-agent skill bindings for `SkillDispatcher`.
+
+A binding is everything the dispatcher derives from an agent's skill
+assignment: the enabled skills with their resolved registry entry (handler,
+timeout, parameters), each skill's config pre-merged with the agent identity,
+and the rendered [AVAILABLE SKILLS] prompt addition. It is built with one
+`AgentSkill JOIN Skill` query on first use and then served from memory, so the
+dispatcher constructed on every turn of every task runs no query and renders
+nothing.
+
+Invalidation: the crud functions that change skill assignments or skill rows
+stage a new version row in `settings` in their transaction and call
+`invalidate()` after committing. There is one row per agent
+(`VERSION_KEY:<agent id>`, assignment / identity changes of that agent) and a
+shared one (`VERSION_KEY`, changes to the skills themselves). Other processes
+compare these rows with the ones they loaded at most once per `CHECK_INTERVAL`
+seconds and drop the bindings of the agents whose row changed, or all of them
+when the shared row changed (same scheme as settings_cache.py).
+"""
+import threading
+import time
+import uuid
+from types import MappingProxyType
+from typing import Optional
+from sqlalchemy.orm import Session
+from . import models
+
+VERSION_KEY = "__skill_bindings_version__"
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_bindings = {}  # agent_id -> SkillBinding
+_versions = None # Version rows as last read: key -> value
+_checked_at = 0.0
+_generation = 0  # Bumped when all bindings are dropped
+_agent_generations = {} # agent_id -> bumped when its binding is dropped
+
+
+class SkillBinding:
+    """Immutable snapshot of one agent's usable skills."""
+
+    def __init__(self, agent: models.Agent, rows):
+        from .skills import SkillRegistry
+
+        self.agent_id = agent.id
+        self.identity_config = MappingProxyType({
+            "agent_name": agent.name,
+            "agent_provider": getattr(agent, 'provider', 'openai')
+        })
+        skills = {}
+        for askill, skill in rows:
+            entry = SkillRegistry.get_skill(skill.name)
+            if entry is None:
+                continue # Plugin removed (hot reload): do not advertise it
+            skills[skill.name] = {
+                "description": skill.description,
+                "config": dict(askill.config or {}),
+                # Agent skill override > agent identity; the global provider
+                # config is chained behind this at call time.
+                "merged_config": MappingProxyType({**self.identity_config, **(askill.config or {})}),
+                "entry": entry
+            }
+        self.skills = skills
+        self.prompt_addition = self._render_prompt_addition()
+
+    def _render_prompt_addition(self) -> str:
+        if not self.skills:
+            return ""
+
+        prompt = "\n\n[AVAILABLE SKILLS]\n"
+        prompt += "You have access to the following skills. To use one, output the specific tag.\n"
+
+        for name, data in self.skills.items():
+            prompt += f"- {name}: {data['description']}\n"
+            prompt += f"  Usage: [[CALL_SKILL: {name} | {{JSON Arguments}}]]\n"
+
+        prompt += "\n[SKILL EXECUTION RULES]\n"
+        prompt += "1. Output the [[CALL_SKILL]] tag on a new line.\n"
+        prompt += "2. The system will intercept this tag, execute the code, and return the result.\n"
+        prompt += "3. DO NOT hallucinate the result. Wait for the system response.\n"
+        prompt += "4. If you need several independent results (e.g. reading 3 files), output all tags in ONE response; they run in parallel.\n"
+
+        return prompt
+
+
+def _agent_key(agent_id: str) -> str:
+    return f"{VERSION_KEY}:{agent_id}"
+
+
+def _read_versions(db: Session) -> dict:
+    rows = db.query(models.Setting.key, models.Setting.value).\
+        filter((models.Setting.key == VERSION_KEY) | models.Setting.key.like(VERSION_KEY.replace("_", "\\_") + ":%", escape="\\")).\
+        all()
+    return dict(rows)
+
+
+def _drop(agent_ids):
+    """Caller holds `_lock`."""
+    global _generation
+    if agent_ids is None:
+        _bindings.clear()
+        _generation += 1
+        return
+    for agent_id in agent_ids:
+        _bindings.pop(agent_id, None)
+        _agent_generations[agent_id] = _agent_generations.get(agent_id, 0) + 1
+
+
+def _ensure_fresh(db: Session):
+    global _versions, _checked_at
+    now = time.monotonic()
+    if _versions is not None and now - _checked_at < CHECK_INTERVAL:
+        return
+    current = _read_versions(db)
+    with _lock:
+        if _versions is None or current.get(VERSION_KEY) != _versions.get(VERSION_KEY):
+            _drop(None)
+        else:
+            changed = [key for key in set(current) | set(_versions) if current.get(key) != _versions.get(key)]
+            _drop([key.split(":", 1)[1] for key in changed])
+        _versions = current
+        _checked_at = now
+
+
+def _query_rows(db: Session, agent_id: str):
+    return db.query(models.AgentSkill, models.Skill).\
+        join(models.Skill, models.AgentSkill.skill_id == models.Skill.id).\
+        filter(models.AgentSkill.agent_id == agent_id).\
+        filter(models.AgentSkill.enabled == 1).\
+        all()
+
+
+def get_binding(db: Session, agent: models.Agent) -> SkillBinding:
+    _ensure_fresh(db)
+    binding = _bindings.get(agent.id)
+    if binding is None:
+        stamp = (_generation, _agent_generations.get(agent.id))
+        binding = SkillBinding(agent, _query_rows(db, agent.id))
+        with _lock:
+            # Do not publish a binding built while an invalidation happened
+            if stamp == (_generation, _agent_generations.get(agent.id)):
+                _bindings[agent.id] = binding
+    return binding
+
+
+def stage_version_bump(db: Session, agent_ids: Optional[list] = None, removed: bool = False) -> dict:
+    """
+    Announce a change; commit it with that change. With `agent_ids` only
+    those agents' bindings are dropped elsewhere (`removed`: the agents were
+    deleted, drop their rows), else every binding (skill rows changed).
+    Returns the staged rows {key: value or None}; pass them to `invalidate`.
+    """
+    if agent_ids is None:
+        keys = [VERSION_KEY]
+    else:
+        keys = [_agent_key(agent_id) for agent_id in dict.fromkeys(agent_ids)]
+    staged = {}
+    rows = {row.key: row for row in db.query(models.Setting).filter(models.Setting.key.in_(keys)).all()} if keys else {}
+    for key in keys:
+        row = rows.get(key)
+        if removed:
+            if row:
+                db.delete(row)
+            staged[key] = None
+            continue
+        staged[key] = uuid.uuid4().hex
+        if row:
+            row.value = staged[key]
+        else:
+            db.add(models.Setting(key=key, value=staged[key]))
+    return staged
+
+
+def invalidate(agent_ids: Optional[list] = None, staged: Optional[dict] = None):
+    """
+    Drop the bindings of `agent_ids` (all agents if None) in this process.
+    `staged` (from `stage_version_bump`, committed) is recorded as already
+    seen, so the next version check does not drop them a second time.
+    """
+    with _lock:
+        _drop(agent_ids)
+        if staged and _versions is not None:
+            for key, value in staged.items():
+                if value is None:
+                    _versions.pop(key, None)
+                else:
+                    _versions[key] = value
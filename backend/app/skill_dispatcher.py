@@ -1,63 +1,143 @@
 
 import re
 import json
+import time
+import asyncio
+import inspect
+import threading
+from collections import ChainMap
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from sqlalchemy.orm import Session
-from .models import Agent, AgentSkill, Skill
+from .models import Agent
 from .skills import SkillRegistry
+from . import tags as tag_tokenizer
+from . import skill_bindings
+
+# Skill calls of one response run concurrently. Bulkheads: each concurrency
+# class (declared at registration) has its own bounded pool, so slow calls
+# (image generation) cannot take the slots fast ones (file reads) need.
+SKILL_POOL_SIZES = {"io": 8, "generation": 2, "default": 4}
+DEFAULT_SKILL_TIMEOUT = 60 # Seconds, unless the skill registers its own
+TIMEOUT_POLL_SECONDS = 0.2
+
+# Argument formats inside a CALL_SKILL tag without "|" (tag finding is in tags.py)
+FUNC_ARGS_PATTERN = re.compile(r"([a-zA-Z0-9_]+)\s*\((.*)\)", re.DOTALL)           # name(key="val")
+JSON_NO_PIPE_PATTERN = re.compile(r"([a-zA-Z0-9_]+)\s*(\{.*\})", re.DOTALL)        # name {json}
+CATCHALL_PATTERN = re.compile(r"([a-zA-Z0-9_]+)(?:[:\s]+)(.*)", re.DOTALL)           # name: args
+KEY_VALUE_PATTERN = re.compile(r'(\w+)\s*[=:]\s*(?:"([^"]*)"|\'([^\']*)\'|([0-9.]+))')
+
+def skill_name_of(tag: str):
+    """Skill name of a [[CALL_SKILL: name ...]] tag (None if malformed)."""
+    parsed = tag_tokenizer.first(tag, "CALL_SKILL")
+    return parsed.skill_name if parsed else None
+
+def call_signature(tag: str) -> str:
+    """
+    Identity of one skill call for loop prevention: skill name plus its
+    arguments (JSON key order and whitespace ignored).
+    """
+    parsed = tag_tokenizer.first(tag, "CALL_SKILL")
+    body = parsed.body if parsed else tag
+    if "|" in body:
+        name, args = body.split("|", 1)
+        try:
+            args = json.dumps(json.loads(args), sort_keys=True, ensure_ascii=False)
+        except (ValueError, TypeError):
+            args = " ".join(args.split())
+        return f"{name.strip()}|{args}"
+    return " ".join(body.split())
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# A sync handler cannot be stopped at its timeout: the call is abandoned but
+# keeps its pool thread until it returns. Such calls are tracked per class;
+# while every thread of a pool is held by one, new calls of that class are
+# refused instead of queueing behind them (GET /metrics/skill-pools).
+_timed_out = {} # concurrency -> futures past their timeout, still running
+_timed_out_total = {} # concurrency -> calls abandoned since start
+
+def _pool_size(concurrency: str) -> int:
+    return SKILL_POOL_SIZES.get(concurrency, SKILL_POOL_SIZES["default"])
+
+def _pool_for(concurrency: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(concurrency)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=_pool_size(concurrency), thread_name_prefix=f"skill-{concurrency}")
+            _pools[concurrency] = pool
+        return pool
+
+def _pool_blocked(concurrency: str) -> bool:
+    """Every thread of the class's pool is held by a timed-out call."""
+    with _pools_lock:
+        return len(_timed_out.get(concurrency, ())) >= _pool_size(concurrency)
+
+def _track_timed_out(concurrency: str, future, tag: str):
+    with _pools_lock:
+        held = _timed_out.setdefault(concurrency, set())
+        held.add(future)
+        _timed_out_total[concurrency] = _timed_out_total.get(concurrency, 0) + 1
+        count = len(held)
+    print(f"DEBUG: Skill call {tag} timed out and still holds a '{concurrency}' thread ({count}/{_pool_size(concurrency)} held)")
+
+    def _released(f):
+        with _pools_lock:
+            _timed_out.get(concurrency, set()).discard(f)
+        print(f"DEBUG: Timed-out skill call {tag} returned; '{concurrency}' thread released")
+    future.add_done_callback(_released)
+
+def pool_stats() -> list:
+    """Size and timed-out calls per concurrency class (this process)."""
+    with _pools_lock:
+        classes = sorted(set(SKILL_POOL_SIZES) | set(_pools))
+        return [{
+            "concurrency": c,
+            "size": _pool_size(c),
+            "timed_out_running": len(_timed_out.get(c, ())),
+            "timed_out_total": _timed_out_total.get(c, 0),
+        } for c in classes]
+
+# Async handlers run on one shared event loop; the calling pool thread waits
+# for the result, and a call past its timeout is cancelled (not just abandoned).
+_loop = None
+_loop_lock = threading.Lock()
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="skill-async", daemon=True).start()
+        return _loop
+
+async def _as_coroutine(awaitable):
+    return await awaitable
+
+def _await_result(awaitable, timeout: float):
+    future = asyncio.run_coroutine_threadsafe(_as_coroutine(awaitable), _event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
 
 class SkillDispatcher:
     def __init__(self, db: Session, agent: Agent):
         self.db = db
         self.agent = agent
-        self.available_skills = self._load_available_skills()
-
-    def _load_available_skills(self):
-        """
-        Load enabled skills for this agent.
-        """
-        # Join AgentSkill and Skill
-        results = self.db.query(AgentSkill, Skill).\
-            join(Skill, AgentSkill.skill_id == Skill.id).\
-            filter(AgentSkill.agent_id == self.agent.id).\
-            filter(AgentSkill.enabled == 1).\
-            all()
-        
-        skills = {}
-        for askill, skill in results:
-            # Merge global config with agent override
-            # registry_entry = SkillRegistry.get_skill(skill.name)
-            skills[skill.name] = {
-                "definition": skill,
-                "config": askill.config or {}
-            }
-        return skills
+        # Resolved once per agent and cached until its skills change (skill_bindings.py)
+        self.binding = skill_bindings.get_binding(db, agent)
+        self.available_skills = self.binding.skills
+        # Agent identity injected for file saving (e.g. assets folder)
+        self.identity_config = self.binding.identity_config
 
     def get_system_prompt_addition(self) -> str:
         """
-        Generate the [AVAILABLE SKILLS] section for the System Prompt.
+        The [AVAILABLE SKILLS] section for the System Prompt (rendered with the binding).
         """
-        if not self.available_skills:
-            return ""
-
-        prompt = "\n\n[AVAILABLE SKILLS]\n"
-        prompt += "You have access to the following skills. To use one, output the specific tag.\n"
-        
-        for name, data in self.available_skills.items():
-            skill_def = data['definition']
-            # Get parameters from registry for accurate instruction
-            reg_entry = SkillRegistry.get_skill(name)
-            params = reg_entry['parameters'] if reg_entry else {}
-            
-            prompt += f"- {name}: {skill_def.description}\n"
-            prompt += f"  Usage: [[CALL_SKILL: {name} | {{JSON Arguments}}]]\n"
-            # prompt += f"  Schema: {json.dumps(params)}\n"
-        
-        prompt += "\n[SKILL EXECUTION RULES]\n"
-        prompt += "1. Output the [[CALL_SKILL]] tag on a new line.\n"
-        prompt += "2. The system will intercept this tag, execute the code, and return the result.\n"
-        prompt += "3. DO NOT hallucinate the result. Wait for the system response.\n"
-        
-        return prompt
+        return self.binding.prompt_addition
 
     def parse_and_execute(self, text: str, global_config: dict) -> tuple[str, bool]:
         """
@@ -71,14 +151,13 @@ class SkillDispatcher:
         # 1. Standard: [[CALL_SKILL: name | {json}]]
         # 2. Pythonic: [[CALL_SKILL: name(arg="val", ...)]]
         
-        # Primary Regex (Capture the whole content after CALL_SKILL:)
-        pattern = r"\[\[CALL_SKILL:\s*(.*?)\]\]"
-        match = re.search(pattern, text, re.DOTALL)
+        # Primary: the first CALL_SKILL tag (content after CALL_SKILL:)
+        tag = tag_tokenizer.first(text, "CALL_SKILL")
         
-        if not match:
+        if not tag:
             return text, False
 
-        content = match.group(1).strip()
+        content = tag.body
         print(f"DEBUG: Skill Dispatcher Raw Content: [{content}]")
         
         # Determine format
@@ -94,11 +173,11 @@ class SkillDispatcher:
             # Format: name(args)
             # Simple parser for name(key="value", ...)
             # Extract name
-            match_func = re.match(r"([a-zA-Z0-9_]+)\s*\((.*)\)", content, re.DOTALL)
-            match_json_no_pipe = re.match(r"([a-zA-Z0-9_]+)\s*(\{.*\})", content, re.DOTALL)
+            match_func = FUNC_ARGS_PATTERN.match(content)
+            match_json_no_pipe = JSON_NO_PIPE_PATTERN.match(content)
             # Catch-all: Name followed by optional colon/space and then args
             # Matches: "skill_name: args" or "skill_name args"
-            match_catchall = re.match(r"([a-zA-Z0-9_]+)(?:[:\s]+)(.*)", content, re.DOTALL)
+            match_catchall = CATCHALL_PATTERN.match(content)
             
             if match_func:
                 skill_name = match_func.group(1).strip()
@@ -113,16 +192,13 @@ class SkillDispatcher:
                        (cleaned_arg.startswith("'") and cleaned_arg.endswith("'")):
                         cleaned_arg = cleaned_arg[1:-1]
                     
-                    # Fetch skill definition to find the default parameter
-                    reg_entry = SkillRegistry.get_skill(skill_name)
-                    if reg_entry:
-                        params = reg_entry.get("parameters", {})
-                        required = params.get("required", [])
-                        if required and len(required) > 0:
-                            # Assign to the first required parameter
-                            primary_key = required[0]
-                            args = {primary_key: cleaned_arg}
-                            print(f"DEBUG: Auto-mapped positional arg to '{primary_key}': {cleaned_arg}")
+                    # The compiled schema names the positional parameter (first required one)
+                    skill = self.available_skills.get(skill_name)
+                    reg_entry = skill['entry'] if skill else SkillRegistry.get_skill(skill_name)
+                    primary_key = reg_entry["validator"].positional if reg_entry else None
+                    if primary_key:
+                        args = {primary_key: cleaned_arg}
+                        print(f"DEBUG: Auto-mapped positional arg to '{primary_key}': {cleaned_arg}")
 
             elif match_json_no_pipe:
                  # Format: name {json} (Missing pipe)
@@ -165,44 +241,131 @@ class SkillDispatcher:
              if not found_fuzzy:
                  return f"[ERROR: Skill '{skill_name}' is not enabled for this agent. Content: {content}]", True
 
-        # Get Handler
-        reg_entry = SkillRegistry.get_skill(skill_name)
+        # Get Handler (resolved when the binding was built)
+        reg_entry = self.available_skills[skill_name]['entry']
         if not reg_entry:
             return f"[ERROR: Skill implementation for '{skill_name}' not found in registry.]", True
         
         handler = reg_entry['handler']
-        
-        # Prepare Config
-        merged_config = global_config.copy()
-        
-        # Inject Agent Identity for file saving
-        merged_config['agent_name'] = self.agent.name
-        merged_config['agent_provider'] = getattr(self.agent, 'provider', 'openai')
-        
-        # Inject Gemini Key if available (it might be in global_config, but let's ensure it's accessible)
-        # global_config in main.py usually comes from get_llm_config which HAS gemini_api_key.
-        # So we just rely on global_config having it.
 
+        # Validate / coerce against the compiled schema before running anything
+        args, errors = reg_entry['validator'](args)
+        if errors:
+            print(f"DEBUG: Rejected {skill_name} arguments: {errors}")
+            return reg_entry['validator'].error_message(skill_name, errors), True
         
-        agent_skill_config = self.available_skills[skill_name]['config']
-        if agent_skill_config:
-            merged_config.update(agent_skill_config)
+        # Prepare Config
+        # Layered lookup instead of copying the global config on every call:
+        # (agent skill override > agent identity, pre-merged) > global provider config.
+        merged_config = ChainMap(self.available_skills[skill_name]['merged_config'], global_config)
             
         # Execute
         try:
             print(f"Executing Skill: {skill_name} with args: {args}")
             # Ensure args match requirements (simple check?)
             result = handler(merged_config, args)
+            if inspect.isawaitable(result):
+                limit = reg_entry.get("timeout") or DEFAULT_SKILL_TIMEOUT
+                try:
+                    result = _await_result(result, limit)
+                except FutureTimeoutError:
+                    return f"[ERROR: Skill timed out after {limit:g}s. Continue without this result.]", True
             return result, True
         except Exception as e:
             return f"[ERROR: Skill execution failed: {str(e)}]", True
 
+    def find_skill_tags(self, text: str) -> list:
+        """All [[CALL_SKILL: ...]] tags in a response, in order, without duplicates."""
+        return list(dict.fromkeys(tag.raw for tag in tag_tokenizer.iter_tags(text, ("CALL_SKILL",))))
+
+    def _entry_of(self, tag: str) -> dict:
+        name = skill_name_of(tag)
+        skill = self.available_skills.get(name)
+        reg_entry = skill['entry'] if skill else (SkillRegistry.get_skill(name) if name else None)
+        return reg_entry or {}
+
+    def skill_timeout(self, tag: str) -> float:
+        return self._entry_of(tag).get("timeout") or DEFAULT_SKILL_TIMEOUT
+
+    def skill_concurrency(self, tag: str) -> str:
+        return self._entry_of(tag).get("concurrency") or "default"
+
+    def execute_all(self, tags: list, global_config: dict, on_start=None, on_result=None) -> list:
+        """
+        Run the skill calls of one response concurrently (they were issued
+        together, so none can depend on another's result), each on the pool of
+        its skill's concurrency class. A call running longer than its skill's
+        timeout is abandoned (async handlers: cancelled) and reported as an error.
+        A class whose pool threads are all held by abandoned calls takes no new
+        calls until one returns; those calls are reported as unavailable.
+        Returns [(tag, result, executed)] in the order of `tags`.
+        """
+        started = {}
+        results = {}
+
+        def _run(tag):
+            started[tag] = time.monotonic()
+            if on_start:
+                on_start(tag)
+            return self.parse_and_execute(tag, global_config)
+
+        def _finish(tag, result, executed):
+            results[tag] = (result, executed)
+            if on_result:
+                on_result(tag, result, executed)
+
+        def _unavailable(tag, concurrency):
+            _finish(tag, f"[ERROR: Skill unavailable: every '{concurrency}' slot is held by a timed-out call. Continue without this result.]", True)
+
+        futures = {}
+        for tag in tags:
+            concurrency = self.skill_concurrency(tag)
+            if _pool_blocked(concurrency):
+                _unavailable(tag, concurrency)
+            else:
+                futures[_pool_for(concurrency).submit(_run, tag)] = tag
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=TIMEOUT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    _finish(futures[future], *future.result())
+                except Exception as e:
+                    _finish(futures[future], f"[ERROR: Skill execution failed: {str(e)}]", True)
+
+            # Per-skill timeout counts from when the call left the queue
+            now = time.monotonic()
+            for future in list(pending):
+                tag = futures[future]
+                limit = self.skill_timeout(tag)
+                if tag in started and now - started[tag] > limit:
+                    pending.discard(future)
+                    if not future.cancel():
+                        _track_timed_out(self.skill_concurrency(tag), future, tag)
+                    _finish(tag, f"[ERROR: Skill timed out after {limit:g}s. Continue without this result.]", True)
+                elif tag not in started and _pool_blocked(self.skill_concurrency(tag)) and future.cancel():
+                    # Still queued behind calls that will not return in time
+                    pending.discard(future)
+                    _unavailable(tag, self.skill_concurrency(tag))
+
+        return [(tag,) + results[tag] for tag in tags]
+
+    @staticmethod
+    def format_observation(results: list) -> str:
+        """One observation message for all skill results of a turn."""
+        if len(results) == 1:
+            return f"System Output: {results[0][1]}"
+        parts = [f"System Output ({len(results)} skill calls, run together):"]
+        for i, (tag, result, _) in enumerate(results, 1):
+            parts.append(f"[{i}] {tag}\n{result}")
+        return "\n\n".join(parts)
+
     def _parse_key_value(self, text):
         args = {}
         # Regex for key="value" or key='value' or key=123
         # Supports both = and : as separators
-        arg_pattern = r'(\w+)\s*[=:]\s*(?:"([^"]*)"|\'([^\']*)\'|([0-9.]+))'
-        for arg_match in re.finditer(arg_pattern, text):
+        for arg_match in KEY_VALUE_PATTERN.finditer(text):
             key = arg_match.group(1)
             val = arg_match.group(2) or arg_match.group(3) or arg_match.group(4)
             args[key] = val
@@ -0,0 +1,307 @@
+"""
+Out-of-process runner for skills registered with `isolation="isolated"`.
+
+Plugins dropped into backend/app/skills/ run inside the API server by default.
+An isolated skill instead runs in a small pool of worker processes
+(`python -m backend.app.skill_runner`), so a CPU-heavy or leaking plugin can
+only take down its worker:
+
+- RPC: one JSON line per request / response over the worker's stdin / stdout
+      -> {"skill", "module", "file", "config", "args", "cpu_seconds", "memory_mb"}
+      <- {"ok": true, "result": ...} | {"ok": false, "error": ..., "recycle": bool}
+  The worker moves its own prints to stderr so plugins cannot break the protocol.
+- Limits (POSIX, via `resource`): CPU seconds per call (RLIMIT_CPU, SIGXCPU ends
+  the call) and the worker's address space (RLIMIT_AS). A call running past its
+  wall-clock timeout gets its worker killed. On Windows there is no `resource`:
+  isolated skills still run out of process with the wall-clock timeout, but
+  without CPU / memory caps.
+- Responses are read by a daemon thread per worker into a queue (the parent
+  waits with `get(timeout)`; `select` on pipes does not work on Windows).
+- Recycling: a worker is replaced after MAX_CALLS_PER_WORKER calls, after a
+  limit was hit, or when it died.
+
+The pool starts on the first isolated call; `shutdown()` stops it.
+"""
+import asyncio
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+try:
+    import resource
+    import signal
+except ImportError: # Windows: no CPU / memory limits, wall-clock timeout only
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+POOL_SIZE = 2
+MAX_CALLS_PER_WORKER = 50
+DEFAULT_CPU_SECONDS = 30
+DEFAULT_MEMORY_MB = 512
+DEFAULT_WALL_SECONDS = 60
+WALL_MARGIN_SECONDS = 5 # Worker startup + plugin import
+
+
+class SkillRunnerError(Exception):
+    pass
+
+
+# --- Parent side ---
+
+class _Worker:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "backend.app.skill_runner"],
+            cwd=ROOT_DIR,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        self.calls = 0
+        self.healthy = True
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, name="skill-runner-reader", daemon=True).start()
+
+    def _read(self):
+        # Protocol lines -> queue; "" once the worker's stdout closes
+        try:
+            for line in self.proc.stdout:
+                self._lines.put(line)
+        except (OSError, ValueError):
+            pass
+        self._lines.put("")
+
+    def call(self, request: dict, timeout: float) -> dict:
+        self.calls += 1
+        try:
+            self.proc.stdin.write(json.dumps(request, default=str) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.healthy = False
+            raise SkillRunnerError(f"worker unavailable: {e}")
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            self.healthy = False # Killed on release, so a late answer is never read
+            raise SkillRunnerError(f"timed out after {timeout:g}s")
+        if not line:
+            self.healthy = False
+            raise SkillRunnerError(f"worker exited (code {self.proc.poll()}); a resource limit may have been exceeded")
+        response = json.loads(line)
+        if response.get("recycle"):
+            self.healthy = False
+        return response
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SkillRunnerPool:
+    def __init__(self, size: int = None, max_calls: int = None):
+        self.size = size or POOL_SIZE
+        self.max_calls = max_calls or MAX_CALLS_PER_WORKER
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    def _acquire(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    spawn = self._started < self.size
+                    if spawn:
+                        self._started += 1
+                if spawn:
+                    try:
+                        return _Worker()
+                    except Exception:
+                        with self._lock:
+                            self._started -= 1
+                        raise
+                worker = self._idle.get()
+            if worker is not None:
+                return worker
+            # None: a worker was retired, its slot is free to spawn again
+
+    def _release(self, worker: _Worker):
+        if self._closed or not worker.healthy or worker.calls >= self.max_calls:
+            worker.stop()
+            with self._lock:
+                self._started -= 1
+            self._idle.put(None) # Wake a caller waiting for a worker
+            return
+        self._idle.put(worker)
+
+    def call(self, request: dict, timeout: float):
+        worker = self._acquire()
+        try:
+            response = worker.call(request, timeout)
+        finally:
+            self._release(worker)
+        if not response.get("ok"):
+            raise SkillRunnerError(response.get("error") or "unknown error")
+        return response.get("result")
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SkillRunnerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SkillRunnerPool()
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def isolated_handler(name: str, func, timeout: float = None, limits: dict = None):
+    """Handler that runs `func` in the worker pool (used by SkillRegistry.register)."""
+    limits = limits or {}
+    wall = (timeout or DEFAULT_WALL_SECONDS) + WALL_MARGIN_SECONDS
+
+    def handler(config, args):
+        request = {
+            "skill": name,
+            "module": func.__module__,
+            "file": func.__globals__.get("__file__"), # Also set for privately loaded plugins
+            "config": dict(config),
+            "args": args,
+            "cpu_seconds": limits.get("cpu_seconds", DEFAULT_CPU_SECONDS),
+            "memory_mb": limits.get("memory_mb", DEFAULT_MEMORY_MB)
+        }
+        try:
+            return get_pool().call(request, wall)
+        except SkillRunnerError as e:
+            return f"[ERROR: Isolated skill '{name}' failed: {e}]"
+
+    handler.__name__ = f"isolated_{name}"
+    return handler
+
+
+# --- Worker side ---
+
+class _CpuLimitExceeded(BaseException):
+    # Not an Exception: a plugin's broad `except Exception` must not swallow it
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CpuLimitExceeded()
+
+
+def _load_skill(request: dict):
+    import importlib
+    import importlib.util
+    from backend.app.skills.registry import SkillRegistry
+
+    module_name = request["module"]
+    entry = SkillRegistry.get_skill(request["skill"])
+    if entry and entry.get("lazy"):
+        entry = SkillRegistry.load(request["skill"]) # Listed in the skill manifest
+    elif module_name not in sys.modules:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            # Plugin loaded from a file outside the package (see loader.py)
+            spec = importlib.util.spec_from_file_location(module_name, request["file"])
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+        entry = SkillRegistry.get_skill(request["skill"])
+    if not entry:
+        raise SkillRunnerError(f"skill '{request['skill']}' is not registered in {module_name}")
+    return entry["func"]
+
+
+def _set_limits(request: dict):
+    if resource is None:
+        return
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_used = int(used.ru_utime + used.ru_stime) + 1
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_used + int(request["cpu_seconds"]), cpu_hard))
+    _, as_hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (int(request["memory_mb"]) * 1024 * 1024, as_hard))
+
+
+def _clear_limits():
+    if resource is None:
+        return
+    for limit in (resource.RLIMIT_CPU, resource.RLIMIT_AS):
+        _, hard = resource.getrlimit(limit)
+        resource.setrlimit(limit, (hard, hard))
+
+
+def _handle(request: dict) -> dict:
+    try:
+        func = _load_skill(request)
+    except Exception as e:
+        return {"ok": False, "error": f"load failed: {e}", "recycle": True}
+    try:
+        _set_limits(request)
+        try:
+            result = func(request["config"], request["args"])
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(result)
+        finally:
+            _clear_limits()
+        return {"ok": True, "result": result}
+    except _CpuLimitExceeded:
+        return {"ok": False, "error": f"CPU limit of {request['cpu_seconds']}s exceeded", "recycle": True}
+    except MemoryError:
+        return {"ok": False, "error": f"memory limit of {request['memory_mb']} MB exceeded", "recycle": True}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def worker_main():
+    # Protocol on the original stdout; everything the plugins print goes to stderr
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        response = _handle(json.loads(line))
+        try:
+            payload = json.dumps(response, default=str)
+        except (TypeError, ValueError) as e:
+            payload = json.dumps({"ok": False, "error": f"unserializable result: {e}"})
+        protocol.write(payload + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    worker_main()
@@ -0,0 +1,123 @@
+"""
+Skill hot reload: adding or editing a plugin under backend/app/skills/ no
+longer needs a server restart.
+
+A background thread polls the plugin files' (mtime, size) every
+`skill_watch_seconds` (setting, default 2; 0 disables). Once a change has been
+stable for one poll (so a half-saved file is not imported), it calls
+`manifest.reload_plugins`, which builds the next registry generation with only
+the changed plugins re-registered and swaps it in. Calls in flight keep the
+entries (and handlers) of the generation they started with.
+
+After a swap:
+- only the added / changed skills are upserted into the `skills` table,
+- per-agent skill bindings are invalidated (skill_bindings.py),
+- the isolated-skill worker pool is recycled so workers import the new code.
+
+`POST /skills/reload` runs the same reload immediately.
+"""
+import os
+import threading
+from . import crud, settings_cache, skill_bindings, skill_runner
+from .database import SessionLocal
+from .skills import manifest
+from .skills.registry import SkillRegistry
+
+SKILLS_DIR = os.path.dirname(manifest.__file__)
+SKILLS_PACKAGE = "backend.app.skills"
+DEFAULT_WATCH_SECONDS = 2.0
+
+_reload_lock = threading.Lock()
+
+
+def _signature() -> dict:
+    signature = {}
+    for filename in manifest.plugin_files(SKILLS_DIR):
+        try:
+            st = os.stat(os.path.join(SKILLS_DIR, filename))
+        except OSError:
+            continue # Deleted between listdir and stat
+        signature[filename] = (st.st_mtime_ns, st.st_size)
+    return signature
+
+
+def _resync(summary: dict):
+    """Incremental `skills` table update for one reload."""
+    registry = SkillRegistry.get_all_skills()
+    upserts = {name: registry[name] for name in summary["added"] + summary["changed"] if name in registry}
+    db = SessionLocal()
+    try:
+        if upserts:
+            crud.sync_skills(db, upserts) # Also invalidates the skill bindings
+        else:
+            staged = skill_bindings.stage_version_bump(db)
+            db.commit()
+            skill_bindings.invalidate(staged=staged)
+    finally:
+        db.close()
+
+
+def reload_now():
+    """Reload changed plugins. Returns the reload summary, or None if nothing changed."""
+    with _reload_lock:
+        summary = manifest.reload_plugins(SKILLS_DIR, SKILLS_PACKAGE)
+        if summary is None:
+            return None
+        _resync(summary)
+        # Isolated skills: new workers import the new code, busy ones retire when done
+        skill_runner.shutdown()
+    print(f"Skill Reload: generation {summary['generation']} "
+          f"(added {summary['added']}, changed {summary['changed']}, removed {summary['removed']}, failed {summary['failed']})")
+    return summary
+
+
+class SkillWatcher:
+    """Background thread polling the plugin folder."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="skill-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _loop(self):
+        loaded = _signature()
+        seen = loaded
+        while not self._stopping.wait(self.interval):
+            try:
+                current = _signature()
+                # Reload once a change has stayed the same for one full poll
+                if current != loaded and current == seen:
+                    reload_now()
+                    loaded = current
+                seen = current
+            except Exception as e:
+                print(f"Skill Watcher: reload failed: {e}")
+                loaded = seen
+
+
+_watcher = None
+
+
+def start_watcher(db) -> SkillWatcher:
+    global _watcher
+    interval = float(settings_cache.get(db, "skill_watch_seconds", DEFAULT_WATCH_SECONDS) or 0)
+    if _watcher is None and interval > 0:
+        _watcher = SkillWatcher(interval)
+        _watcher.start()
+    return _watcher
+
+
+def stop_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
@@ -1,15 +1,15 @@
 # Expose Registry
 from .registry import SkillRegistry
 from .loader import load_skills_from_directory
+from .manifest import register_from_manifest
 import os
 
 # 1. Initialize Registry (Empty)
 
-# 2. Auto-load plugins in this folder
-# This includes 'builtins.py' because loader scans all .py files
-# EXCEPT excluded ones.
-# We excluded 'builtins.py' in loader logic? No, only 'registry' and 'loader'.
-# So 'builtins.py' will be loaded dynamically too.
+# 2. Register the plugins in this folder from the skill manifest
+# (manifest.py): metadata only, each plugin module (e.g. 'builtins.py') is
+# imported the first time one of its skills is called.
+# Plugins the manifest cannot describe are still imported here.
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-load_skills_from_directory(current_dir)
+register_from_manifest(current_dir, __name__)
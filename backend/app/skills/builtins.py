@@ -4,6 +4,49 @@ import requests
 import time
 from typing import Dict, Any
 from .registry import SkillRegistry
+from .. import doc_index, doc_search
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+COMPANY_DOC_DIR = os.path.join(BASE_DIR, "Company Doc")
+IMAGE_CACHE_TTL = 3600 # Same prompt for the same agent reuses the saved image for an hour
+
+# --- Cache Keys (see registry.py) ---
+
+def _image_cache_key(config: Dict[str, Any], args: Dict[str, Any]):
+    prompt = args.get("prompt")
+    if not prompt:
+        return None
+    # The markdown points into the agent's own assets folder
+    return json.dumps([config.get("agent_provider", "openai"), config.get("agent_name"), prompt, args.get("size")])
+
+def _resolve_read_path(file_path: str) -> str:
+    """Absolute target of a read_file argument (before the boundary check)."""
+    # Handle "Company Doc/..." prefix repetition
+    clean_path = file_path.replace("\\", "/")
+    if clean_path.startswith("Company Doc/"):
+        target_path = os.path.join(BASE_DIR, clean_path)
+    # Handle absolute path provided by system output?
+    elif os.path.isabs(clean_path):
+        target_path = clean_path
+    else:
+        target_path = os.path.join(COMPANY_DOC_DIR, clean_path)
+    return os.path.abspath(target_path)
+
+def _read_file_paths(config: Dict[str, Any], args: Dict[str, Any]):
+    file_path = args.get("file_path")
+    if not file_path:
+        return None
+    target_path = _resolve_read_path(file_path)
+    # Fuzzy lookups depend on the whole tree: not cached
+    if not target_path.startswith(os.path.abspath(COMPANY_DOC_DIR)) or not os.path.isfile(target_path):
+        return None
+    return [target_path]
+
+def _list_files_paths(config: Dict[str, Any], args: Dict[str, Any]):
+    subdir = (args.get("subdir") or "").replace("\\", "/").strip("/")
+    target_dir = os.path.join(COMPANY_DOC_DIR, subdir) if subdir else COMPANY_DOC_DIR
+    # The directory's mtime changes whenever an entry is added, removed or renamed
+    return [target_dir] if os.path.isdir(target_dir) else None
 
 # --- Skill Implementations ---
 
@@ -18,14 +61,18 @@ from .registry import SkillRegistry
             "size": {"type": "string", "enum": ["1024x1024"], "default": "1024x1024"}
         },
         "required": ["prompt"]
-    }
+    },
+    aliases={"prompt": ["description"]},
+    timeout=120, # Generation (60s) + download (30s)
+    concurrency="generation",
+    cache={"key": _image_cache_key, "ttl": IMAGE_CACHE_TTL}
 )
 def generate_image(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     """
     Handler for Image Generation.
     Returns: Markdown String (image url) or Status Message.
     """
-    prompt = args.get("prompt") or args.get("description")
+    prompt = args.get("prompt")
     if not prompt:
         return "[ERROR: Missing 'prompt' argument. Please provide a description of what to draw.]"
 
@@ -142,6 +189,7 @@ def _save_base64_image(b64_data: str, agent_name: str, prompt: str) -> str:
         
         with open(file_path, "wb") as f:
             f.write(base64.b64decode(b64_data))
+        doc_index.note_write(file_path)
             
         print(f"Image saved to: {file_path}")
         return f"![Generated Image](assets/{filename})\n\n*(Prompt: {prompt})*"
@@ -165,6 +213,7 @@ def _download_and_return_markdown(url: str, agent_name: str, prompt: str) -> str
             
             with open(file_path, "wb") as f:
                 f.write(img_response.content)
+            doc_index.note_write(file_path)
                 
             print(f"Image saved to: {file_path}")
             return f"![Generated Image](assets/{filename})\n\n*(Prompt: {prompt})*"
@@ -185,7 +234,8 @@ def _download_and_return_markdown(url: str, agent_name: str, prompt: str) -> str
             "query": {"type": "string", "description": "Search usage keywords."}
         },
         "required": ["query"]
-    }
+    },
+    concurrency="io"
 )
 def web_search(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     # Placeholder for now
@@ -201,35 +251,24 @@ def web_search(config: Dict[str, Any], args: Dict[str, Any]) -> str:
             "file_path": {"type": "string", "description": "The path to the file (relative to Company Doc or absolute)."}
         },
         "required": ["file_path"]
-    }
+    },
+    aliases={"file_path": ["path", "filename", "file"]},
+    concurrency="io",
+    cache={"paths": _read_file_paths}
 )
 def read_file(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     """
     Safely reads a file from the Company Doc directory.
     """
-    # Robust Argument Handling: Support file_path, path, filename, file
-    file_path = args.get("file_path") or args.get("path") or args.get("filename") or args.get("file")
+    # Aliases (path, filename, file) are mapped to file_path by the dispatcher
+    file_path = args.get("file_path")
     
     if not file_path:
         return "[ERROR: Missing 'file_path' argument. Please specify the file to read.]"
         
     # Security: Resolve path and ensure it's within Company Doc
-    # BASE_DIR = ...backend/app/skills/builtins.py -> up 4 levels to root
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-    COMPANY_DOC_DIR = os.path.join(BASE_DIR, "Company Doc")
-    
-    # Normalize inputs
-    # Handle "Company Doc/..." prefix repetition
     clean_path = file_path.replace("\\", "/")
-    if clean_path.startswith("Company Doc/"):
-        target_path = os.path.join(BASE_DIR, clean_path)
-    # Handle absolute path provided by system output?
-    elif os.path.isabs(clean_path):
-        target_path = clean_path
-    else:
-        target_path = os.path.join(COMPANY_DOC_DIR, clean_path)
-        
-    target_path = os.path.abspath(target_path)
+    target_path = _resolve_read_path(file_path)
     
     # Boundary Check
     if not target_path.startswith(os.path.abspath(COMPANY_DOC_DIR)):
@@ -243,23 +282,16 @@ def read_file(config: Dict[str, Any], args: Dict[str, Any]) -> str:
         search_name = os.path.basename(clean_path)
         search_stem = os.path.splitext(search_name)[0] # "Report" from "Report.md"
         
-        candidates = []
-        for root, dirs, files in os.walk(COMPANY_DOC_DIR):
-            for file in files:
-                # Candidate 1: Exact Filename Match
-                if file == search_name:
-                    candidates.append(os.path.join(root, file))
-                    continue
-                
-                # Candidate 2: Prefix Match with Hash (file starts with "Report" and ends with ".md")
-                # Ensure we don't match "ReportALL.md" if looking for "Report"
-                if file.startswith(search_stem) and file.endswith(".md"):
-                     candidates.append(os.path.join(root, file))
+        # Served by the Company Doc file index (no tree walk)
+        # Candidate 1: Exact Filename Match
+        candidates = {doc.path: doc for doc in doc_index.index.find_by_name(search_name)}
+        # Candidate 2: Prefix Match with Hash (file starts with "Report" and ends with ".md")
+        for doc in doc_index.index.find_by_prefix(search_stem, ".md"):
+            candidates.setdefault(doc.path, doc)
         
         if candidates:
             # Sort by modification time (Newest First)
-            candidates.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-            target_path = candidates[0]
+            target_path = doc_index.index.abspath(doc_index.newest(list(candidates.values()))[0])
             # Optional: We could return a note saying "Auto-selected latest file: ..."
         else:
              return f"[ERROR: File not found: {file_path}. (Searched for exact name and latest version starting with '{search_stem}')]"
@@ -283,10 +315,13 @@ def read_file(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     parameters={
         "type": "object",
         "properties": {
-            "subdir": {"type": "string", "description": "Optional subdirectory to filter (e.g. 'Xiao Zhang')."}
+            "subdir": {"type": "string", "description": "Optional subdirectory to filter (e.g. 'Xiao Zhang').", "default": ""}
         },
         "required": []
-    }
+    },
+    aliases={"subdir": ["directory", "folder", "path"]},
+    concurrency="io",
+    cache={"paths": _list_files_paths}
 )
 def list_files(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     """
@@ -294,10 +329,6 @@ def list_files(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     """
     subdir = args.get("subdir", "")
     
-    # Base Dir logic (same as read_file)
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-    COMPANY_DOC_DIR = os.path.join(BASE_DIR, "Company Doc")
-    
     if subdir:
         # Sanitize subdir
         subdir = subdir.replace("\\", "/").strip("/")
@@ -308,19 +339,52 @@ def list_files(config: Dict[str, Any], args: Dict[str, Any]) -> str:
     if not os.path.exists(target_dir):
         return f"[ERROR: Directory not found: {subdir}]"
         
-    # Walk and list
-    file_list = []
+    # Listed from the Company Doc file index
     try:
+        doc_index.index.sync_dir(subdir)
+        dirs, files = doc_index.index.list_dir(subdir)
         # If listing root, show subfolders (Agents)
         if not subdir:
-            items = os.listdir(target_dir)
-            files = [f for f in items if os.path.isfile(os.path.join(target_dir, f))]
-            dirs = [d for d in items if os.path.isdir(os.path.join(target_dir, d))]
             return f"[CONTENTS of Company Doc]:\nDIRS: {', '.join(dirs)}\nFILES: {', '.join(files)}\n(Tip: Use subdir='AgentName' to see their files)"
         
         # If listing subdir, show files
-        items = os.listdir(target_dir)
-        files = [f for f in items if os.path.isfile(os.path.join(target_dir, f)) and not f.startswith(".")]
+        files = [f for f in files if not f.startswith(".")]
         return f"[FILES in {subdir}]:\n" + "\n".join(files)
     except Exception as e:
         return f"[ERROR: Failed to list files: {str(e)}]"
+
+@SkillRegistry.register(
+    name="search_docs",
+    display_name="Search Company Documents",
+    description="Full-text search over all Markdown documents in Company Doc (English and Chinese). Returns the best matching files with the passages that match; use read_file only if you need the whole file.",
+    parameters={
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Keywords or a \"quoted phrase\" to look for."},
+            "author": {"type": "string", "description": "Optional: only search this agent's folder (e.g. 'Xiao Zhang').", "default": ""},
+            "limit": {"type": "integer", "description": "Maximum number of results (1-20).", "default": 5}
+        },
+        "required": ["query"]
+    },
+    aliases={"query": ["q", "keywords", "text"], "author": ["subdir", "folder", "agent"]},
+    concurrency="io"
+)
+def search_docs(config: Dict[str, Any], args: Dict[str, Any]) -> str:
+    """
+    Ranked snippets from the Company Doc full-text index (see doc_search.py).
+    """
+    query = args.get("query", "")
+    author = (args.get("author") or "").replace("\\", "/").strip("/") or None
+    try:
+        hits = doc_search.search(query, limit=args.get("limit", 5), author=author)
+    except doc_search.SearchUnavailable as e:
+        return f"[ERROR: Document search is not available on this server ({e}). Use list_files / read_file instead.]"
+
+    if not hits:
+        return f"[SEARCH RESULTS for '{query}']: No matching documents."
+    lines = [f"[SEARCH RESULTS for '{query}']:"]
+    for i, hit in enumerate(hits, 1):
+        lines.append(f"{i}. {hit['path']} — {hit['title']}")
+        lines.append(f"   {' '.join(hit['snippet'].split())}")
+    lines.append("(Tip: read_file with the path above to read a whole document)")
+    return "\n".join(lines)
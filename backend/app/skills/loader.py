@@ -2,16 +2,64 @@ import os
 import importlib.util
 import sys
 
+def load_plugin(module_name: str, file_path: str, into: dict = None):
+    """
+    Import one plugin file under `module_name` (runs its @register decorators).
+    Returns the module, or None if it failed to load.
+
+    into: a lazy registry entry to fill instead. The file runs as a private
+    module (not in sys.modules) from the source kept in the entry, its
+    registrations are captured, and only the entry with the same name is
+    copied into `into`; no registry generation is touched.
+    """
+    if into is not None:
+        return _load_into(module_name, file_path, into)
+    # Check if already loaded
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        if spec and spec.loader:
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            print(f"Loaded Skill Plugin: {os.path.basename(file_path)}")
+            return module
+    except Exception as e:
+        sys.modules.pop(module_name, None)
+        print(f"Failed to load plugin {os.path.basename(file_path)}: {e}")
+    return None
+
+def _load_into(module_name: str, file_path: str, into: dict):
+    from .registry import SkillRegistry
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        if spec and spec.loader:
+            module = importlib.util.module_from_spec(spec)
+            with SkillRegistry.capture() as captured:
+                if into.get("source") is not None:
+                    # The code this generation was registered from (the file may have changed since)
+                    exec(compile(into["source"], file_path, "exec"), module.__dict__)
+                else:
+                    spec.loader.exec_module(module)
+            if into["name"] in captured:
+                into.update(captured[into["name"]])
+            return module
+    except Exception as e:
+        print(f"Failed to load plugin {os.path.basename(file_path)}: {e}")
+    return None
+
 def load_skills_from_directory(directory: str):
     """
     Dynamically load all .py files in the directory.
     This allows 'Plug-and-Play' of new skills.
+    (The package's own folder is registered lazily from its manifest instead.)
     """
     print(f"Scanning for plugins in: {directory}")
     for filename in os.listdir(directory):
         if filename.endswith(".py") and not filename.startswith("__"):
             # Exclude core files to avoid circular imports or re-imports
-            if filename in ["registry.py", "loader.py", "__init__.py"]:
+            if filename in ["registry.py", "loader.py", "manifest.py", "validation.py", "__init__.py"]:
                 continue
             
             # Construct module name logic
@@ -20,18 +68,4 @@ def load_skills_from_directory(directory: str):
             # But here we want to ensure they run their @register decorators.
             
             module_name = f"backend.app.skills.{filename[:-3]}"
-            file_path = os.path.join(directory, filename)
-            
-            try:
-                # Check if already loaded
-                if module_name in sys.modules:
-                    continue
-                    
-                spec = importlib.util.spec_from_file_location(module_name, file_path)
-                if spec and spec.loader:
-                    module = importlib.util.module_from_spec(spec)
-                    sys.modules[module_name] = module
-                    spec.loader.exec_module(module)
-                    print(f"Loaded Skill Plugin: {filename}")
-            except Exception as e:
-                print(f"Failed to load plugin {filename}: {e}")
+            load_plugin(module_name, os.path.join(directory, filename))
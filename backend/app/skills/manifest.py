@@ -0,0 +1,211 @@
+"""
+Skill manifest: what the plugins in this folder register, without importing them.
+
+Each plugin is parsed with `ast` and every function decorated with
+`@SkillRegistry.register(...)` becomes a manifest entry (name, display name,
+description, parameter schema, aliases, timeout, concurrency, isolation, limits,
+module, function). At startup the registry is filled from these entries and a
+plugin module is only imported when one of its skills is first called
+(`SkillRegistry.load`). `reload_plugins` re-registers changed plugins into a
+new registry generation (hot reload, see skill_watcher.py).
+
+manifest.json (generated, not versioned) is keyed on each plugin's sha256, so
+edited or new plugins are re-parsed automatically. A plugin whose registration
+cannot be read statically (non-literal name / parameters, or a decorator the
+parser does not recognise) is imported at startup as before.
+COMPANY_SKILLS_EAGER=1 imports everything up front.
+"""
+import ast
+import hashlib
+import json
+import os
+import sys
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+CORE_FILES = ("registry.py", "loader.py", "manifest.py", "validation.py", "__init__.py")
+# Literal keyword arguments of SkillRegistry.register kept in the manifest
+META_FIELDS = ("name", "display_name", "description", "parameters", "aliases", "timeout", "concurrency", "isolation", "limits")
+REQUIRED_FIELDS = ("name", "display_name", "description", "parameters")
+
+
+def plugin_files(directory: str) -> list:
+    return sorted(
+        f for f in os.listdir(directory)
+        if f.endswith(".py") and not f.startswith("__") and f not in CORE_FILES
+    )
+
+
+def _is_register_call(node) -> bool:
+    # @SkillRegistry.register(...) or @register(...)
+    if not isinstance(node, ast.Call):
+        return False
+    func = node.func
+    return (isinstance(func, ast.Attribute) and func.attr == "register") or \
+        (isinstance(func, ast.Name) and func.id == "register")
+
+
+def parse_plugin(path: str, module_name: str):
+    """
+    Manifest entries of one plugin file, or None if it has to be imported to
+    know what it registers.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source, filename=path)
+
+    entries = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not _is_register_call(decorator):
+                continue
+            if decorator.args:
+                return None # Positional arguments: not worth guessing
+            meta = {}
+            for keyword in decorator.keywords:
+                if keyword.arg not in META_FIELDS:
+                    continue # e.g. cache=: applied when the module is imported
+                try:
+                    meta[keyword.arg] = ast.literal_eval(keyword.value)
+                except (ValueError, TypeError, SyntaxError):
+                    return None
+            if any(field not in meta for field in REQUIRED_FIELDS):
+                return None
+            meta.update({"module": module_name, "function": node.name})
+            entries.append(meta)
+    return entries
+
+
+def _sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest(directory: str, package: str, write: bool = True) -> dict:
+    """
+    {file name: {"sha256", "skills": [entries] | None}} for every plugin in
+    `directory`, re-parsing only the files that changed since manifest.json.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    cached = {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == MANIFEST_VERSION:
+            cached = data.get("plugins", {})
+    except (OSError, ValueError):
+        pass
+
+    plugins = {}
+    changed = False
+    for filename in plugin_files(directory):
+        path = os.path.join(directory, filename)
+        digest = _sha256(path)
+        entry = cached.get(filename)
+        if entry and entry.get("sha256") == digest:
+            plugins[filename] = entry
+            continue
+        try:
+            skills = parse_plugin(path, f"{package}.{filename[:-3]}")
+        except SyntaxError as e:
+            print(f"Skill manifest: cannot parse {filename}: {e}")
+            skills = None
+        plugins[filename] = {"sha256": digest, "skills": skills}
+        changed = True
+    if set(plugins) != set(cached):
+        changed = True
+
+    if changed and write:
+        try:
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "plugins": plugins}, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Skill manifest: could not write {manifest_path}: {e}")
+    return plugins
+
+
+def _register_plugin(directory: str, package: str, filename: str, entry: dict, eager: bool) -> bool:
+    """Register one plugin into the registry's current target. False if it failed to import."""
+    from .registry import SkillRegistry
+    from .loader import load_plugin
+
+    module_name = f"{package}.{filename[:-3]}"
+    path = os.path.join(directory, filename)
+    if eager or entry["skills"] is None:
+        return load_plugin(module_name, path) is not None
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        source = None
+    for meta in entry["skills"]:
+        SkillRegistry.register_lazy(meta, path, source)
+    return True
+
+
+def register_from_manifest(directory: str, package: str):
+    """Register manifest metadata lazily; import the plugins it cannot describe."""
+    from .registry import SkillRegistry
+
+    eager = os.environ.get("COMPANY_SKILLS_EAGER") == "1"
+    plugins = load_manifest(directory, package)
+    for filename, entry in plugins.items():
+        _register_plugin(directory, package, filename, entry, eager)
+    SkillRegistry._plugins = {filename: entry["sha256"] for filename, entry in plugins.items()}
+
+
+def reload_plugins(directory: str, package: str):
+    """
+    Hot reload: build the next registry generation from the current one,
+    re-registering only the plugins whose file changed (and dropping deleted
+    ones), then swap it in. Calls already holding an entry finish on the old
+    generation. A changed plugin that fails to import keeps its old entries.
+
+    Returns None if nothing changed, else
+    {"generation", "added", "changed", "removed", "failed"} (skill / file names).
+    """
+    from .registry import SkillRegistry
+
+    eager = os.environ.get("COMPANY_SKILLS_EAGER") == "1"
+    with SkillRegistry._load_lock:
+        plugins = load_manifest(directory, package)
+        known = SkillRegistry._plugins
+        changed_files = [f for f, entry in plugins.items() if known.get(f) != entry["sha256"]]
+        removed_files = [f for f in known if f not in plugins]
+        if not changed_files and not removed_files:
+            return None
+
+        old = SkillRegistry.get_all_skills()
+        stale = {f"{package}.{f[:-3]}" for f in changed_files + removed_files}
+        SkillRegistry.begin_generation({n: e for n, e in old.items() if e.get("module") not in stale})
+        failed = []
+        try:
+            for filename in changed_files:
+                module_name = f"{package}.{filename[:-3]}"
+                previous = sys.modules.pop(module_name, None)
+                if not _register_plugin(directory, package, filename, plugins[filename], eager):
+                    failed.append(filename)
+                    # Keep serving the last good version
+                    if previous is not None:
+                        sys.modules[module_name] = previous
+                    for name, entry in old.items():
+                        if entry.get("module") == module_name:
+                            SkillRegistry._building.setdefault(name, entry)
+            for filename in removed_files:
+                sys.modules.pop(f"{package}.{filename[:-3]}", None)
+            new = SkillRegistry._building
+            generation = SkillRegistry.swap({f: entry["sha256"] for f, entry in plugins.items()})
+        except Exception:
+            SkillRegistry.abort_generation()
+            raise
+
+    reloaded = {f"{package}.{f[:-3]}" for f in changed_files}
+    return {
+        "generation": generation,
+        "added": sorted(n for n in new if n not in old),
+        "changed": sorted(n for n in new if n in old and new[n].get("module") in reloaded and new[n] is not old[n]),
+        "removed": sorted(n for n in old if n not in new),
+        "failed": failed
+    }
@@ -1,21 +1,284 @@
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict, Any, Callable
+from .validation import compile_schema
+
+# --- Result Memoization (opt-in per skill) ---
+# A skill registered with `cache=` gets its handler wrapped so repeated calls
+# with the same arguments are answered from memory:
+#
+#   cache={"paths": fn(config, args) -> [path, ...] | None}
+#       File-backed skills. The entry is keyed on the arguments and validated
+#       by the (path, mtime, size) of every returned path, so it is replaced as
+#       soon as one of them changes (a directory's mtime changes when entries
+#       are added, removed or renamed). None bypasses the cache for that call.
+#   cache={"key": fn(config, args) -> str | None, "ttl": seconds}
+#       Pure generators: keyed on a hash of what the output depends on and
+#       kept for `ttl` seconds.
+#
+# Optional "max_entries" / "max_chars" bound each skill's LRU.
+# Error results ("[ERROR...") are never stored.
+DEFAULT_CACHE_ENTRIES = 256
+DEFAULT_CACHE_CHARS = 2_000_000
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (path, None, None)
+
+
+class SkillCache:
+    """Size-bounded LRU of one skill's results, with hit/miss counters."""
+
+    def __init__(self, name: str, handler: Callable, spec: Dict[str, Any]):
+        self.name = name
+        self.handler = handler
+        self.paths = spec.get("paths")
+        self.key = spec.get("key")
+        self.ttl = spec.get("ttl")
+        self.max_entries = spec.get("max_entries", DEFAULT_CACHE_ENTRIES)
+        self.max_chars = spec.get("max_chars", DEFAULT_CACHE_CHARS)
+        self._entries = OrderedDict() # key -> (result, stored_at, validator)
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.bypassed = self.evictions = 0
+
+    def _make_key(self, config, args):
+        """(key, validator): a stored entry is used only if its validator matches."""
+        if self.paths:
+            paths = self.paths(config, args)
+            if paths is None:
+                return None, None
+            return json.dumps(args, sort_keys=True, default=str), tuple(_stamp(p) for p in paths)
+        material = self.key(config, args)
+        if material is None:
+            return None, None
+        return hashlib.sha256(material.encode("utf-8")).hexdigest(), None
+
+    def __call__(self, config, args):
+        key, validator = self._make_key(config, args)
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return self.handler(config, args)
+
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit and hit[2] == validator and (self.ttl is None or now - hit[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[0]
+            if hit:
+                self._drop(key) # Stale: file changed or TTL passed
+            self.misses += 1
+
+        result = self.handler(config, args)
+        if inspect.isawaitable(result):
+            return self._store_when_done(key, validator, now, result)
+        self._store(key, validator, now, result)
+        return result
+
+    async def _store_when_done(self, key, validator, now, awaitable):
+        result = await awaitable
+        self._store(key, validator, now, result)
+        return result
+
+    def _store(self, key, validator, now, result):
+        if isinstance(result, str) and not result.startswith("[ERROR") and len(result) <= self.max_chars:
+            with self._lock:
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = (result, now, validator)
+                self._chars += len(result)
+                while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+
+    def _drop(self, key):
+        result = self._entries.pop(key)[0]
+        self._chars -= len(result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "skill": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "chars": self._chars,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
 
 class SkillRegistry:
+    # Current generation: replaced as a whole on hot reload (swap()), so a
+    # caller holding an entry keeps using that generation's handler.
     _skills: Dict[str, Dict[str, Any]] = {}
+    _building: Dict[str, Dict[str, Any]] = None # Generation being built (reload)
+    _capturing: Dict[str, Dict[str, Any]] = None # Private import of one lazy entry (see capture())
+    _plugins: Dict[str, str] = {} # Plugin file -> sha256 of the current generation
+    generation = 0
+    _load_lock = threading.RLock()
 
     @classmethod
-    def register(cls, name: str, display_name: str, description: str, parameters: Dict[str, Any]):
+    def register(cls, name: str, display_name: str, description: str, parameters: Dict[str, Any], timeout: float = None, concurrency: str = "default", cache: Dict[str, Any] = None, isolation: str = "in_process", limits: Dict[str, Any] = None, aliases: Dict[str, list] = None):
+        # func: plain function or `async def` (awaited on the dispatcher's event loop)
+        # timeout: seconds before the dispatcher gives up on one call (None = dispatcher default)
+        # concurrency: pool ("bulkhead") the calls run on, e.g. "io", "generation"
+        # cache: opt-in memoization spec (see above)
+        # isolation: "in_process" or "isolated" (runs in the skill_runner worker pool,
+        #   with limits={"cpu_seconds": ..., "memory_mb": ...})
+        # aliases: other names agents use for a parameter, e.g. {"file_path": ["path", "file"]}
+        #   (parameters + aliases are compiled into a validator, see validation.py)
+        if isolation not in ("in_process", "isolated"):
+            raise ValueError(f"Skill '{name}': isolation must be 'in_process' or 'isolated'")
         def decorator(func: Callable):
-            cls._skills[name] = {
+            call = func
+            if isolation == "isolated":
+                from ..skill_runner import isolated_handler
+                call = isolated_handler(name, func, timeout=timeout, limits=limits)
+            skill_cache = SkillCache(name, call, cache) if cache else None
+            validator = compile_schema(parameters, aliases)
+            entry = {
                 "name": name,
                 "display_name": display_name,
                 "description": description,
                 "parameters": parameters,
-                "handler": func
+                "validator": validator,
+                "timeout": timeout,
+                "concurrency": concurrency,
+                "is_async": inspect.iscoroutinefunction(func),
+                "isolation": isolation,
+                "func": func,
+                "handler": skill_cache or call,
+                "cache": skill_cache,
+                "lazy": False,
+                "module": func.__module__
             }
+            target = cls._target()
+            existing = target.get(name)
+            if existing and existing.get("lazy"):
+                # Same dict: holders of the manifest entry now get the real handler
+                existing.update(entry)
+            else:
+                target[name] = entry
             return func
         return decorator
 
+    @classmethod
+    def _target(cls) -> Dict[str, Dict[str, Any]]:
+        if cls._capturing is not None:
+            return cls._capturing
+        return cls._building if cls._building is not None else cls._skills
+
+    @classmethod
+    @contextmanager
+    def capture(cls):
+        """Collect the registrations made inside the block into a scratch dict instead of any generation."""
+        with cls._load_lock:
+            cls._capturing = {}
+            try:
+                yield cls._capturing
+            finally:
+                cls._capturing = None
+
+    @classmethod
+    def register_lazy(cls, meta: Dict[str, Any], file_path: str, source: bytes = None):
+        """
+        Register a skill from its manifest entry (skills/manifest.py); its
+        module is imported on the first call. `source` is the plugin code the
+        manifest was read from, so an entry of a superseded generation can
+        still be loaded after its file changed or was deleted.
+        """
+        name = meta["name"]
+        target = cls._target()
+        if name in target:
+            return
+
+        # Bound to this entry, not to the name: after a hot reload swap, a call
+        # holding this generation's entry must not resolve to the new one
+        def load_and_call(config, args):
+            return cls._load_entry(entry)["handler"](config, args)
+
+        entry = target[name] = {
+            "name": name,
+            "display_name": meta["display_name"],
+            "description": meta["description"],
+            "parameters": meta["parameters"],
+            "validator": compile_schema(meta["parameters"], meta.get("aliases")),
+            "timeout": meta.get("timeout"),
+            "concurrency": meta.get("concurrency", "default"),
+            "is_async": None, # Known once imported
+            "isolation": meta.get("isolation", "in_process"),
+            "func": None,
+            "handler": load_and_call,
+            "cache": None,
+            "lazy": True,
+            "module": meta["module"],
+            "file": file_path,
+            "source": source
+        }
+
+    @classmethod
+    def load(cls, name: str):
+        """The current generation's entry, importing its plugin module first if it is still lazy."""
+        entry = cls._skills.get(name)
+        return cls._load_entry(entry) if entry else entry
+
+    @classmethod
+    def _load_entry(cls, entry: Dict[str, Any]) -> Dict[str, Any]:
+        if not entry.get("lazy"):
+            return entry
+        from .loader import load_plugin
+        with cls._load_lock:
+            if entry.get("lazy") and cls._skills.get(entry["name"]) is entry and entry["module"] not in sys.modules:
+                # First call in the current generation: a normal import, whose
+                # decorators fill this generation's lazy entries in place
+                load_plugin(entry["module"], entry["file"])
+            if entry.get("lazy"):
+                # Superseded generation (or the module was already imported by a
+                # newer one): run the plugin privately and fill only this entry
+                load_plugin(entry["module"], entry["file"], into=entry)
+            if entry.get("lazy"):
+                raise RuntimeError(f"Skill '{entry['name']}' is listed in the manifest but {entry['file']} did not register it")
+        return entry
+
+    @classmethod
+    def begin_generation(cls, carried: Dict[str, Dict[str, Any]]):
+        """Start building the next generation from the entries `carried` over. Caller holds `_load_lock`."""
+        cls._building = dict(carried)
+
+    @classmethod
+    def swap(cls, plugins: Dict[str, str]) -> int:
+        """Publish the generation being built (one reference assignment). Caller holds `_load_lock`."""
+        cls._skills, cls._building = cls._building, None
+        cls._plugins = dict(plugins)
+        cls.generation += 1
+        return cls.generation
+
+    @classmethod
+    def abort_generation(cls):
+        cls._building = None
+
     @classmethod
     def get_skill(cls, name: str):
         return cls._skills.get(name)
@@ -23,3 +286,13 @@ class SkillRegistry:
     @classmethod
     def get_all_skills(cls):
         return cls._skills
+
+    @classmethod
+    def cache_stats(cls) -> list:
+        return [entry["cache"].stats() for entry in cls._skills.values() if entry.get("cache")]
+
+    @classmethod
+    def clear_caches(cls):
+        for entry in cls._skills.values():
+            if entry.get("cache"):
+                entry["cache"].clear()
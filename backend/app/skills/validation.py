@@ -0,0 +1,196 @@
+"""
+Skill argument validation, compiled once per skill at registration.
+
+`compile_schema(parameters, aliases)` turns the skill's JSON Schema (the subset
+the skills use: object properties with type / enum / default, required,
+additionalProperties) into an `ArgValidator`. Calling it with the arguments an
+agent wrote returns (clean_args, errors):
+
+- aliases are renamed to the canonical property ("path" -> "file_path"),
+- values are coerced to the declared type where unambiguous ("3" -> 3,
+  "true" -> True, a JSON string -> list / object),
+- missing optional properties get their default,
+- anything else (missing required property, wrong type, value not in enum)
+  is reported as {"field", "problem"} and the handler is not called.
+
+Properties the schema does not declare are passed through unless
+additionalProperties is false.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class _Invalid(Exception):
+    pass
+
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise _Invalid("expected a string")
+
+
+def _to_integer(value):
+    if isinstance(value, bool):
+        raise _Invalid("expected an integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise _Invalid("expected an integer")
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        raise _Invalid("expected a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            pass
+    raise _Invalid("expected a number")
+
+
+_TRUE = {"true", "yes", "1"}
+_FALSE = {"false", "no", "0"}
+
+
+def _to_boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+        return value.strip().lower() in _TRUE
+    raise _Invalid("expected true or false")
+
+
+def _from_json(value, kind, expected):
+    if isinstance(value, kind):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, kind):
+            return parsed
+    raise _Invalid(f"expected {expected}")
+
+
+def _to_array(value):
+    return _from_json(value, list, "a list")
+
+
+def _to_object(value):
+    return _from_json(value, dict, "an object")
+
+
+COERCERS = {
+    "string": _to_string,
+    "integer": _to_integer,
+    "number": _to_number,
+    "boolean": _to_boolean,
+    "array": _to_array,
+    "object": _to_object
+}
+
+
+def _describe(prop: Dict[str, Any], required: bool) -> str:
+    text = prop.get("type", "any")
+    if "enum" in prop:
+        text += f" one of {prop['enum']}"
+    if required:
+        text += " (required)"
+    elif "default" in prop:
+        text += f" (default {prop['default']!r})"
+    return text
+
+
+class ArgValidator:
+    """Compiled form of one skill's parameter schema. Call it with the raw arguments."""
+
+    __slots__ = ("fields", "required", "aliases", "defaults", "additional", "positional", "expected")
+
+    def __init__(self, parameters: Optional[Dict[str, Any]], aliases: Optional[Dict[str, List[str]]] = None):
+        parameters = parameters or {}
+        properties = parameters.get("properties") or {}
+        self.required = tuple(parameters.get("required") or ())
+        self.additional = parameters.get("additionalProperties", True) is not False
+        # name -> (coerce, enum)
+        self.fields = {}
+        self.defaults = {}
+        for name, prop in properties.items():
+            coerce = COERCERS.get(prop.get("type"))
+            enum = frozenset(json.dumps(v, sort_keys=True) for v in prop["enum"]) if "enum" in prop else None
+            self.fields[name] = (coerce, enum)
+            if "default" in prop and name not in self.required:
+                self.defaults[name] = prop["default"]
+        self.aliases = {}
+        for canonical, names in (aliases or {}).items():
+            for alias in names:
+                self.aliases[alias] = canonical
+        # Where a single positional argument goes: name("value")
+        self.positional = self.required[0] if self.required else next(iter(properties), None)
+        self.expected = {name: _describe(prop, name in self.required) for name, prop in properties.items()}
+
+    def __call__(self, args) -> tuple:
+        if not isinstance(args, dict):
+            return args, [{"field": None, "problem": "arguments must be a JSON object"}]
+
+        errors = []
+        clean = {}
+        for key, value in args.items():
+            canonical = self.aliases.get(key, key)
+            if canonical in clean and canonical != key:
+                continue # The canonical name wins over an alias
+            clean[canonical] = value
+
+        for key in list(clean):
+            value = clean[key]
+            spec = self.fields.get(key)
+            if spec is None:
+                if not self.additional:
+                    errors.append({"field": key, "problem": "unknown argument"})
+                continue
+            if value is None and key not in self.required:
+                del clean[key] # Treated as omitted: default applies
+                continue
+            coerce, enum = spec
+            if coerce is not None:
+                try:
+                    value = coerce(value)
+                except _Invalid as e:
+                    errors.append({"field": key, "problem": str(e)})
+                    continue
+            if enum is not None and json.dumps(value, sort_keys=True) not in enum:
+                errors.append({"field": key, "problem": "value not allowed"})
+                continue
+            clean[key] = value
+
+        for key in self.required:
+            value = clean.get(key)
+            if value is None or value == "":
+                errors.append({"field": key, "problem": "required"})
+        for key, default in self.defaults.items():
+            if key not in clean:
+                clean[key] = default
+        return clean, errors
+
+    def error_message(self, skill_name: str, errors: list) -> str:
+        """Structured rejection returned to the agent instead of running the handler."""
+        detail = json.dumps({"errors": errors, "expected": self.expected}, ensure_ascii=False)
+        return f"[ERROR: Invalid arguments for skill '{skill_name}'. Nothing was executed; fix the arguments and call it again. {detail}]"
+
+
+def compile_schema(parameters: Optional[Dict[str, Any]], aliases: Optional[Dict[str, List[str]]] = None) -> ArgValidator:
+    return ArgValidator(parameters, aliases)
@@ -0,0 +1,155 @@
+"""
+Tokenizer for the `[[KIND: ...]]` control tags agents write into responses.
+
+    [[CALL_SKILL: read_file | {"file_path": "a.md"}]]
+    [[LOG: Meeting summary]]
+    [[EXECUTE_TASK: Title | Instruction]]
+    [[CREATE_PROJECT: Title | True | Agent: step | ...]]
+    [[DELEGATE: Agent | workflow_id | Instruction]]
+
+`scan(text)` finds all tags in one left-to-right pass: `str.find` jumps to the
+next "[[", one precompiled pattern checks the kind, and `str.find` jumps to
+the closing "]]" (the first one, as before: arguments cannot contain "]]",
+and tags do not nest).
+`TagStream` does the same incrementally for streamed output, keeping only the
+unfinished tail, so the total work stays linear in the response length.
+
+Each tag is a `Tag(kind, args, span, body, raw)`:
+- args: the "|"-separated arguments, stripped. CALL_SKILL splits only at the
+  first "|" into (skill, arguments), because its JSON may contain "|".
+- span: (start, end) offsets of the whole tag in the text / stream.
+
+Standard library only: also imported by frontend_app.py.
+Benchmarks: scripts/bench_tags.py
+"""
+import re
+from typing import Iterable, NamedTuple, Optional
+
+KINDS = ("CALL_SKILL", "LOG", "EXECUTE_TASK", "CREATE_PROJECT", "DELEGATE")
+OPEN = "[["
+CLOSE = "]]"
+# Checked at a "[[" position only, never searched
+_OPEN_KIND = re.compile(r"\[\[(" + "|".join(KINDS) + r"):\s*")
+_OPENERS = tuple(f"{OPEN}{kind}:" for kind in KINDS)
+_MAX_OPENER = max(len(o) for o in _OPENERS)
+SKILL_NAME = re.compile(r"[a-zA-Z0-9_]+")
+
+
+class Tag(NamedTuple):
+    kind: str
+    args: tuple
+    span: tuple
+    body: str # Text between "KIND:" and "]]", stripped
+    raw: str  # The whole tag, as written
+
+    @property
+    def skill_name(self) -> Optional[str]:
+        """CALL_SKILL only: the leading skill identifier (None if malformed)."""
+        match = SKILL_NAME.match(self.body)
+        return match.group(0) if match else None
+
+
+def _split_args(kind: str, body: str) -> tuple:
+    if kind == "CALL_SKILL":
+        return tuple(p.strip() for p in body.split("|", 1))
+    return tuple(p.strip() for p in body.split("|"))
+
+
+def _make(kind: str, text: str, start: int, body_start: int, close: int, offset: int = 0) -> Tag:
+    body = text[body_start:close].strip()
+    return Tag(kind, _split_args(kind, body), (offset + start, offset + close + len(CLOSE)), body, text[start:close + len(CLOSE)])
+
+
+def iter_tags(text: str, kinds: Optional[Iterable[str]] = None):
+    """Yield the complete tags of `text` in order (optionally only `kinds`)."""
+    wanted = set(kinds) if kinds else None
+    find = text.find
+    pos = 0
+    while True:
+        start = find(OPEN, pos)
+        if start < 0:
+            return
+        match = _OPEN_KIND.match(text, start)
+        if not match:
+            pos = start + 1
+            continue
+        close = find(CLOSE, match.end())
+        if close < 0:
+            return # Unclosed: nothing after it can be a complete tag of its own
+        kind = match.group(1)
+        if wanted is None or kind in wanted:
+            yield _make(kind, text, start, match.end(), close)
+        pos = close + len(CLOSE)
+
+
+def scan(text: str, kinds: Optional[Iterable[str]] = None) -> list:
+    return list(iter_tags(text, kinds))
+
+
+def first(text: str, kind: str) -> Optional[Tag]:
+    return next(iter_tags(text, (kind,)), None)
+
+
+class TagStream:
+    """
+    Incremental tokenizer for streamed text:
+
+        stream = TagStream()
+        for chunk in chunks:
+            for tag in stream.feed(chunk):
+                ...
+
+    Spans are offsets in the whole stream. `pending` is True while an opened
+    tag is not closed yet (e.g. to hide a half-written tag in a UI).
+    """
+
+    def __init__(self, kinds: Optional[Iterable[str]] = None):
+        self.kinds = set(kinds) if kinds else None
+        self._tail = ""   # Unconsumed text, starting at a possible tag opening
+        self._offset = 0  # Stream offset of _tail[0]
+        self._close_from = 0 # Where to resume looking for the pending tag's "]]"
+        self.pending = False
+
+    def feed(self, chunk: str) -> list:
+        text = self._tail + chunk
+        tags = []
+        pos = 0
+        keep = len(text)
+        self.pending = False
+        while True:
+            start = text.find(OPEN, pos)
+            if start < 0:
+                # A trailing "[" may become the next opener
+                keep = len(text) - 1 if text.endswith("[") else len(text)
+                break
+            match = _OPEN_KIND.match(text, start)
+            if not match:
+                rest = text[start:]
+                if len(rest) < _MAX_OPENER and any(o.startswith(rest) for o in _OPENERS):
+                    keep = start # Opener still arriving
+                    break
+                pos = start + 1
+                continue
+            # A pending tag was already searched up to _close_from: do not rescan it
+            close = text.find(CLOSE, max(match.end(), self._close_from) if start == 0 else match.end())
+            if close < 0:
+                keep = start
+                self.pending = True
+                break
+            kind = match.group(1)
+            if self.kinds is None or kind in self.kinds:
+                tags.append(_make(kind, text, start, match.end(), close, self._offset))
+            pos = close + len(CLOSE)
+        self._offset += keep
+        self._tail = text[keep:]
+        # "]]" may straddle the next chunk boundary
+        self._close_from = max(0, len(self._tail) - 1) if self.pending else 0
+        return tags
+
+    def close(self) -> str:
+        """End of stream: returns the unfinished remainder (if any)."""
+        rest, self._tail = self._tail, ""
+        self._offset += len(rest)
+        self._close_from = 0
+        self.pending = False
+        return rest
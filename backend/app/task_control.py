@@ -0,0 +1,165 @@
+"""
+Cancellation and wall-clock deadlines for running tasks.
+
+`POST /tasks/{id}/cancel` sets `cancel_requested` on the row and signals the
+local control object (if the task runs in this process). Workers in other
+processes/hosts notice the flag by polling the row at most every
+`CANCEL_POLL_SECONDS`.
+
+The agent loop checks its control between turns (cooperative). Blocking calls
+(LLM requests, skills) go through `TaskControl.call`, which runs them on a
+helper thread and returns as soon as the task is cancelled or its deadline
+passes. The abandoned HTTP request finishes in the background and its result
+is dropped; the task's worker slot and its RUNNING count (which the per-agent
+and per-provider caps are measured against) are freed right away.
+"""
+import threading
+import time
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from . import models, settings_cache
+from .database import SessionLocal
+
+CANCEL_POLL_SECONDS = 2.0
+WAIT_STEP_SECONDS = 0.25
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskTimedOut(Exception):
+    pass
+
+
+class TaskControl:
+    def __init__(self, task_id: str, timeout_seconds: Optional[float] = None):
+        self.task_id = task_id
+        self.timeout_seconds = timeout_seconds
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self._cancelled = threading.Event()
+        self._polled_at = 0.0
+        self._call_lock = threading.Lock()
+        self._call_running = False
+        self._after_call = []
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def stopped(self) -> bool:
+        """True once cancelled or past the deadline (no DB poll; for abandoned calls)."""
+        return self._cancelled.is_set() or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None = no deadline)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _poll_flag(self):
+        # Cross-process cancel: read the flag on a short-lived session
+        now = time.monotonic()
+        if now - self._polled_at < CANCEL_POLL_SECONDS:
+            return
+        self._polled_at = now
+        db = SessionLocal()
+        try:
+            row = db.query(models.Task.cancel_requested).filter(models.Task.id == self.task_id).first()
+            if row and row[0]:
+                self._cancelled.set()
+        except Exception as e:
+            print(f"DEBUG: Cancel flag poll failed for {self.task_id}: {e}")
+        finally:
+            db.close()
+
+    def check(self):
+        """Raise TaskCancelled / TaskTimedOut if the task must stop now."""
+        self._poll_flag()
+        if self._cancelled.is_set():
+            raise TaskCancelled(f"Task {self.task_id} was cancelled.")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise TaskTimedOut(f"Task {self.task_id} exceeded its {self.timeout_seconds}s deadline.")
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Run a blocking call on a helper thread and wait for it, but give up
+        immediately on cancel or deadline (the call itself is abandoned).
+        """
+        self.check()
+        done = threading.Event()
+        outcome = {}
+
+        def _target():
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                with self._call_lock:
+                    self._call_running = False
+                    callbacks, self._after_call = self._after_call, []
+                for callback in callbacks:
+                    callback()
+                done.set()
+
+        with self._call_lock:
+            self._call_running = True
+
+        threading.Thread(target=_target, name=f"task-call-{self.task_id[:8]}", daemon=True).start()
+        while not done.wait(WAIT_STEP_SECONDS):
+            self.check()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def close_session(self, db: Session):
+        """
+        Close `db` now, or once an abandoned call that still uses it returns
+        (closing it under that call would hand its connection to another task).
+        """
+        with self._call_lock:
+            if self._call_running:
+                self._after_call.append(db.close)
+                return
+        db.close()
+
+
+# --- Process-local registry (task_id -> TaskControl) ---
+_lock = threading.Lock()
+_controls = {}
+
+
+def register(task_id: str, timeout_seconds: Optional[float] = None) -> TaskControl:
+    control = TaskControl(task_id, timeout_seconds)
+    with _lock:
+        _controls[task_id] = control
+    return control
+
+
+def unregister(task_id: str):
+    with _lock:
+        _controls.pop(task_id, None)
+
+
+def signal_cancel(task_id: str) -> bool:
+    """Cancel the task if it runs in this process. Returns True if found."""
+    with _lock:
+        control = _controls.get(task_id)
+    if control is None:
+        return False
+    control.cancel()
+    return True
+
+
+def resolve_timeout(db: Session, task: models.Task, workflow_data: dict) -> Optional[float]:
+    """Per-task timeout, else the workflow's, else the `task_timeout_seconds` setting."""
+    if task.timeout_seconds:
+        return float(task.timeout_seconds)
+    if workflow_data and workflow_data.get("timeout_seconds"):
+        return float(workflow_data["timeout_seconds"])
+    try:
+        value = int(settings_cache.get(db, "task_timeout_seconds", 0))
+    except (TypeError, ValueError):
+        value = 0
+    return float(value) if value > 0 else None
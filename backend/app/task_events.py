@@ -0,0 +1,188 @@
+"""
+Live progress events for background tasks (`GET /tasks/{id}/events`, SSE).
+
+`process_task_background` calls `emit()` at turn start/end, around each skill
+call, for batches of partial LLM output and for the created file. Events are
+rows in `task_events`, so a task running in a standalone worker process (or on
+another host) streams to any API process. Emitters in this process also wake
+local subscribers immediately; others are picked up by polling every
+`POLL_SECONDS`.
+
+A stream ends after the `task_end` event, or when the task is already in a
+final state and no newer events exist. Reconnecting clients send
+`Last-Event-ID` and receive only what they missed.
+
+Retention: `token` rows (partial output) are only useful while the task runs.
+They are deleted when `task_end` is emitted; the final output stays in the task
+row, its file and the `task_end` event. Tokens of tasks that never got a
+`task_end` (worker died) are swept once they are older than
+`task_events_retention_hours` (setting, default 24, 0 keeps them).
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from . import models, settings_cache
+from .database import SessionLocal
+
+POLL_SECONDS = 0.5
+KEEPALIVE_SECONDS = 15
+TOKEN_FLUSH_SECONDS = 0.25 # Partial output is batched: one row per flush, not per token
+TOKEN_FLUSH_CHARS = 400
+SUMMARY_CHARS = 200
+DEFAULT_RETENTION_HOURS = 24
+SWEEP_SECONDS = 3600 # Retention sweep at most once per hour per process
+
+FINAL_STATUSES = {
+    models.TaskStatus.COMPLETED.value,
+    models.TaskStatus.FAILED.value,
+    models.TaskStatus.CANCELLED.value,
+    models.TaskStatus.TIMED_OUT.value,
+}
+
+_new_events = threading.Condition()
+_last_sweep = 0.0
+
+
+def summarize(text, limit: int = SUMMARY_CHARS) -> str:
+    text = str(text)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def emit(task_id: str, event_type: str, **data):
+    """
+    Record one event on its own short session (safe from helper threads and
+    never touches the task row, so it cannot conflict with its `version`).
+    Failures are logged, not raised: progress reporting must not fail a task.
+    """
+    db = SessionLocal()
+    try:
+        db.add(models.TaskEvent(task_id=task_id, event_type=event_type, data=data))
+        db.commit()
+    except Exception as e:
+        print(f"DEBUG: Failed to record task event {event_type} for {task_id}: {e}")
+    finally:
+        db.close()
+    with _new_events:
+        _new_events.notify_all()
+
+
+def finish(task_id: str):
+    """Emit `task_end` if the task reached a final status (not when its lease was lost)."""
+    db = SessionLocal()
+    try:
+        row = db.query(models.Task.status, models.Task.output_text).filter(models.Task.id == task_id).first()
+    finally:
+        db.close()
+    if row and row[0] in FINAL_STATUSES:
+        emit(task_id, "task_end", status=row[0], output=summarize(row[1] or ""))
+        prune_tokens(task_id)
+    if time.monotonic() - _last_sweep >= SWEEP_SECONDS:
+        sweep_tokens()
+
+
+def prune_tokens(task_id: str) -> int:
+    """Delete a finished task's `token` events (its final output is kept elsewhere)."""
+    db = SessionLocal()
+    try:
+        deleted = db.query(models.TaskEvent).\
+            filter(models.TaskEvent.task_id == task_id).\
+            filter(models.TaskEvent.event_type == "token").\
+            delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception as e:
+        print(f"DEBUG: Failed to prune token events of {task_id}: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def sweep_tokens() -> int:
+    """Delete `token` events older than the retention window (tasks that never got a task_end)."""
+    global _last_sweep
+    _last_sweep = time.monotonic()
+    db = SessionLocal()
+    try:
+        hours = float(settings_cache.get(db, "task_events_retention_hours", DEFAULT_RETENTION_HOURS) or 0)
+        if hours <= 0:
+            return 0
+        deleted = db.query(models.TaskEvent).\
+            filter(models.TaskEvent.event_type == "token").\
+            filter(models.TaskEvent.created_at < datetime.utcnow() - timedelta(hours=hours)).\
+            delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            print(f"Task Events: swept {deleted} token event(s) older than {hours:g}h")
+        return deleted
+    except Exception as e:
+        print(f"DEBUG: Token event sweep failed: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+class TokenBuffer:
+    """Collects streamed output and emits it as `token` events in batches."""
+
+    def __init__(self, task_id: str, turn: int):
+        self.task_id = task_id
+        self.turn = turn
+        self._parts = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, text: str):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= TOKEN_FLUSH_CHARS or time.monotonic() - self._flushed_at >= TOKEN_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            emit(self.task_id, "token", turn=self.turn, text="".join(self._parts))
+            self._parts = []
+            self._size = 0
+        self._flushed_at = time.monotonic()
+
+
+def _format(event: models.TaskEvent) -> str:
+    payload = json.dumps(event.data or {}, ensure_ascii=False)
+    return f"id: {event.id}\nevent: {event.event_type}\ndata: {payload}\n\n"
+
+
+def stream(task_id: str, last_event_id: Optional[int] = None):
+    """Generator of SSE frames for one task."""
+    last_id = last_event_id or 0
+    last_sent = time.monotonic()
+    while True:
+        db = SessionLocal()
+        try:
+            events = db.query(models.TaskEvent).\
+                filter(models.TaskEvent.task_id == task_id).\
+                filter(models.TaskEvent.id > last_id).\
+                order_by(models.TaskEvent.id).\
+                all()
+            status_row = None if events else db.query(models.Task.status).filter(models.Task.id == task_id).first()
+        finally:
+            db.close()
+
+        for event in events:
+            last_id = event.id
+            yield _format(event)
+            if event.event_type == "task_end":
+                return
+        if events:
+            last_sent = time.monotonic()
+        elif status_row is None or status_row[0] in FINAL_STATUSES:
+            # Finished without a task_end (e.g. worker died) or unknown task
+            status = status_row[0] if status_row else "unknown"
+            yield f"event: task_end\ndata: {json.dumps({'status': status})}\n\n"
+            return
+        elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+        with _new_events:
+            _new_events.wait(POLL_SECONDS)
@@ -0,0 +1,445 @@
+"""
+Persistent task queue backed by the `tasks` table.
+
+PENDING rows are the queue, so nothing is lost on restart. A fixed-size pool of
+worker threads claims rows with a lease (conditional UPDATE, so two workers can
+never run the same task), renews the lease with heartbeats while the task runs
+and releases it when done. Every claim stores a fresh lease token
+(`<worker id>:<random>`) in `lease_owner`; heartbeats and releases match on
+that token, so a thread whose lease expired cannot renew or finish a task that
+was requeued and claimed again, even by another thread of the same process. Producers only insert the row and call `notify()`.
+
+On startup, RUNNING tasks whose lease is missing or expired (orphaned by a
+crash) are put back to PENDING, or FAILED after MAX_ATTEMPTS. Project steps
+whose task ended failed without the project engine noticing are failed too.
+
+Distributed mode: any number of processes/hosts may run workers against one
+shared database. Every status transition is optimistic: claims, releases and
+requeues match on the row's `version` and bump it, and ORM writes to a Task
+are version-checked by SQLAlchemy (`version_id_col`). A worker whose lease
+expired and was requeued by the reaper therefore gets a StaleDataError instead
+of overwriting the new owner's result. `recover_orphans` is run at startup and
+every REAP_SECONDS by each worker.
+
+Scheduling: tasks are ordered by priority class (interactive > project > bulk)
+minus an aging bonus of one class per `task_priority_aging_seconds` waited, so
+bulk work cannot starve forever. A task is only claimed while its agent has
+fewer than `task_agent_concurrency` RUNNING tasks (default 1: two tasks of one
+agent never race on its output folder) and its provider is below
+`task_provider_concurrency_<provider>` (unset = no cap). Both caps are checked
+inside the claiming UPDATE so concurrent workers cannot overshoot them: on
+SQLite because write transactions are serialized, on PostgreSQL because the
+check first takes an advisory lock per agent / provider (`_lock_caps`). Other
+databases get no such guarantee.
+Tasks with priority "batch" are never claimed here; `batch_runner.py` submits
+them to the provider's batch API.
+"""
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+from . import models, settings_cache
+from .database import SessionLocal
+
+DEFAULT_WORKERS = 4
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 2.0
+MAX_ATTEMPTS = 3
+REAP_SECONDS = 30
+CLAIM_BATCH = 50  # Candidates inspected per claim attempt
+DEFAULT_AGENT_CONCURRENCY = 1
+DEFAULT_AGING_SECONDS = 120
+DEFAULT_TASK_SECONDS = 60  # ETA fallback when no task has finished yet
+
+PRIORITY_RANK = {
+    models.TaskPriority.INTERACTIVE.value: 0,
+    models.TaskPriority.PROJECT.value: 1,
+    models.TaskPriority.BULK.value: 2,
+}
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def new_lease(worker_id: str) -> str:
+    """Lease token of one claim (stored in `lease_owner`)."""
+    return f"{worker_id}:{uuid.uuid4().hex}"
+
+
+def _int_setting(db: Session, key: str, default):
+    raw = settings_cache.get(db, key)
+    try:
+        return int(raw) if raw not in (None, "") else default
+    except ValueError:
+        return default
+
+
+def configured_worker_count(db: Session) -> int:
+    """Pool size from the `task_worker_count` setting (read at startup)."""
+    return max(0, _int_setting(db, "task_worker_count", DEFAULT_WORKERS))
+
+
+# --- Scheduling ---
+def effective_rank(priority: str, created_at: datetime, now: datetime, aging_seconds: int) -> float:
+    """Lower runs first. Waiting `aging_seconds` promotes a task by one class."""
+    rank = PRIORITY_RANK.get(priority or "", PRIORITY_RANK[models.TaskPriority.PROJECT.value])
+    waited = (now - created_at).total_seconds() if created_at else 0
+    return rank - waited / max(1, aging_seconds)
+
+
+def _sorted_pending(rows, now: datetime, aging_seconds: int):
+    return sorted(rows, key=lambda r: (effective_rank(r.priority, r.created_at, now, aging_seconds), r.created_at or now))
+
+
+def _pending_candidates(db: Session, limit: int):
+    """
+    Oldest pending tasks plus the highest-class pending tasks, so that both
+    aged and urgent work is visible to a claim attempt.
+    """
+    rank = case(PRIORITY_RANK, value=models.Task.priority, else_=1)
+    base = db.query(models.Task.id, models.Task.version, models.Task.agent_id, models.Task.priority, models.Task.created_at, models.Agent.provider).\
+        join(models.Agent, models.Task.agent_id == models.Agent.id).\
+        filter(models.Task.status == models.TaskStatus.PENDING.value).\
+        filter(func.coalesce(models.Task.priority, "") != models.TaskPriority.BATCH.value)
+    oldest = base.order_by(models.Task.created_at).limit(limit).all()
+    urgent = base.order_by(rank, models.Task.created_at).limit(limit).all()
+    return list({row.id: row for row in oldest + urgent}.values())
+
+
+def _running_count_for_agent(agent_id: str):
+    return select(func.count(models.Task.id)).\
+        where(models.Task.agent_id == agent_id).\
+        where(models.Task.status == models.TaskStatus.RUNNING.value).\
+        scalar_subquery()
+
+
+def _running_count_for_provider(provider: str):
+    return select(func.count(models.Task.id)).\
+        join(models.Agent, models.Task.agent_id == models.Agent.id).\
+        where(models.Agent.provider == provider).\
+        where(models.Task.status == models.TaskStatus.RUNNING.value).\
+        scalar_subquery()
+
+
+def _lock_caps(db: Session, agent_id: Optional[str], provider: Optional[str]):
+    """
+    Serialize cap checks on databases without a database-wide write lock.
+    SQLite runs one write transaction at a time, so the COUNT inside the
+    claiming UPDATE cannot be raced. On PostgreSQL (READ COMMITTED) two
+    claims of different rows could both pass it: take a transaction-scoped
+    advisory lock per agent / provider first (agent before provider, so
+    claims cannot deadlock); the UPDATE's new snapshot then sees the other
+    claim's committed row.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for key in (f"task-agent:{agent_id}" if agent_id else None, f"task-provider:{provider}" if provider else None):
+        if key:
+            db.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+
+
+# --- Queue Operations ---
+def claim_next(db: Session, worker_id: str) -> Optional[Tuple[str, str]]:
+    """
+    Atomically move the best claimable PENDING task to RUNNING under a new
+    lease. Returns (task id, lease token), or None when nothing is claimable
+    right now. Pass the token to `heartbeat` / `release`.
+    """
+    now = datetime.utcnow()
+    aging_seconds = _int_setting(db, "task_priority_aging_seconds", DEFAULT_AGING_SECONDS)
+    agent_cap = _int_setting(db, "task_agent_concurrency", DEFAULT_AGENT_CONCURRENCY)
+
+    candidates = _sorted_pending(_pending_candidates(db, CLAIM_BATCH), now, aging_seconds)
+    blocked_agents = set()
+    blocked_providers = set()
+
+    for row in candidates:
+        if row.agent_id in blocked_agents or row.provider in blocked_providers:
+            continue
+        provider_cap = _int_setting(db, f"task_provider_concurrency_{row.provider}", None)
+
+        query = db.query(models.Task).\
+            filter(models.Task.id == row.id).\
+            filter(models.Task.status == models.TaskStatus.PENDING.value).\
+            filter(func.coalesce(models.Task.version, 0) == (row.version or 0))
+        if agent_cap > 0:
+            query = query.filter(_running_count_for_agent(row.agent_id) < agent_cap)
+        if provider_cap:
+            query = query.filter(_running_count_for_provider(row.provider) < provider_cap)
+
+        if agent_cap > 0 or provider_cap:
+            _lock_caps(db, row.agent_id if agent_cap > 0 else None, row.provider if provider_cap else None)
+        now = datetime.utcnow()
+        lease = new_lease(worker_id)
+        claimed = query.update({
+            models.Task.status: models.TaskStatus.RUNNING.value,
+            models.Task.lease_owner: lease,
+            models.Task.lease_expires_at: now + timedelta(seconds=LEASE_SECONDS),
+            models.Task.heartbeat_at: now,
+            models.Task.started_at: now,
+            models.Task.attempts: func.coalesce(models.Task.attempts, 0) + 1,
+            models.Task.version: func.coalesce(models.Task.version, 0) + 1
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return row.id, lease
+        # Lost the race or hit a cap: do not try this agent/provider again now
+        blocked_agents.add(row.agent_id)
+        if provider_cap:
+            blocked_providers.add(row.provider)
+    return None
+
+
+def annotate_queue(db: Session, tasks):
+    """
+    Set `queue_position` (1-based) and `estimated_start_at` on pending task
+    objects, following the same order the workers claim in.
+    """
+    pending = [t for t in tasks if t.status == models.TaskStatus.PENDING.value]
+    if not pending:
+        return tasks
+
+    now = datetime.utcnow()
+    aging_seconds = _int_setting(db, "task_priority_aging_seconds", DEFAULT_AGING_SECONDS)
+    rows = db.query(models.Task.id, models.Task.priority, models.Task.created_at).\
+        filter(models.Task.status == models.TaskStatus.PENDING.value).\
+        filter(func.coalesce(models.Task.priority, "") != models.TaskPriority.BATCH.value).\
+        all()
+    order = {row.id: i for i, row in enumerate(_sorted_pending(rows, now, aging_seconds))}
+
+    recent = db.query(models.Task.started_at, models.Task.finished_at).\
+        filter(models.Task.started_at != None, models.Task.finished_at != None).\
+        order_by(models.Task.finished_at.desc()).\
+        limit(50).\
+        all()
+    durations = [(f - s).total_seconds() for s, f in recent if f >= s]
+    avg_seconds = sum(durations) / len(durations) if durations else DEFAULT_TASK_SECONDS
+    workers = _pool.size if _pool is not None else configured_worker_count(db)
+
+    for task in pending:
+        index = order.get(task.id)
+        if index is None:
+            continue
+        task.queue_position = index + 1
+        waves = math.floor(index / max(1, workers))
+        task.estimated_start_at = now + timedelta(seconds=waves * avg_seconds)
+    return tasks
+
+
+def heartbeat(db: Session, leases: Dict[str, str]) -> int:
+    """Extend the leases {task id: lease token} that are still held."""
+    if not leases:
+        return 0
+    now = datetime.utcnow()
+    renewed = db.query(models.Task).\
+        filter(models.Task.id.in_(list(leases))).\
+        filter(models.Task.lease_owner.in_(list(leases.values()))).\
+        update({
+            models.Task.heartbeat_at: now,
+            models.Task.lease_expires_at: now + timedelta(seconds=LEASE_SECONDS)
+        }, synchronize_session=False)
+    db.commit()
+    return renewed
+
+
+def release(db: Session, task_id: str, lease: str):
+    """
+    Drop the lease after the runner returned. A task left RUNNING by the
+    runner (it never reached a final status) is marked FAILED, and so is its
+    project step. No-op if the lease was lost (the task has been requeued and
+    belongs to a new claim).
+    """
+    failed = db.query(models.Task).\
+        filter(models.Task.id == task_id).\
+        filter(models.Task.lease_owner == lease).\
+        filter(models.Task.status == models.TaskStatus.RUNNING.value).\
+        update({
+            models.Task.status: models.TaskStatus.FAILED.value,
+            models.Task.output_text: "Worker exited without a final status.",
+            models.Task.finished_at: datetime.utcnow(),
+            models.Task.version: func.coalesce(models.Task.version, 0) + 1
+        }, synchronize_session=False)
+    db.query(models.Task).\
+        filter(models.Task.id == task_id).\
+        filter(models.Task.lease_owner == lease).\
+        update({
+            models.Task.lease_owner: None,
+            models.Task.lease_expires_at: None
+        }, synchronize_session=False)
+    db.commit()
+    if failed:
+        from . import project_manager
+        project_manager.fail_step_for_task(db, task_id)
+
+
+def recover_orphans(db: Session) -> int:
+    """
+    Reaper: requeue RUNNING tasks whose lease is missing or expired.
+    Tasks that already used MAX_ATTEMPTS are failed instead of retried forever.
+    Each row is moved with a version-checked UPDATE, so concurrent reapers on
+    several hosts requeue a task exactly once.
+    """
+    now = datetime.utcnow()
+    expired = db.query(models.Task.id, models.Task.version, models.Task.attempts).\
+        filter(models.Task.status == models.TaskStatus.RUNNING.value).\
+        filter(or_(models.Task.lease_expires_at == None, models.Task.lease_expires_at < now)).\
+        all()
+
+    recovered = 0
+    for row in expired:
+        fields = {
+            models.Task.lease_owner: None,
+            models.Task.lease_expires_at: None,
+            models.Task.version: func.coalesce(models.Task.version, 0) + 1
+        }
+        if (row.attempts or 0) >= MAX_ATTEMPTS:
+            fields[models.Task.status] = models.TaskStatus.FAILED.value
+            fields[models.Task.output_text] = f"Task abandoned after {row.attempts} attempts (worker lost)."
+            fields[models.Task.finished_at] = now
+        else:
+            fields[models.Task.status] = models.TaskStatus.PENDING.value
+        recovered += db.query(models.Task).\
+            filter(models.Task.id == row.id).\
+            filter(models.Task.status == models.TaskStatus.RUNNING.value).\
+            filter(func.coalesce(models.Task.version, 0) == (row.version or 0)).\
+            update(fields, synchronize_session=False)
+    db.commit()
+
+    if recovered:
+        print(f"Task Queue: recovered {recovered} orphaned RUNNING task(s).")
+
+    # Tasks failed here (MAX_ATTEMPTS) or by a run that died before reaching
+    # the project engine: their steps fail too, so the project does not wait forever
+    from . import project_manager
+    stuck = project_manager.fail_steps_of_stopped_tasks(db)
+    if stuck:
+        print(f"Task Queue: failed {stuck} project step(s) whose task had stopped.")
+    return recovered
+
+
+# --- Worker Pool ---
+class TaskWorkerPool:
+    """
+    Fixed number of threads draining the queue. A burst of N new tasks
+    never spawns more than `size` concurrent executions.
+    """
+
+    def __init__(self, runner: Callable[[str], None], size: int = DEFAULT_WORKERS):
+        self.runner = runner
+        self.size = size
+        self.worker_id = new_worker_id()
+        self._wakeups = threading.Semaphore(0)
+        self._stopping = threading.Event()
+        self._active = {} # task id -> lease token
+        self._active_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.size):
+            t = threading.Thread(target=self._worker_loop, name=f"task-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        hb = threading.Thread(target=self._heartbeat_loop, name="task-heartbeat", daemon=True)
+        hb.start()
+        self._threads.append(hb)
+        print(f"Task Queue: started {self.size} worker(s) as {self.worker_id}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        for _ in range(self.size):
+            self._wakeups.release()
+        for t in self._threads:
+            t.join(timeout=timeout)
+
+    def notify(self):
+        """Wake one idle worker (new task was enqueued)."""
+        self._wakeups.release()
+
+    def active_tasks(self) -> Dict[str, str]:
+        with self._active_lock:
+            return dict(self._active)
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                claim = claim_next(db, self.worker_id)
+            except Exception as e:
+                print(f"Task Queue: claim failed: {e}")
+                claim = None
+            finally:
+                db.close()
+
+            if not claim:
+                self._wakeups.acquire(timeout=POLL_SECONDS)
+                continue
+
+            task_id, lease = claim
+            with self._active_lock:
+                self._active[task_id] = lease
+            try:
+                self.runner(task_id)
+            except Exception as e:
+                print(f"Task Queue: runner crashed on {task_id}: {e}")
+            finally:
+                with self._active_lock:
+                    # The task may have been reaped and reclaimed by another
+                    # thread of this pool meanwhile: leave its lease alone
+                    if self._active.get(task_id) == lease:
+                        del self._active[task_id]
+                db = SessionLocal()
+                try:
+                    release(db, task_id, lease)
+                finally:
+                    db.close()
+
+    def _heartbeat_loop(self):
+        last_reap = 0.0
+        while not self._stopping.wait(HEARTBEAT_SECONDS):
+            active = self.active_tasks()
+            db = SessionLocal()
+            try:
+                if active:
+                    renewed = heartbeat(db, active)
+                    if renewed < len(active):
+                        print(f"Task Queue: {len(active) - renewed} lease(s) lost by {self.worker_id}")
+                if time.monotonic() - last_reap >= REAP_SECONDS:
+                    recover_orphans(db)
+                    last_reap = time.monotonic()
+            except Exception as e:
+                print(f"Task Queue: heartbeat failed: {e}")
+            finally:
+                db.close()
+
+
+_pool: Optional[TaskWorkerPool] = None
+
+
+def start_pool(runner: Callable[[str], None], size: int = DEFAULT_WORKERS):
+    global _pool
+    if _pool is not None or size <= 0:
+        return _pool
+    _pool = TaskWorkerPool(runner, size)
+    _pool.start()
+    return _pool
+
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+def notify():
+    """Signal that a task was enqueued. Harmless when no pool runs here."""
+    if _pool is not None:
+        _pool.notify()
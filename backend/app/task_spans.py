@@ -0,0 +1,145 @@
+"""
+Latency spans for the background task loop.
+
+`process_task_background` times its hot sections (queue wait, context hint,
+every LLM call, every skill call, the file write, the project feedback step)
+with a `SpanRecorder`. Each span is one row in `task_spans`, tagged with the
+task's agent and model, so it can be listed per task (`GET /tasks/{id}/spans`)
+or aggregated into p50/p95/p99 per agent, model or skill
+(`GET /metrics/latency`).
+
+Recording never raises: a failed insert is logged and the task carries on.
+"""
+import math
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+GROUP_COLUMNS = {
+    "agent": models.TaskSpan.agent_id,
+    "model": models.TaskSpan.model_name,
+    "skill": models.TaskSpan.label,
+}
+
+
+class Span:
+    def __init__(self, name: str, label: Optional[str] = None):
+        self.name = name
+        self.label = label
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.queue_wait_ms = None
+        self.ttfb_ms = None
+        self.tokens = None
+
+
+class SpanRecorder:
+    def __init__(self, task_id: str, agent_id: str, model_name: Optional[str]):
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.model_name = model_name
+
+    def start(self, name: str, label: Optional[str] = None) -> Span:
+        return Span(name, label)
+
+    def finish(self, span: Span, status: str = "ok"):
+        duration_ms = (time.perf_counter() - span.start) * 1000
+        self.record(span.name, duration_ms, label=span.label, status=status, started_at=span.started_at,
+                    queue_wait_ms=span.queue_wait_ms, ttfb_ms=span.ttfb_ms, tokens=span.tokens)
+
+    @contextmanager
+    def span(self, name: str, label: Optional[str] = None):
+        span = self.start(name, label)
+        status = "ok"
+        try:
+            yield span
+        except BaseException as e:
+            status = f"error:{type(e).__name__}"
+            raise
+        finally:
+            self.finish(span, status)
+
+    def record(self, name: str, duration_ms: float, label: Optional[str] = None, status: str = "ok",
+               started_at: Optional[datetime] = None, **fields):
+        # Own short session: spans are written from helper/pool threads too
+        db = SessionLocal()
+        try:
+            db.add(models.TaskSpan(
+                task_id=self.task_id,
+                agent_id=self.agent_id,
+                model_name=self.model_name,
+                name=name,
+                label=label,
+                status=status,
+                started_at=started_at or datetime.utcnow(),
+                duration_ms=round(duration_ms, 2),
+                **fields
+            ))
+            db.commit()
+        except Exception as e:
+            print(f"DEBUG: Failed to record span {name} for {self.task_id}: {e}")
+        finally:
+            db.close()
+
+
+def get_task_spans(db: Session, task_id: str):
+    return db.query(models.TaskSpan).\
+        filter(models.TaskSpan.task_id == task_id).\
+        order_by(models.TaskSpan.id).\
+        all()
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def aggregate(db: Session, group_by: str = "agent", span_name: Optional[str] = None, hours: Optional[float] = 24):
+    """
+    p50/p95/p99 of span durations per (group, span name).
+    group_by: "agent" | "model" | "skill" (skill implies span_name="skill").
+    """
+    group_col = GROUP_COLUMNS[group_by]
+    if group_by == "skill":
+        span_name = "skill"
+
+    query = db.query(group_col, models.TaskSpan.name, models.TaskSpan.duration_ms, models.TaskSpan.ttfb_ms)
+    if span_name:
+        query = query.filter(models.TaskSpan.name == span_name)
+    if hours:
+        query = query.filter(models.TaskSpan.started_at >= datetime.utcnow() - timedelta(hours=hours))
+
+    groups = {}
+    for key, name, duration_ms, ttfb_ms in query.all():
+        bucket = groups.setdefault((key or "unknown", name), {"durations": [], "ttfb": []})
+        bucket["durations"].append(duration_ms or 0.0)
+        if ttfb_ms is not None:
+            bucket["ttfb"].append(ttfb_ms)
+
+    # Show agent names instead of ids
+    names = {}
+    if group_by == "agent" and groups:
+        agent_ids = {key for key, _ in groups}
+        names = dict(db.query(models.Agent.id, models.Agent.name).filter(models.Agent.id.in_(agent_ids)).all())
+
+    stats = []
+    for (key, name), bucket in sorted(groups.items()):
+        durations = sorted(bucket["durations"])
+        stats.append({
+            "group": names.get(key, key),
+            "span": name,
+            "count": len(durations),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "avg_ms": round(sum(durations) / len(durations), 2),
+            "avg_ttfb_ms": round(sum(bucket["ttfb"]) / len(bucket["ttfb"]), 2) if bucket["ttfb"] else None,
+        })
+    return stats
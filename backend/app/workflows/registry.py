@@ -6,6 +6,7 @@ WORKFLOW_REGISTRY = {
     "general_task": {
         "name": "General Execution Protocol",
         "description": "Standard process for general tasks.",
+        "timeout_seconds": 600, # Wall-clock deadline (task_control.py)
         "steps": [
             "1. Analyze Request: Identify core objective and constraints.",
             "2. Information Gathering: Search logs or read files if context is missing.",
@@ -16,6 +17,7 @@ WORKFLOW_REGISTRY = {
     "visual_design": {
         "name": "Visual Asset Production Protocol",
         "description": "For tasks involving image generation, design, or artistic creation.",
+        "timeout_seconds": 900,
         "steps": [
             "1. Asset Retrieval: Check logs for reference files (descriptions, prompts). Use 'read_file' if found.",
             "2. Prompt Engineering: Create a detailed image generation prompt based on references.",
@@ -27,6 +29,7 @@ WORKFLOW_REGISTRY = {
     "content_creation": {
         "name": "Content Drafting Protocol",
         "description": "For writing reports, articles, descriptions, or code.",
+        "timeout_seconds": 600,
         "steps": [
             "1. Context Analysis: Determine tone, audience, and key points.",
             "2. Reference Check: Look for source materials in logs.",
@@ -0,0 +1,195 @@
+"""
+Standalone task worker: runs `process_task_background` in a process pool.
+
+    python -m backend.worker --processes 4
+
+The parent process claims tasks from the persistent queue (see
+`app/task_queue.py`), keeps at most N of them in flight, renews their leases
+and releases them when done. Each child is a separate interpreter, so the
+CPU-bound parts of a task (prompt assembly, tag scanning, Markdown building,
+JSON parsing) no longer contend on the GIL with the API server.
+
+When this worker drains the queue, set the `task_worker_count` setting to 0 so
+the API process stops running its embedded thread pool.
+
+Distributed mode: start workers on several hosts with the same COMPANY_DB_URL
+and a shared "Company Doc" mount. Claims are lease-based and version-checked,
+and every worker reaps expired leases, so a task is never executed twice and
+a dead host's tasks are picked up by the others. `--runner` swaps the task
+function (e.g. `scripts/verify_distributed_workers.py` uses a sleep runner).
+"""
+import argparse
+import importlib
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from .app import task_queue
+from .app.database import SessionLocal, init_db
+
+
+DEFAULT_RUNNER = "backend.app.main:process_task_background"
+_runner = None
+
+
+def _load_runner(path: str):
+    module_name, func_name = path.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _init_child(runner_path: str):
+    global _runner
+    # Ctrl+C goes to the whole process group: let the parent drive shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Import once per child (models, skills, LLM service), not once per task
+    _runner = _load_runner(runner_path)
+    # Each child has its own Company Doc index: keep it reconciled with files
+    # written by the API process, other children and other hosts
+    from .app import doc_index
+    db = SessionLocal()
+    try:
+        doc_index.start_refresher(db)
+    finally:
+        db.close()
+
+
+def _run_task(task_id: str):
+    _runner(task_id)
+
+
+class ProcessTaskWorker:
+    def __init__(self, processes: int, max_tasks_per_child: int = None, worker_id: str = None, runner: str = DEFAULT_RUNNER):
+        self.processes = processes
+        self.runner = runner
+        self.max_tasks_per_child = max_tasks_per_child
+        self.worker_id = worker_id or task_queue.new_worker_id()
+        self._stopping = threading.Event()
+
+    def stop(self, *_):
+        print("Worker: stop requested, finishing in-flight tasks...")
+        self._stopping.set()
+
+    def _new_executor(self):
+        kwargs = {}
+        if self.max_tasks_per_child:
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=get_context("spawn"),
+            initializer=_init_child,
+            initargs=(self.runner,),
+            **kwargs
+        )
+
+    def _claim(self):
+        db = SessionLocal()
+        try:
+            return task_queue.claim_next(db, self.worker_id)
+        except Exception as e:
+            print(f"Worker: claim failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _release(self, task_id: str, lease: str):
+        db = SessionLocal()
+        try:
+            task_queue.release(db, task_id, lease)
+        finally:
+            db.close()
+
+    def _heartbeat(self, leases):
+        db = SessionLocal()
+        try:
+            task_queue.heartbeat(db, leases)
+        except Exception as e:
+            print(f"Worker: heartbeat failed: {e}")
+        finally:
+            db.close()
+
+    def _reap(self):
+        db = SessionLocal()
+        try:
+            task_queue.recover_orphans(db)
+        except Exception as e:
+            print(f"Worker: reaper failed: {e}")
+        finally:
+            db.close()
+
+    def run(self):
+        self._reap()
+        last_reap = time.monotonic()
+
+        executor = self._new_executor()
+        in_flight = {}  # Future -> (task_id, lease token)
+        last_heartbeat = time.monotonic()
+        print(f"Worker: {self.worker_id} running {self.processes} process(es)")
+
+        try:
+            while not (self._stopping.is_set() and not in_flight):
+                # 1. Fill free slots
+                while not self._stopping.is_set() and len(in_flight) < self.processes:
+                    claim = self._claim()
+                    if not claim:
+                        break
+                    task_id = claim[0]
+                    try:
+                        in_flight[executor.submit(_run_task, task_id)] = claim
+                    except BrokenProcessPool:
+                        # Keep our lease and retry on a fresh pool
+                        executor = self._new_executor()
+                        in_flight[executor.submit(_run_task, task_id)] = claim
+
+                # 2. Wait for completions (or poll interval)
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=task_queue.POLL_SECONDS, return_when=FIRST_COMPLETED)
+                else:
+                    done = set()
+                    self._stopping.wait(task_queue.POLL_SECONDS)
+
+                broken = False
+                for future in done:
+                    task_id, lease = in_flight.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        print(f"Worker: task {task_id} crashed: {error}")
+                        broken = broken or isinstance(error, BrokenProcessPool)
+                    self._release(task_id, lease)
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._new_executor()
+
+                # 3. Keep leases alive
+                if in_flight and time.monotonic() - last_heartbeat >= task_queue.HEARTBEAT_SECONDS:
+                    self._heartbeat(dict(in_flight.values()))
+                    last_heartbeat = time.monotonic()
+
+                # 4. Requeue tasks of dead workers (any host)
+                if time.monotonic() - last_reap >= task_queue.REAP_SECONDS:
+                    self._reap()
+                    last_reap = time.monotonic()
+        finally:
+            executor.shutdown(wait=True)
+            print("Worker: stopped.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Company AI task worker (process pool).")
+    parser.add_argument("--processes", type=int, default=task_queue.DEFAULT_WORKERS, help="Number of worker processes.")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None, help="Recycle a child process after N tasks.")
+    parser.add_argument("--worker-id", default=None, help="Lease owner prefix (default: host:pid:random).")
+    parser.add_argument("--runner", default=DEFAULT_RUNNER, help="Task function as 'module:function'.")
+    args = parser.parse_args(argv)
+    init_db()
+
+    worker = ProcessTaskWorker(args.processes, args.max_tasks_per_child, args.worker_id, args.runner)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
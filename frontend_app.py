@@ -3,6 +3,8 @@ import requests
 import time
 import pandas as pd
 import os
+import json
+from backend.app.tags import TagStream
 
 # Configuration
 API_URL = "http://localhost:8000"
@@ -110,6 +112,44 @@ def clear_cache():
     get_skills.clear()
     get_handbooks.clear()
 
+def watch_task_events(task_id):
+    """Render GET /tasks/{id}/events (SSE) live until the task ends."""
+    status_box = st.empty()
+    output_box = st.empty()
+    steps = []
+    partial = ""
+    event_type = "message"
+    try:
+        with requests.get(f"{API_URL}/tasks/{task_id}/events", stream=True, timeout=(5, 60)) as response:
+            for raw in response.iter_lines(decode_unicode=True):
+                if raw is None:
+                    continue
+                if raw.startswith("event: "):
+                    event_type = raw[7:]
+                    continue
+                if not raw.startswith("data: "):
+                    continue
+                data = json.loads(raw[6:])
+                if event_type == "turn_start":
+                    partial = ""
+                    steps.append(f"🔄 Turn {data['turn']} started")
+                elif event_type == "token":
+                    partial += data.get("text", "")
+                    output_box.markdown(partial[-2000:])
+                elif event_type == "skill_call":
+                    steps.append(f"🛠️ {data.get('tag', '')}")
+                elif event_type == "skill_result":
+                    steps.append(f"↳ {data.get('summary', '')}")
+                elif event_type == "file_created":
+                    steps.append(f"📁 Generated: `{data.get('path')}`")
+                elif event_type == "task_end":
+                    steps.append(f"🏁 {data.get('status', '').upper()}")
+                status_box.markdown("\n\n".join(steps[-12:]))
+                if event_type == "task_end":
+                    break
+    except requests.exceptions.RequestException as e:
+        st.error(f"Event stream interrupted: {e}")
+
 def create_agent(name, role, system_prompt, job_title="", department="", level="", skills=[], handbooks=[], provider="openai", model_name="gpt-4-turbo"):
     payload = {
         "name": name,
@@ -198,11 +238,12 @@ def stream_chat_message(agent_id, message, force_execution=False):
     except Exception as e:
         yield f"Error: {str(e)}"
 
-def create_task(agent_id, title, prompt):
+def create_task(agent_id, title, prompt, force=False):
     payload = {
         "title": title,
         "input_prompt": prompt,
-        "agent_id": agent_id
+        "agent_id": agent_id,
+        "force": force
     }
     res = make_request("POST", "/tasks/", json=payload)
     if res and res.status_code == 200:
@@ -389,12 +430,21 @@ elif page == "Task Console":
             task_title = st.text_input("Task Title", placeholder="Generate Weekly Report")
             selected_agent_name = st.selectbox("Assign To", list(agent_options.keys()) if agent_options else ["No Agents Available"])
             task_prompt = st.text_area("Task Instructions", height=200)
+            force_run = st.checkbox("Run again even if an identical task just ran")
             submitted = st.form_submit_button("🚀 Launch Task")
             
             if submitted and agent_options:
                 agent_id = agent_options[selected_agent_name]
-                res = create_task(agent_id, task_title, task_prompt)
-                if res and res.status_code == 200:
+                res = create_task(agent_id, task_title, task_prompt, force=force_run)
+                if res and res.status_code == 200 and res.json().get("reused") == "completed":
+                    st.info("An identical task just completed. Its result was reused (see Task Monitor).")
+                    time.sleep(1)
+                    st.rerun()
+                elif res and res.status_code == 200 and res.json().get("reused"):
+                    st.info("An identical task is already in progress. Attached to it.")
+                    time.sleep(1)
+                    st.rerun()
+                elif res and res.status_code == 200:
                     st.success("Task dispatched to Agent!")
                     time.sleep(1)
                     st.rerun()
@@ -425,6 +475,8 @@ elif page == "Task Console":
                         status_color = "orange"
                     elif task['status'] == "failed":
                         status_color = "red"
+                    elif task['status'] in ("cancelled", "timed_out"):
+                        status_color = "purple"
                         
                     with st.container(border=True):
                         st.markdown(f"**{task['title']}** <span style='color:{status_color}; float:right'><b>{task['status'].upper()}</b></span>", unsafe_allow_html=True)
@@ -443,6 +495,23 @@ elif page == "Task Console":
                         if task['status'] == "failed":
                             st.error(task.get('output_text', 'Unknown Error'))
 
+                        if task['status'] in ("cancelled", "timed_out"):
+                            st.warning(task.get('output_text') or task['status'])
+
+                        if task['status'] in ("pending", "running"):
+                            # Subscribe to the task's event stream instead of polling
+                            if st.button("📡 Watch Live", key=f"watch_{task['id']}"):
+                                watch_task_events(task['id'])
+                                clear_cache()
+                                st.rerun()
+                            if st.button("⏹ Cancel", key=f"cancel_{task['id']}"):
+                                res = make_request("POST", f"/tasks/{task['id']}/cancel")
+                                if res and res.status_code == 200:
+                                    clear_cache()
+                                    st.rerun()
+                                elif res is not None:
+                                    st.error(f"Cancel failed: {res.text}")
+
             else:
                 st.write("Could not fetch tasks.")
         except Exception as e:
@@ -613,38 +682,35 @@ elif page == "High-Level Meeting Room":
                                     # Streaming Output with Placeholder
                                     message_placeholder = st.empty()
                                     full_response = ""
+                                    tag_stream = TagStream(("EXECUTE_TASK", "DELEGATE"))
+                                    stream_tags = []
                                     
-                                    # Stream and Accumulate
+                                    # Stream and Accumulate (tags are tokenized as they complete)
                                     for chunk in stream_chat_message(p_id, prompt):
                                         full_response += chunk
-                                        # Optional: Check for tag early to stop streaming if needed, 
-                                        # but typically tag comes at the end or is the whole message.
+                                        stream_tags += tag_stream.feed(chunk)
                                         message_placeholder.markdown(full_response + "▌")
                                     
                                     # Final processing
                                     delegate_match = None
-                                    if "[[EXECUTE_TASK:" in full_response:
+                                    task_tag = next((t for t in stream_tags if t.kind == "EXECUTE_TASK"), None)
+                                    if task_tag:
                                         # (Existing EXECUTE_TASK logic)
-                                        import re
-                                        match = re.search(r"\[\[EXECUTE_TASK:\s*(.*?)\s*\|", full_response)
-                                        task_title = match.group(1) if match else "Task"
+                                        task_title = task_tag.args[0] if len(task_tag.args) > 1 else "Task"
                                         display_text = f"🚀 **Task Started:** {task_title}\n\nCheck your 'Company Doc' folder shortly."
                                         message_placeholder.markdown(display_text)
                                         full_response = display_text
                                     
                                     elif "[[DELEGATE:" in full_response:
-                                        import re
-                                        # Use finditer to find ALL delegations
-                                        # Updated regex to capture inner content and split manually for flexibility
-                                        d_matches = list(re.finditer(r"\[\[DELEGATE:\s*(.*?)\]\]", full_response, re.DOTALL))
+                                        # ALL delegations of the reply, already split at "|"
+                                        d_tags = [t for t in stream_tags if t.kind == "DELEGATE"]
                                         
-                                        if d_matches:
+                                        if d_tags:
                                             display_text_parts = []
                                             delegate_list = []
                                             
-                                            for d_match in d_matches:
-                                                content = d_match.group(1).strip()
-                                                parts = [p.strip() for p in content.split("|")]
+                                            for d_tag in d_tags:
+                                                parts = list(d_tag.args)
                                                 
                                                 # Format: Target | [Optional Workflow] | Instruction
                                                 target_name = parts[0]
@@ -741,18 +807,19 @@ elif page == "High-Level Meeting Room":
                                                         # Stream Response
                                                         d_message_placeholder = st.empty()
                                                         d_full_response = ""
+                                                        d_tag_stream = TagStream(("EXECUTE_TASK",))
+                                                        d_task_tag = None
                                                         
                                                         # Call stream_chat_message with force_execution=True
                                                         # Note: recursive call might re-trigger this if not careful, but force_execution=True usually prevents delegation tags.
                                                         for d_chunk in stream_chat_message(target_agent['id'], delegated_prompt, force_execution=True):
                                                             d_full_response += d_chunk
+                                                            d_task_tag = d_task_tag or next(iter(d_tag_stream.feed(d_chunk)), None)
                                                             d_message_placeholder.markdown(d_full_response + "▌")
                                                         
                                                         # Check for Task execution
-                                                        if "[[EXECUTE_TASK:" in d_full_response:
-                                                              import re
-                                                              match = re.search(r"\[\[EXECUTE_TASK:\s*(.*?)\s*\|", d_full_response)
-                                                              task_title = match.group(1) if match else "Task"
+                                                        if d_task_tag:
+                                                              task_title = d_task_tag.args[0] if len(d_task_tag.args) > 1 else "Task"
                                                               d_text = f"🚀 **Remote Task Started:** {task_title}\n\nCheck your 'Company Doc' folder shortly."
                                                               d_message_placeholder.markdown(d_text)
                                                               d_full_response = d_text
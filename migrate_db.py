@@ -1,22 +1,52 @@
 import sqlite3
 
+# Columns added to 'tasks' after the initial schema (name, DDL type)
+TASK_COLUMNS = [
+    ("project_file", "VARCHAR"),
+    ("lease_owner", "VARCHAR"),
+    ("lease_expires_at", "DATETIME"),
+    ("heartbeat_at", "DATETIME"),
+    ("attempts", "INTEGER DEFAULT 0"),
+    ("priority", "VARCHAR DEFAULT 'interactive'"),
+    ("started_at", "DATETIME"),
+    ("version", "INTEGER NOT NULL DEFAULT 0"),
+    ("cancel_requested", "INTEGER DEFAULT 0"),
+    ("timeout_seconds", "INTEGER"),
+    ("project_step_id", "VARCHAR"),
+    ("fingerprint", "VARCHAR"),
+    ("batch_id", "VARCHAR"),
+    ("dedup_key", "VARCHAR"),
+]
+
+# Columns added to other tables after they were created (table -> [(name, DDL type)])
+EXTRA_COLUMNS = {
+    "tasks": TASK_COLUMNS,
+    "project_steps": [
+        ("context_bundle", "JSON"),
+    ],
+}
+
 def migrate():
     try:
         conn = sqlite3.connect('company_ai.db')
         cursor = conn.cursor()
-        
-        # Check if column exists
-        cursor.execute("PRAGMA table_info(tasks)")
-        columns = [info[1] for info in cursor.fetchall()]
-        
-        if 'project_file' not in columns:
-            print("Adding 'project_file' column to 'tasks' table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN project_file VARCHAR")
-            conn.commit()
-            print("Migration successful.")
-        else:
-            print("'project_file' column already exists.")
-            
+
+        for table, table_columns in EXTRA_COLUMNS.items():
+            # Check which columns exist (an empty result means the table is created by create_all)
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [info[1] for info in cursor.fetchall()]
+            if not columns:
+                continue
+
+            for name, ddl in table_columns:
+                if name not in columns:
+                    print(f"Adding '{name}' column to '{table}' table...")
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+                    conn.commit()
+                    print("Migration successful.")
+                else:
+                    print(f"'{name}' column already exists.")
+
         conn.close()
     except Exception as e:
         print(f"Migration failed: {e}")
@@ -0,0 +1,128 @@
+"""
+Benchmark of the Company Doc file index (backend/app/doc_index.py) against the
+tree walks it replaced, on a synthetic tree in a temporary directory
+(default 100,000 files in 1,000 agent folders, with an assets/ subfolder each).
+
+Measures:
+- build: first full scan into the index
+- exact name / stem prefix / author: index lookups vs. the old os.walk
+  (read_file auto-discovery, smart context) and scandir (project prefetch)
+- write hook: `note_write` of a new file
+- reconcile: `refresh()` (folder mtimes + a stat of every Markdown file) with
+  nothing changed and after one external write
+
+    python scripts/bench_doc_index.py [--files 100000] [--dirs 1000]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend.app.doc_index import DocIndex, newest
+
+
+def build_tree(root: str, files: int, dirs: int):
+    per_dir = max(1, files // dirs)
+    for d in range(dirs):
+        folder = os.path.join(root, f"Agent_{d:04d}")
+        os.makedirs(os.path.join(folder, "assets"))
+        for i in range(per_dir):
+            if i % 10 == 9:
+                path = os.path.join(folder, "assets", f"img_{d}_{i}.png")
+            else:
+                path = os.path.join(folder, f"Report_{d}_{i}_{i * 7919 % 99991:05x}.md")
+            with open(path, "w") as f:
+                f.write("x")
+
+
+def timed(fn, repeat: int = 5):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result
+
+
+def walk_exact(root, name):
+    for r, _, files in os.walk(root):
+        if name in files:
+            return os.path.join(r, name)
+
+
+def walk_prefix(root, stem):
+    found = []
+    for r, _, files in os.walk(root):
+        found.extend(os.path.join(r, f) for f in files if f.startswith(stem) and f.endswith(".md"))
+    return sorted(found, key=os.path.getmtime, reverse=True)
+
+
+def scandir_author(root, author):
+    entries = [e for e in os.scandir(os.path.join(root, author)) if e.is_file()]
+    return sorted(entries, key=lambda e: e.stat().st_mtime, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--dirs", type=int, default=1000)
+    opts = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_doc_index_")
+    try:
+        t0 = time.perf_counter()
+        build_tree(root, opts.files, opts.dirs)
+        print(f"tree: {opts.files} files in {opts.dirs} folders ({time.perf_counter() - t0:.1f} s to create)")
+
+        index = DocIndex(root)
+        t0 = time.perf_counter()
+        count = len(index)
+        print(f"build: {count} files indexed in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        d = opts.dirs // 2
+        per_dir = max(1, opts.files // opts.dirs)
+        i = per_dir // 2 - 1 if (per_dir // 2) % 10 == 0 else per_dir // 2
+        name = f"Report_{d}_{i}_{i * 7919 % 99991:05x}.md"
+        stem = f"Report_{d}_{i}_"
+        author = f"Agent_{d:04d}"
+
+        rows = [
+            ("exact name", lambda: walk_exact(root, name), lambda: index.find_by_name(name), 1),
+            ("stem prefix", lambda: walk_prefix(root, stem), lambda: newest(index.find_by_prefix(stem, ".md")), 1),
+            ("author", lambda: scandir_author(root, author), lambda: newest(index.in_dir(author)), 5),
+        ]
+        print(f"{'lookup':<12} {'tree walk':>12} {'index':>12}")
+        for label, old, new, repeat in rows:
+            old_ms, old_result = timed(old, repeat)
+            new_ms, new_result = timed(new, 50)
+            assert len(new_result or ()) == (1 if isinstance(old_result, str) else len(old_result or ())), label
+            print(f"{label:<12} {old_ms:>9.2f} ms {new_ms * 1000:>9.1f} us")
+
+        path = os.path.join(root, author, "New_Output.md")
+        with open(path, "w") as f:
+            f.write("new")
+        ms, _ = timed(lambda: index.note_write(path), 50)
+        print(f"write hook: {ms * 1000:.1f} us")
+
+        ms, _ = timed(index.refresh, 5)
+        print(f"reconcile (no change): {ms:.1f} ms")
+        external = os.path.join(root, f"Agent_{d + 1:04d}", "External.md")
+        with open(external, "w") as f:
+            f.write("external")
+        t0 = time.perf_counter()
+        rescanned = index.refresh()
+        print(f"reconcile (1 external write): {(time.perf_counter() - t0) * 1000:.1f} ms, {rescanned} folder(s) / file(s) updated")
+        assert index.find_by_name("External.md")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cold-start benchmark of the API process.
+
+Each run is a fresh interpreter against a new temporary SQLite database and
+measures:
+- skills: `import backend.app.skills` on its own (manifest vs. plugin imports)
+- import: `import backend.app.main` in total, including the above (no table
+  creation since it moved to the startup event)
+- startup: FastAPI startup event (tables, skill sync, worker threads)
+- first skill: first call of `list_files` (imports the plugin module if lazy)
+
+with the skill manifest (lazy handler import, the default) and with
+COMPANY_SKILLS_EAGER=1 (every plugin imported at package import, as before).
+
+    python scripts/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import backend.app.skills
+ts = time.perf_counter()
+from backend.app import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+t2 = time.perf_counter()
+client.__enter__()
+t3 = time.perf_counter()
+from backend.app.skills import SkillRegistry
+SkillRegistry.get_skill("list_files")["handler"]({}, {})
+t4 = time.perf_counter()
+print("BENCH " + json.dumps({"skills": ts - t0, "import": t1 - t0, "startup": t3 - t2, "first_skill": t4 - t3}))
+client.__exit__(None, None, None)
+'''
+
+
+def run_once(eager: bool) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        env = dict(os.environ, COMPANY_DB_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        env.pop("COMPANY_SKILLS_EAGER", None)
+        if eager:
+            env["COMPANY_SKILLS_EAGER"] = "1"
+        out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120)
+        line = next((l for l in out.stdout.splitlines() if l.startswith("BENCH ")), None)
+        if line is None:
+            raise RuntimeError(out.stderr[-2000:])
+        return json.loads(line[len("BENCH "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    run_once(False) # Warm the OS file cache and write the manifest
+    print(f"{'mode':<10}{'skills ms':>11}{'import ms':>12}{'startup ms':>12}{'first skill ms':>16}{'total ms':>11}")
+    for label, eager in (("eager", True), ("manifest", False)):
+        runs = [run_once(eager) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) * 1000 for k in ("skills", "import", "startup", "first_skill")}
+        total = med["import"] + med["startup"] + med["first_skill"]
+        print(f"{label:<10}{med['skills']:>11.1f}{med['import']:>12.1f}{med['startup']:>12.1f}{med['first_skill']:>16.1f}{total:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
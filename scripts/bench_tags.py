@@ -0,0 +1,119 @@
+"""
+Microbenchmarks for the tag tokenizer (backend/app/tags.py).
+
+Compares the single-pass tokenizer with the previous per-kind regexes on large
+synthetic responses, both on the whole text and on a token stream:
+
+- whole text: one `re` pattern per tag kind (five passes, as main.py,
+  SkillDispatcher and frontend_app.py did) vs. `tags.scan` (one pass).
+- stream: re-searching the growing buffer after every chunk vs. `TagStream`.
+
+    python scripts/bench_tags.py [--sizes 10000,100000,1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.app import tags
+
+LEGACY_PATTERNS = [
+    re.compile(r"\[\[CALL_SKILL:\s*(.*?)\]\]", re.DOTALL),
+    re.compile(r"\[\[LOG:(.*?)\]\]", re.DOTALL),
+    re.compile(r"\[\[EXECUTE_TASK:(.*?)\|(.*?)\]\]", re.DOTALL),
+    re.compile(r"\[\[CREATE_PROJECT:(.*?)\]\]", re.DOTALL),
+    re.compile(r"\[\[DELEGATE:\s*(.*?)\]\]", re.DOTALL),
+]
+SAMPLE_TAGS = [
+    '[[CALL_SKILL: read_file | {"file_path": "Reports/Weekly_Report.md"}]]',
+    "[[LOG: Meeting decided to ship the poster on Friday]]",
+    "[[EXECUTE_TASK: Weekly Report | Summarize this week's sales in a table]]",
+    "[[CREATE_PROJECT: Poster | True | 小张: write copy | 小美: draw the poster]]",
+    "[[DELEGATE: 小张 | content_creation | 写一份日报]]",
+]
+FILLER = [
+    "The quarterly numbers look solid and the team is on track. ",
+    "我们需要在周五之前完成海报设计，并与市场部确认文案。 ",
+    "- Item [1] shows a [draft] state; see [link](http://example.com). ",
+    "```json\n{\"a\": [1, 2, 3], \"b\": {\"c\": [4]}}\n```\n",
+]
+
+
+def make_response(size: int, tag_every: int = 2000, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    parts, length, next_tag = [], 0, tag_every
+    while length < size:
+        piece = rnd.choice(FILLER)
+        if length >= next_tag:
+            piece = rnd.choice(SAMPLE_TAGS) + "\n"
+            next_tag += tag_every
+        parts.append(piece)
+        length += len(piece)
+    return "".join(parts)
+
+
+def chunks_of(text: str, size: int = 16):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def legacy_scan(text: str) -> int:
+    return sum(1 for pattern in LEGACY_PATTERNS for _ in pattern.finditer(text))
+
+
+def tokenizer_scan(text: str) -> int:
+    return len(tags.scan(text))
+
+
+def legacy_stream(chunks) -> int:
+    # Naive streaming detection: look at the whole buffer after every chunk
+    buffer, seen = "", 0
+    for chunk in chunks:
+        buffer += chunk
+        seen = sum(1 for pattern in LEGACY_PATTERNS for _ in pattern.finditer(buffer))
+    return seen
+
+
+def tokenizer_stream(chunks) -> int:
+    stream = tags.TagStream()
+    return sum(len(stream.feed(chunk)) for chunk in chunks)
+
+
+def best_of(fn, arg, repeat: int) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Response sizes in characters")
+    parser.add_argument("--stream-max", type=int, default=100000, help="Largest size for the (quadratic) legacy stream run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<28}{'size':>10}{'tags':>7}{'legacy ms':>12}{'tokenizer ms':>14}{'speedup':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        text = make_response(size)
+        legacy_t, legacy_n = best_of(legacy_scan, text, args.repeat)
+        new_t, new_n = best_of(tokenizer_scan, text, args.repeat)
+        assert legacy_n == new_n, (legacy_n, new_n)
+        print(f"{'whole text':<28}{size:>10}{new_n:>7}{legacy_t * 1000:>12.2f}{new_t * 1000:>14.2f}{legacy_t / new_t:>8.1f}x")
+
+        chunks = chunks_of(text)
+        new_t, new_n = best_of(tokenizer_stream, chunks, args.repeat)
+        if size <= args.stream_max:
+            legacy_t, legacy_n = best_of(legacy_stream, chunks, 1)
+            assert legacy_n == new_n, (legacy_n, new_n)
+            print(f"{'stream (16-char chunks)':<28}{size:>10}{new_n:>7}{legacy_t * 1000:>12.2f}{new_t * 1000:>14.2f}{legacy_t / new_t:>8.1f}x")
+        else:
+            print(f"{'stream (16-char chunks)':<28}{size:>10}{new_n:>7}{'skipped':>12}{new_t * 1000:>14.2f}{'':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Local stand-in for an OpenAI-style Batch API (used by `backend/app/batch_runner.py`).
+
+    python scripts/fake_batch_server.py --port 8900 --delay 2
+
+Then set the `batch_base_url` setting to http://127.0.0.1:8900/v1.
+
+Implements the subset the runner uses:
+    POST /v1/files                  (multipart, purpose=batch)
+    POST /v1/batches                {input_file_id, endpoint, completion_window}
+    GET  /v1/batches/{id}           in_progress until --delay seconds passed, then completed
+    GET  /v1/files/{id}/content     JSONL output / error file
+
+Every request is answered with a canned completion that echoes its prompt.
+A prompt containing FAIL gets an error line, one containing SKILL gets an
+answer that asks for a skill, so the runner's fallback paths can be checked.
+Standard library only; state is in memory.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_files = {}   # file id -> bytes
+_batches = {} # batch id -> dict
+_lock = threading.Lock()
+DELAY_SECONDS = 2.0
+
+
+def _answer(custom_id: str, body: dict) -> dict:
+    prompt = next((m["content"] for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+    if "FAIL" in prompt:
+        return {
+            "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+            "custom_id": custom_id,
+            "response": {"status_code": 500, "body": {"error": {"message": "stand-in failure"}}},
+            "error": None
+        }
+    if "SKILL" in prompt:
+        content = "[[CALL_SKILL: read_file | {'file_path': 'notes.md'}]]"
+    else:
+        content = f"# Batch Output\n\n{prompt[:500]}"
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "body": {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]
+            }
+        },
+        "error": None
+    }
+
+
+def _finish(batch: dict):
+    """Produce the output/error files once the delay has passed."""
+    if batch["status"] != "in_progress" or time.time() - batch["created_at"] < DELAY_SECONDS:
+        return
+    outputs, errors = [], []
+    for line in _files[batch["input_file_id"]].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        result = _answer(request["custom_id"], request.get("body", {}))
+        (outputs if result["response"]["status_code"] == 200 else errors).append(json.dumps(result, ensure_ascii=False))
+    batch["output_file_id"] = f"file-{uuid.uuid4().hex[:12]}"
+    _files[batch["output_file_id"]] = "\n".join(outputs).encode("utf-8")
+    if errors:
+        batch["error_file_id"] = f"file-{uuid.uuid4().hex[:12]}"
+        _files[batch["error_file_id"]] = "\n".join(errors).encode("utf-8")
+    batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send(self, status: int, payload=None, raw: bytes = None):
+        data = raw if raw is not None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if raw is None else "application/jsonl")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/v1/files":
+            # Parse the multipart form with the email parser (no extra dependency)
+            head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=default_policy).parsebytes(head + self._body())
+            content = next((part.get_payload(decode=True) for part in message.iter_parts() if part.get_filename()), None)
+            if content is None:
+                return self._send(400, {"error": {"message": "file part missing"}})
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            with _lock:
+                _files[file_id] = content
+            return self._send(200, {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"})
+
+        if self.path == "/v1/batches":
+            request = json.loads(self._body() or b"{}")
+            if request.get("input_file_id") not in _files:
+                return self._send(400, {"error": {"message": "unknown input_file_id"}})
+            batch = {
+                "id": f"batch_{uuid.uuid4().hex[:12]}",
+                "object": "batch",
+                "endpoint": request.get("endpoint"),
+                "input_file_id": request["input_file_id"],
+                "completion_window": request.get("completion_window"),
+                "status": "in_progress",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": time.time(),
+                "metadata": request.get("metadata")
+            }
+            with _lock:
+                _batches[batch["id"]] = batch
+            return self._send(200, batch)
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        with _lock:
+            if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in _batches:
+                batch = _batches[parts[2]]
+                _finish(batch)
+                return self._send(200, batch)
+            if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in _files:
+                return self._send(200, raw=_files[parts[2]])
+        self._send(404, {"error": {"message": "not found"}})
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int, delay: float) -> ThreadingHTTPServer:
+    """Start the server on a background thread (for scripts); returns it."""
+    global DELAY_SECONDS
+    DELAY_SECONDS = delay
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI Batch API")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay", type=float, default=DELAY_SECONDS, help="Seconds until a batch completes")
+    args = parser.parse_args()
+    DELAY_SECONDS = args.delay
+    print(f"Stand-in batch API on http://127.0.0.1:{args.port}/v1 (batches complete after {args.delay}s)")
+    ThreadingHTTPServer(("127.0.0.1", args.port), Handler).serve_forever()
@@ -0,0 +1,98 @@
+"""
+Local check of the deferred batch mode (see backend/app/batch_runner.py).
+
+Runs the API in-process against a temporary SQLite database and the stand-in
+batch server (scripts/fake_batch_server.py), submits a batch of tasks with
+POST /tasks/batch and checks that:
+  - the worker pool never claims them,
+  - they are sent as one provider batch,
+  - outputs are written to Company Doc through the normal artifact path,
+  - failed requests and skill-needing answers go back to the queue as bulk.
+
+    python scripts/verify_batch_mode.py
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PORT = 8917
+TASKS = 12
+
+_tmp = tempfile.mkdtemp(prefix="verify_batch_")
+os.environ["COMPANY_DB_URL"] = f"sqlite:///{os.path.join(_tmp, 'batch.db')}"
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+import fake_batch_server
+from fastapi.testclient import TestClient
+from backend.app import main, crud, models
+from backend.app.database import SessionLocal
+
+AGENT_NAME = "Batch Verify Agent"
+
+
+def worker_stub(task_id: str):
+    """Stand-in for process_task_background: only requeued tasks may get here."""
+    db = SessionLocal()
+    try:
+        task = crud.get_task(db, task_id)
+        print(f"  worker ran {task.title} (priority {task.priority})")
+        crud.update_task_status(db, task_id, models.TaskStatus.COMPLETED, output="worker")
+    finally:
+        db.close()
+
+
+def main_check():
+    server = fake_batch_server.serve(PORT, delay=1.0)
+    main.process_task_background = worker_stub
+    try:
+        with TestClient(main.app) as client:
+            db = SessionLocal()
+            crud.set_setting(db, "api_key", "sk-local")
+            crud.set_setting(db, "batch_base_url", f"http://127.0.0.1:{PORT}/v1")
+            crud.set_setting(db, "batch_poll_seconds", "1")
+            db.close()
+
+            agent = client.post("/agents/", json={"name": AGENT_NAME, "role": "Writer", "system_prompt": "Write."}).json()
+            prompts = [f"Product description #{i}" for i in range(TASKS - 2)] + ["Please FAIL this one", "Needs a SKILL"]
+            tasks = client.post("/tasks/batch", json={"tasks": [
+                {"title": f"Desc {i}", "input_prompt": p, "agent_id": agent["id"]} for i, p in enumerate(prompts)
+            ]}).json()
+            assert all(t["priority"] == "batch" for t in tasks), tasks
+
+            time.sleep(1.5)
+            pending = [t for t in client.get("/tasks/").json() if t["status"] == "pending"]
+            assert len(pending) == TASKS, f"worker pool claimed batch tasks: {len(pending)} pending"
+
+            batches = client.post("/batches/flush").json()
+            assert len(batches) == 1 and batches[0]["request_count"] == TASKS, batches
+            batch_id = batches[0]["id"]
+
+            deadline = time.time() + 30
+            while time.time() < deadline:
+                batch = client.get(f"/batches/{batch_id}").json()
+                if batch["status"] in ("completed", "failed"):
+                    break
+                time.sleep(0.5)
+            print(f"  batch: {batch}")
+            assert batch["status"] == "completed", batch
+            assert batch["completed_count"] == TASKS - 2 and batch["requeued_count"] == 2, batch
+
+            time.sleep(3)
+            final = {t["title"]: t for t in client.get("/tasks/").json()}
+            assert all(t["status"] == "completed" for t in final.values()), final
+            out_dir = os.path.join(ROOT_DIR, "Company Doc", AGENT_NAME)
+            assert len(os.listdir(out_dir)) == TASKS - 2, os.listdir(out_dir)
+            print("OK: batch tasks skipped the worker pool, results were published, fallbacks ran as bulk")
+    finally:
+        server.shutdown()
+        shutil.rmtree(os.path.join(ROOT_DIR, "Company Doc", AGENT_NAME), ignore_errors=True)
+        shutil.rmtree(_tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_check()
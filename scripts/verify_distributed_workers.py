@@ -0,0 +1,124 @@
+"""
+Local check of distributed worker mode.
+
+Starts several `python -m backend.worker` processes against one temporary
+SQLite database and verifies that no task is claimed by two live workers.
+Also kills one worker mid-run to check that its tasks are reaped and
+finished by the others.
+
+    python scripts/verify_distributed_workers.py
+"""
+import os
+import sys
+import time
+import signal
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKERS = 3
+PROCESSES_PER_WORKER = 2
+AGENTS = 6
+TASKS = 30
+RUN_SECONDS = 0.3
+LEASE_SECONDS = 5
+
+
+def sleep_runner(task_id: str):
+    """Stand-in for process_task_background: records each execution."""
+    from backend.app.database import SessionLocal
+    from backend.app import crud, models
+
+    time.sleep(RUN_SECONDS)
+    with open(os.environ["VERIFY_EXEC_LOG"], "a", encoding="utf-8") as f:
+        f.write(f"{task_id} {os.getpid()}\n")
+
+    db = SessionLocal()
+    try:
+        crud.update_task_status(db, task_id, models.TaskStatus.COMPLETED, output="ok")
+    finally:
+        db.close()
+
+
+def _worker_env(db_url: str, exec_log: str):
+    env = dict(os.environ)
+    env["COMPANY_DB_URL"] = db_url
+    env["VERIFY_EXEC_LOG"] = exec_log
+    env["PYTHONPATH"] = os.pathsep.join([ROOT_DIR, SCRIPTS_DIR, env.get("PYTHONPATH", "")])
+    return env
+
+
+def verify_distributed_workers():
+    tmp_dir = tempfile.mkdtemp(prefix="company_workers_")
+    db_url = f"sqlite:///{os.path.join(tmp_dir, 'queue.db')}"
+    exec_log = os.path.join(tmp_dir, "executions.log")
+    os.environ["COMPANY_DB_URL"] = db_url
+    sys.path.insert(0, ROOT_DIR)
+
+    from backend.app.database import SessionLocal, engine
+    from backend.app import models, schemas, crud, task_queue
+
+    # Short leases so the killed worker is reaped quickly
+    task_queue.LEASE_SECONDS = LEASE_SECONDS
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    agents = crud.create_agents(db, [
+        schemas.AgentCreate(name=f"Worker Agent {i}", role="Tester", system_prompt="-")
+        for i in range(AGENTS)
+    ])
+    for i in range(TASKS):
+        crud.create_task(db, schemas.TaskCreate(
+            title=f"Task {i}", input_prompt=f"verify {i}", agent_id=agents[i % AGENTS].id
+        ))
+    db.close()
+    print(f"Seeded {TASKS} tasks for {AGENTS} agents in {db_url}")
+
+    cmd = [
+        sys.executable, "-c",
+        "import backend.app.task_queue as q; q.LEASE_SECONDS = %d; q.HEARTBEAT_SECONDS = 1; q.REAP_SECONDS = 2; "
+        "from backend.worker import main; main()" % LEASE_SECONDS,
+        "--processes", str(PROCESSES_PER_WORKER),
+        "--runner", "verify_distributed_workers:sleep_runner",
+    ]
+    env = _worker_env(db_url, exec_log)
+    workers = [subprocess.Popen(cmd + ["--worker-id", f"verify-{n}"], cwd=ROOT_DIR, env=env) for n in range(WORKERS)]
+
+    # Kill one worker hard after it started claiming
+    time.sleep(3)
+    workers[0].kill()
+    print("Killed worker verify-0 (its leases must be reaped).")
+
+    deadline = time.time() + 60
+    done = 0
+    while time.time() < deadline:
+        db = SessionLocal()
+        done = db.query(models.Task).filter(models.Task.status.in_(["completed", "failed"])).count()
+        db.close()
+        if done == TASKS:
+            break
+        time.sleep(1)
+
+    for w in workers[1:]:
+        w.send_signal(signal.SIGTERM)
+    for w in workers:
+        w.wait(timeout=30)
+
+    with open(exec_log, encoding="utf-8") as f:
+        executions = [line.split()[0] for line in f if line.strip()]
+    completed = {task_id for task_id in executions}
+    duplicates = len(executions) - len(completed)
+
+    print(f"Finished: {done}/{TASKS} | Executions logged: {len(executions)} | Duplicated: {duplicates}")
+    if done == TASKS and len(completed) == TASKS and duplicates <= PROCESSES_PER_WORKER:
+        # Tasks in flight on the killed worker may have logged before it died
+        # and are re-run after reaping; anything else would be a double claim.
+        print("SUCCESS: Every task finished; no task was claimed by two live workers.")
+    else:
+        print("FAILURE: Lost or double-executed tasks.")
+
+
+if __name__ == "__main__":
+    verify_distributed_workers()
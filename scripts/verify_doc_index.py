@@ -0,0 +1,78 @@
+"""
+Local check that the Company Doc file index (backend/app/doc_index.py) and
+the full-text index built on it (backend/app/doc_search.py) pick up changes
+made by other processes, on a temporary tree and search database:
+  - a file created out of process (its folder's mtime changes),
+  - an existing Markdown file appended to out of process (only the file's own
+    size / mtime change, as with Company_Log.md written by a task worker),
+  - a file deleted out of process,
+  - a file written out of process and then searched for, without any
+    explicit refresh (a worker child's output queried from the API process).
+
+    python scripts/verify_doc_index.py
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend.app.doc_index import DocIndex
+from backend.app.doc_search import DocSearch, QUERY_RECONCILE_SECONDS
+
+
+def out_of_process(code: str, *args):
+    subprocess.run([sys.executable, "-c", code, *args], check=True)
+
+
+def verify_doc_index():
+    tmp = tempfile.mkdtemp(prefix="verify_doc_index_")
+    root = os.path.join(tmp, "Company Doc")
+    log = os.path.join(root, "System", "Company_Log.md")
+    os.makedirs(os.path.dirname(log))
+    with open(log, "w", encoding="utf-8") as f:
+        f.write("# Company Log\n\n- first entry")
+    try:
+        index = DocIndex(root)
+        search = DocSearch(os.path.join(tmp, "search.db"), index)
+        assert search.search("first entry"), "initial file not indexed"
+        size = index.get("System/Company_Log.md").size
+
+        time.sleep(0.01) # Distinct mtime on coarse-grained filesystems
+        out_of_process("import sys; open(sys.argv[1], 'a', encoding='utf-8').write('\\n- appended 斑马独角兽 entry')", log)
+        index.refresh()
+        assert index.get("System/Company_Log.md").size > size, "in-place append not picked up"
+        hits = search.search("斑马独角兽")
+        assert hits and hits[0]["path"] == "System/Company_Log.md", hits
+        print(f"  append: size {size} -> {index.get('System/Company_Log.md').size}, found: {hits[0]['snippet']!r}")
+
+        new_file = os.path.join(root, "Agent A", "Plan.md")
+        out_of_process("import os, sys; os.makedirs(os.path.dirname(sys.argv[1])); open(sys.argv[1], 'w').write('# Plan\\nquarterly roadmap')", new_file)
+        index.refresh()
+        assert index.find_by_name("Plan.md"), "out-of-process file not indexed"
+        assert search.search("roadmap"), "out-of-process file not searchable"
+        print("  create: Agent A/Plan.md indexed and searchable")
+
+        out_of_process("import os, sys; os.remove(sys.argv[1])", new_file)
+        index.refresh()
+        assert not index.find_by_name("Plan.md"), "deleted file still indexed"
+        assert not search.search("roadmap"), "deleted file still searchable"
+        print("  delete: Agent A/Plan.md dropped from both indexes")
+
+        worker_file = os.path.join(root, "Agent B", "Output.md")
+        out_of_process("import os, sys; os.makedirs(os.path.dirname(sys.argv[1])); open(sys.argv[1], 'w').write('# Output\\nsupply chain forecast')", worker_file)
+        time.sleep(QUERY_RECONCILE_SECONDS)
+        hits = search.search("forecast")
+        assert hits and hits[0]["path"] == "Agent B/Output.md", hits
+        print("  query: Agent B/Output.md found by the next search, no refresh call")
+        print("OK: out-of-process creates, appends and deletes reach the file index and the search index")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    verify_doc_index()
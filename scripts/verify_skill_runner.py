@@ -0,0 +1,97 @@
+"""
+Local check of the out-of-process skill runner (see backend/app/skill_runner.py).
+
+Writes a throwaway plugin with isolated skills to a temporary directory, loads
+it like a dropped-in plugin and checks that:
+  - isolated calls return their results and run outside this process,
+  - a CPU hog is stopped at its CPU limit, a memory hog at its memory limit,
+    and the server process is unaffected,
+  - a call past its wall-clock timeout returns an error (and its worker is
+    replaced),
+  - workers are recycled after MAX_CALLS_PER_WORKER calls.
+
+    python scripts/verify_skill_runner.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import textwrap
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend.app import skill_runner
+from backend.app.skills.loader import load_skills_from_directory
+from backend.app.skills.registry import SkillRegistry
+
+PLUGIN = textwrap.dedent('''
+    import os
+    import time
+    from backend.app.skills.registry import SkillRegistry
+
+    @SkillRegistry.register(name="iso_pid", display_name="pid", description="pid", parameters={}, isolation="isolated")
+    def iso_pid(config, args):
+        print("plugin output goes to stderr, not the protocol")
+        return f"pid {os.getpid()} {args.get('v')} {config.get('agent_name')}"
+
+    @SkillRegistry.register(name="iso_cpu", display_name="cpu", description="cpu", parameters={},
+                            timeout=30, isolation="isolated", limits={"cpu_seconds": 1})
+    def iso_cpu(config, args):
+        n = 0
+        while True:
+            n += 1
+
+    @SkillRegistry.register(name="iso_sleep", display_name="sleep", description="sleep", parameters={},
+                            timeout=1, isolation="isolated")
+    def iso_sleep(config, args):
+        time.sleep(60)
+
+    @SkillRegistry.register(name="iso_mem", display_name="mem", description="mem", parameters={},
+                            isolation="isolated", limits={"memory_mb": 300})
+    def iso_mem(config, args):
+        hog = bytearray(1024 * 1024 * 1024)
+        return f"allocated {len(hog)}"
+''')
+
+
+def main_check():
+    tmp = tempfile.mkdtemp(prefix="verify_runner_")
+    skill_runner.MAX_CALLS_PER_WORKER = 3
+    try:
+        with open(os.path.join(tmp, "verify_isolated.py"), "w", encoding="utf-8") as f:
+            f.write(PLUGIN)
+        load_skills_from_directory(tmp)
+        call = lambda name, args: SkillRegistry.get_skill(name)["handler"]({"agent_name": "Verifier"}, args)
+
+        pids = []
+        for i in range(7):
+            result = call("iso_pid", {"v": i})
+            print(f"  {result}")
+            assert result.startswith("pid ") and result.endswith(f"{i} Verifier"), result
+            pids.append(int(result.split()[1]))
+        assert os.getpid() not in pids, "ran in-process"
+        assert len(set(pids)) >= 3, f"workers were not recycled: {pids}"
+
+        result = call("iso_cpu", {})
+        print(f"  cpu hog: {result}")
+        assert result.startswith("[ERROR") and "CPU limit" in result, result
+
+        result = call("iso_mem", {})
+        print(f"  memory hog: {result}")
+        assert result.startswith("[ERROR") and "memory limit" in result, result
+
+        result = call("iso_sleep", {})
+        print(f"  sleeper: {result}")
+        assert result.startswith("[ERROR") and "timed out" in result, result
+
+        result = call("iso_pid", {"v": "after"})
+        assert result.startswith("pid "), result
+        print("OK: isolated skills ran out of process, limits and timeouts held, workers were recycled")
+    finally:
+        skill_runner.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_check()